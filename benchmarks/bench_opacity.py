@@ -0,0 +1,74 @@
+"""透明度缩放基准测试：对比旧的 split()+point(lambda) 和 pixel_ops.scale_alpha
+
+用法: python benchmarks/bench_opacity.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops
+from component.pixel_ops import scale_alpha
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SIZES = {"4K": (3840, 2160), "8K": (7680, 4320)}
+OPACITY = 0.5
+REPEAT = 5
+
+
+def legacy_opacity(image, opacity):
+    """旧实现：拆分全部四个通道，再用 lambda 生成查找表"""
+    alpha = image.split()[3]
+    alpha = alpha.point(lambda p: p * opacity)
+    image.putalpha(alpha)
+    return image
+
+
+def numpy_opacity(image, opacity):
+    """NumPy 实现，仅作对比"""
+    pixels = np.array(image)
+    pixels[..., 3] = np.rint(pixels[..., 3] * opacity).astype(np.uint8)
+    return Image.fromarray(pixels, "RGBA")
+
+
+def make_logo(size):
+    """生成带渐变透明度的测试图片"""
+    gradient = Image.linear_gradient("L").resize(size)
+    flipped = gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    return Image.merge("RGBA", (gradient, flipped, gradient, flipped))
+
+
+def best_time(func, logo):
+    """返回 REPEAT 次中最快的一次耗时（秒）"""
+    best = None
+    for _ in range(REPEAT):
+        image = logo.copy()
+        start = time.perf_counter()
+        func(image, OPACITY)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench():
+    candidates = [("legacy", legacy_opacity), ("lut", scale_alpha)]
+    if np is not None:
+        candidates.append(("numpy", numpy_opacity))
+
+    print(f"透明度 {OPACITY}，每项重复 {REPEAT} 次（不含复制图片的时间）")
+    for label, size in SIZES.items():
+        logo = make_logo(size)
+        expected = legacy_opacity(logo.copy(), OPACITY)
+        for name, func in candidates:
+            result = func(logo.copy(), OPACITY)
+            assert not ImageChops.difference(result, expected).getbbox(), f"{name} 结果与旧实现不一致"
+            print(f"{label:>3} {name:>7}: {best_time(func, logo) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    bench()
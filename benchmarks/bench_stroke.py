@@ -0,0 +1,35 @@
+"""描边渲染基准测试：对比 offset（八方向偏移绘制）和 native（FreeType描边）两种方式
+
+用法: python benchmarks/bench_stroke.py [字体名或字体文件] [字号]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from component.render_engine import build_text_sprite
+from component.watermark_settings import DEFAULT_TEXT_SETTINGS
+
+STROKE_WIDTHS = [1, 2, 4, 8, 16]
+REPEAT = 20
+
+
+def bench(font_family, font_size):
+    print(f"字体: {font_family}  字号: {font_size}  每项重复 {REPEAT} 次")
+    print(f"{'描边宽度':>8} {'offset(ms)':>12} {'native(ms)':>12} {'加速比':>8}")
+    for stroke_width in STROKE_WIDTHS:
+        results = {}
+        for style in ("offset", "native"):
+            settings = dict(DEFAULT_TEXT_SETTINGS, text="Watermark 水印", font_family=font_family,
+                            font_size=font_size, stroke=1, stroke_width=stroke_width, stroke_style=style)
+            seconds = min(timeit.repeat(lambda: build_text_sprite(settings), number=REPEAT, repeat=3))
+            results[style] = seconds / REPEAT * 1000
+        print(f"{stroke_width:>8} {results['offset']:>12.2f} {results['native']:>12.2f} "
+              f"{results['offset'] / results['native']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    font_family = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TEXT_SETTINGS['font_family']
+    font_size = int(sys.argv[2]) if len(sys.argv) > 2 else 96
+    bench(font_family, font_size)
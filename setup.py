@@ -8,8 +8,13 @@ setup(
     install_requires=[
         'Pillow',   # Image processing library
     ],
+    extras_require={
+        'service': ['Flask'],     # watermark-app serve
+        'watch': ['watchdog'],    # watermark-app watch 使用文件系统事件（未安装时轮询目录）
+    },
     entry_points={
-        'gui_scripts': [
+        # 不带参数时打开图形界面，带子命令时（如 watermark-app batch ...）在命令行运行
+        'console_scripts': [
             'watermark-app=main:main',  # Assuming main function in main.py
         ],
     },
@@ -0,0 +1,159 @@
+"""公开的Python接口 - 在其他程序中直接调用水印功能，不依赖Tk
+
+    from component.api import watermark_stream
+
+    for result in watermark_stream(paths, template="版权", output_format="JPEG", ordered=False):
+        if result.error is None:
+            upload(result.index, result.data)
+
+输入可以是文件路径、图片数据（bytes）或PIL图片；输入按需读取，同时处理的数量有上限，
+因此可以处理任意长的输入序列而不会一次性占用大量内存。
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+from .watermark_settings import WatermarkSnapshot
+from .template_manager import TemplateManager, configure_storage
+from .template_bundle import TemplateBundle, install_bundle
+from .export_engine import ExportOptions, default_workers, create_export_pool
+from .export_pipeline import decode_image, render_for_export, encode_to_bytes
+from .render_engine import render_lock
+
+DEFAULT_TEMPLATE_FILE = "watermark_templates.json"
+
+# 单张图片的处理结果：image 为RGBA的PIL图片（未指定输出格式时），data 为编码后的数据（指定了输出格式时），
+# 出错时 error 为错误信息，image 和 data 都为 None
+WatermarkResult = namedtuple('WatermarkResult', ['index', 'source', 'image', 'data', 'error'])
+
+
+def resolve_template(template=None, templates_file=DEFAULT_TEMPLATE_FILE):
+    """把模板参数转换为设置快照
+
+    template 可以是 WatermarkSnapshot、模板格式的字典、模板库中的模板名称、
+    TemplateBundle（template_bundle.read_bundle 的结果，资源只保存在内存中），为 None 时使用默认设置。
+    """
+    if template is None:
+        return WatermarkSnapshot.from_dict({})
+    if isinstance(template, WatermarkSnapshot):
+        return template
+    if isinstance(template, TemplateBundle):
+        return WatermarkSnapshot.from_dict(install_bundle(template))
+    if isinstance(template, dict):
+        return WatermarkSnapshot.from_dict(template)
+    # 模板库中的模板可能引用模板库资源目录中的水印图片和字体
+    configure_storage(templates_file)
+    data = TemplateManager(templates_file).load_template(template)
+    if data is None:
+        raise KeyError(f"找不到模板: {template}")
+    return WatermarkSnapshot.from_dict(data)
+
+
+def _make_options(output_format, quality, scale_percent):
+    if output_format is not None:
+        output_format = output_format.upper()
+        if output_format not in ("PNG", "JPEG"):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+    return ExportOptions(output_dir=None, output_format=output_format or "PNG",
+                         quality=quality, scale_percent=scale_percent)
+
+
+def _watermark_one(source, snapshot, options, encode):
+    """处理一张图片，返回PIL图片或编码后的数据"""
+    if isinstance(source, Image.Image):
+        # 不修改调用方的图片
+        image = source.copy() if source.mode == 'RGBA' else source.convert("RGBA")
+    else:
+        if isinstance(source, os.PathLike):
+            source = os.fspath(source)
+        image = decode_image(source)
+    # 线程池中的其他线程共用同一批字体对象，绘制水印时互斥
+    image = render_for_export(image, snapshot, options, render_lock)
+    return encode_to_bytes(image, options) if encode else image
+
+
+def _run_one(index, source, snapshot, options, encode):
+    """在工作线程/进程中执行，异常转换为错误信息"""
+    try:
+        output = _watermark_one(source, snapshot, options, encode)
+    except Exception as e:
+        return index, None, str(e)
+    return index, output, None
+
+
+def watermark_image(source, template=None, output_format=None, quality=95, scale_percent=100,
+                    templates_file=DEFAULT_TEMPLATE_FILE):
+    """给单张图片加水印，返回RGBA的PIL图片；指定 output_format（PNG/JPEG）时返回编码后的bytes
+
+    出错时抛出异常。
+    """
+    snapshot = resolve_template(template, templates_file)
+    options = _make_options(output_format, quality, scale_percent)
+    return _watermark_one(source, snapshot, options, output_format is not None)
+
+
+def watermark_stream(sources, template=None, output_format=None, quality=95, scale_percent=100,
+                     workers=None, max_in_flight=None, ordered=True, use_processes=False,
+                     templates_file=DEFAULT_TEMPLATE_FILE, mp_context=None):
+    """逐个处理 sources 并在完成时产出 WatermarkResult 的生成器
+
+    sources 可以是任意可迭代对象（包括生成器），元素为路径、bytes 或PIL图片，只在需要时才读取下一个。
+    最多同时有 max_in_flight 张图片在处理或等待产出（默认为 workers 的2倍）。
+    ordered 为 False 时按完成顺序产出，用 result.index 对应输入的序号。
+    use_processes 为 True 时使用进程池（适合大量CPU密集的处理，输入和结果需要在进程间复制），
+    默认使用线程池（Pillow 在解码、缩放和编码时会释放GIL；共享的字体对象不能并发使用，绘制水印这一步依次进行）。
+    工作进程启动时获得渲染计划和资源目录，以及模板引用的资源内容（模板包中的资源可能只在当前进程的内存中）；
+    mp_context 为进程池使用的 multiprocessing 上下文，None 时使用默认的启动方式。
+    单张图片出错不会中断整个流，错误记录在 result.error 中。
+    提前结束迭代时尚未开始的图片会被取消。
+    """
+    snapshot = resolve_template(template, templates_file)
+    options = _make_options(output_format, quality, scale_percent)
+    encode = output_format is not None
+    workers = workers or default_workers()
+    max_in_flight = max(1, max_in_flight or workers * 2)
+
+    if use_processes:
+        executor = create_export_pool(snapshot, workers, include_assets=True, mp_context=mp_context)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    source_iter = enumerate(iter(sources))
+    pending = {}    # future -> (序号, 输入)
+    finished = {}   # 按顺序产出时已完成但还没轮到的结果 {序号: 结果}
+    next_index = 0
+    exhausted = False
+    try:
+        while True:
+            # 保持 处理中 + 等待产出 的数量不超过上限
+            while not exhausted and len(pending) + len(finished) < max_in_flight:
+                try:
+                    index, source = next(source_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(_run_one, index, source, snapshot, options, encode)
+                pending[future] = (index, source)
+
+            if ordered and next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+                continue
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, source = pending.pop(future)
+                _, output, error = future.result()
+                result = WatermarkResult(index, source,
+                                         None if encode or error else output,
+                                         output if encode and not error else None,
+                                         error)
+                if ordered:
+                    finished[index] = result
+                else:
+                    yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,107 @@
+"""内容寻址的资源存储 - 水印图片和字体文件按内容的SHA-256保存，设置中用 asset:<哈希> 代替文件路径
+
+同一份内容在任何机器上都对应同一个引用，引用的内容永远不会变，读取一次后可以一直缓存。
+设置了目录时资源同时保存为 <目录>/<哈希> 文件，其他进程（包括其他机器上的工作进程）可以从那里读取。
+"""
+import io
+import os
+import hashlib
+from .lru_cache import LRUCache
+
+ASSET_SCHEME = "asset:"
+
+
+def is_asset_ref(value):
+    """是否为资源引用（而不是文件路径）"""
+    return isinstance(value, str) and value.startswith(ASSET_SCHEME)
+
+
+def bytes_digest(data):
+    """资源内容的SHA-256（十六进制）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def asset_ref(data):
+    """资源内容对应的引用"""
+    return ASSET_SCHEME + bytes_digest(data)
+
+
+def source_signature(path):
+    """水印图片或字体的版本标识：文件为 [修改时间(ns), 大小]，资源引用的内容不会变，直接使用引用本身
+
+    文件不存在时抛出 OSError。
+    """
+    if is_asset_ref(path):
+        return path
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class AssetStore:
+    """资源存储，内存中按字节数限制大小，directory 不为 None 时同时读写磁盘"""
+    def __init__(self, directory=None, max_bytes=128 * 1024 * 1024):
+        self.directory = directory
+        self._cache = LRUCache(max_entries=None, max_bytes=max_bytes, sizeof=len)
+
+    def set_directory(self, directory):
+        self.directory = directory
+
+    def _path(self, ref):
+        return os.path.join(self.directory, ref[len(ASSET_SCHEME):])
+
+    def add(self, data):
+        """保存资源内容，返回引用"""
+        ref = asset_ref(data)
+        self._cache.put(ref, data)
+        if self.directory is not None:
+            path = self._path(ref)
+            if not os.path.exists(path):
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+        return ref
+
+    def remember(self, data):
+        """只放入内存（例如主进程传给工作进程的资源），不写入目录，返回引用"""
+        ref = asset_ref(data)
+        self._cache.put(ref, data)
+        return ref
+
+    def add_file(self, path):
+        """保存文件内容，返回引用"""
+        with open(path, 'rb') as f:
+            return self.add(f.read())
+
+    def get(self, ref):
+        """读取资源内容，找不到时抛出 KeyError"""
+        data = self._cache.get(ref)
+        if data is not None:
+            return data
+        if self.directory is not None:
+            try:
+                with open(self._path(ref), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            # 文件内容与引用不符（例如写了一半）时当作不存在
+            if data is not None and asset_ref(data) == ref:
+                self._cache.put(ref, data)
+                return data
+        raise KeyError(f"找不到资源: {ref}")
+
+    def open(self, ref):
+        """以文件对象的形式读取资源（可直接传给 Image.open / ImageFont.truetype）"""
+        return io.BytesIO(self.get(ref))
+
+    def __contains__(self, ref):
+        try:
+            self.get(ref)
+        except KeyError:
+            return False
+        return True
+
+
+# 创建全局资源存储实例，template_manager.configure_storage 会把目录设置为模板库旁边的 .assets 目录
+global_asset_store = AssetStore()
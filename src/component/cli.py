@@ -0,0 +1,377 @@
+"""命令行模式 - 不导入Tk，可以在没有显示器的服务器或定时任务中批量添加水印
+
+用法示例:
+    watermark-app batch photos/ "raw/**/*.jpg" -o out/ --template 版权 --format JPEG --jobs 4
+    watermark-app resume out/
+    watermark-app watch incoming/ -o watermarked/ --template 版权
+    watermark-app shard create /shared/job1 /shared/archive -r -o /shared/out && watermark-app shard work /shared/job1
+    watermark-app serve --port 5000 --allow-path /data/uploads
+    watermark-app template export 版权 -o 版权.wmbundle --embed-font
+"""
+import os
+import sys
+import glob
+import time
+import json
+import argparse
+from .watermark_settings import WatermarkSnapshot
+from .template_manager import TemplateManager, configure_storage
+from .template_bundle import BUNDLE_EXTENSION, read_bundle, install_bundle
+from .export_engine import (ExportOptions, export_batch, resume_export, default_workers, SUPPORTED_FORMATS,
+                            NAMING_ORIGINAL, NAMING_PREFIX, NAMING_SUFFIX)
+from .export_pipeline import DEFAULT_MEMORY_LIMIT
+from .export_job import format_duration
+from .shard_jobs import (create_job, run_worker, ShardJob, JOB_FILE, DEFAULT_SHARD_SIZE,
+                         DEFAULT_LEASE_TIMEOUT)
+from .hot_folder import HotFolder, DEFAULT_SETTLE_TIME, DEFAULT_POLL_INTERVAL
+
+DEFAULT_TEMPLATE_FILE = "watermark_templates.json"
+
+# 命令行中的命名规则名称
+NAMING_CHOICES = {
+    'original': NAMING_ORIGINAL,
+    'prefix': NAMING_PREFIX,
+    'suffix': NAMING_SUFFIX,
+}
+
+
+class CLIError(Exception):
+    """命令行参数或输入有误"""
+
+
+def expand_inputs(inputs, recursive=False):
+    """把文件、文件夹和通配符展开为按名称排序、去重后的图片文件列表"""
+    found = []
+    seen = set()
+
+    def add(path):
+        key = os.path.abspath(path)
+        if key not in seen and path.lower().endswith(SUPPORTED_FORMATS):
+            seen.add(key)
+            found.append(path)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for dirpath, _, filenames in os.walk(item):
+                    for filename in sorted(filenames):
+                        add(os.path.join(dirpath, filename))
+            else:
+                for filename in sorted(os.listdir(item)):
+                    path = os.path.join(item, filename)
+                    if os.path.isfile(path):
+                        add(path)
+        elif os.path.isfile(item):
+            add(item)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                print(f"警告: 没有匹配的文件: {item}", file=sys.stderr)
+            for path in matches:
+                if os.path.isfile(path):
+                    add(path)
+    return found
+
+
+def load_snapshot(template_name=None, template_file=None, templates_file=DEFAULT_TEMPLATE_FILE):
+    """按模板名称或模板文件得到设置快照，都未指定时使用默认设置
+
+    template_file 可以是单个模板，也可以是与 watermark_templates.json 相同格式的模板集合
+    （此时用 template_name 选择，集合中只有一个模板时可以省略），或者模板包（.wmbundle）。
+    """
+    if template_file and template_file.lower().endswith(BUNDLE_EXTENSION):
+        # 模板包中的资源保存到模板库的资源目录，导出进程从那里读取
+        configure_storage(templates_file)
+        try:
+            return WatermarkSnapshot.from_dict(install_bundle(read_bundle(template_file)))
+        except (OSError, ValueError) as e:
+            raise CLIError(f"读取模板包失败: {e}")
+    if template_file:
+        try:
+            with open(template_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            raise CLIError(f"读取模板文件失败: {e}")
+        if 'watermark_type' in data:
+            return WatermarkSnapshot.from_dict(data)
+        if template_name is None:
+            if len(data) != 1:
+                raise CLIError(f"模板文件中有 {len(data)} 个模板，请用 --template 指定名称")
+            template_name = next(iter(data))
+        if template_name not in data:
+            raise CLIError(f"模板文件中没有模板: {template_name}")
+        return WatermarkSnapshot.from_dict(data[template_name])
+
+    if template_name:
+        configure_storage(templates_file)
+        template = TemplateManager(templates_file).load_template(template_name)
+        if template is None:
+            raise CLIError(f"找不到模板 '{template_name}'（{templates_file}）")
+        return WatermarkSnapshot.from_dict(template)
+
+    return WatermarkSnapshot.from_dict({})
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(prog="watermark-app", description="批量给图片添加水印（不带参数运行时打开图形界面）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="批量导出")
+    batch.add_argument('inputs', nargs='+', help="图片文件、文件夹或通配符（如 'photos/**/*.jpg'）")
+    batch.add_argument('-o', '--output', required=True, help="导出文件夹")
+    batch.add_argument('-r', '--recursive', action='store_true', help="包含文件夹中的子文件夹")
+    add_output_arguments(batch)
+    batch.add_argument('--incremental', action='store_true', help="跳过源文件和设置都没有变化的图片")
+    add_run_arguments(batch)
+
+    resume = subparsers.add_parser('resume', help="继续导出文件夹中未完成的导出")
+    resume.add_argument('output', help="导出文件夹")
+    resume.add_argument('--skip-failed', action='store_true', help="不重试上次失败的图片")
+    add_run_arguments(resume)
+
+    watch = subparsers.add_parser('watch', help="监视文件夹，自动给放入的图片加水印")
+    watch.add_argument('inputs', nargs='+', help="要监视的文件夹")
+    watch.add_argument('-o', '--output', required=True, help="导出文件夹（保持输入文件夹的子文件夹结构）")
+    watch.add_argument('--no-recursive', action='store_true', help="不监视子文件夹")
+    add_output_arguments(watch)
+    watch.add_argument('--settle', type=float, default=DEFAULT_SETTLE_TIME,
+                       help="文件保持多少秒不变后才处理（默认 %(default)s）")
+    watch.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL,
+                       help="轮询间隔（秒，未安装 watchdog 或使用 --no-events 时）")
+    watch.add_argument('--no-events', action='store_true', help="不使用文件系统事件，总是轮询")
+    add_run_arguments(watch)
+
+    shard = subparsers.add_parser('shard', help="多机分片任务（任务目录需放在共享存储上）")
+    shard_commands = shard.add_subparsers(dest='shard_command', required=True)
+    shard_create = shard_commands.add_parser('create', help="创建分片任务")
+    shard_create.add_argument('job_dir', help="任务目录")
+    shard_create.add_argument('inputs', nargs='+', help="图片文件、文件夹或通配符")
+    shard_create.add_argument('-o', '--output', required=True, help="导出文件夹（所有工作机器都能访问的路径）")
+    shard_create.add_argument('-r', '--recursive', action='store_true', help="包含文件夹中的子文件夹")
+    shard_create.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="每个分片的图片数")
+    add_output_arguments(shard_create)
+    shard_work = shard_commands.add_parser('work', help="领取并处理分片，直到任务完成")
+    shard_work.add_argument('job_dir', help="任务目录")
+    shard_work.add_argument('--worker-id', help="工作进程标识（默认 主机名-进程号）")
+    shard_work.add_argument('--lease-timeout', type=float, default=DEFAULT_LEASE_TIMEOUT,
+                            help="租约超时时间（秒），超时未续约的分片会被其他进程接手")
+    add_run_arguments(shard_work)
+    shard_status = shard_commands.add_parser('status', help="查看任务进度")
+    shard_status.add_argument('job_dir', help="任务目录")
+
+    template = subparsers.add_parser('template', help="导出/导入模板包（包含水印图片，可在其他机器上使用）")
+    template_commands = template.add_subparsers(dest='template_command', required=True)
+    template_export = template_commands.add_parser('export', help="把模板导出为模板包")
+    template_export.add_argument('name', help="模板名称")
+    template_export.add_argument('-o', '--output', help=f"模板包文件（默认 <模板名称>{BUNDLE_EXTENSION}）")
+    template_export.add_argument('--embed-font', action='store_true', help="同时嵌入文本水印使用的字体文件")
+    template_export.add_argument('--templates', default=DEFAULT_TEMPLATE_FILE, help="模板库文件")
+    template_import = template_commands.add_parser('import', help="把模板包导入模板库")
+    template_import.add_argument('bundle', help="模板包文件")
+    template_import.add_argument('--name', help="导入后的模板名称（默认使用包中的名称）")
+    template_import.add_argument('--templates', default=DEFAULT_TEMPLATE_FILE, help="模板库文件")
+
+    serve = subparsers.add_parser('serve', help="启动HTTP水印服务")
+    serve.add_argument('--host', default="127.0.0.1", help="监听地址（默认只允许本机访问）")
+    serve.add_argument('--port', type=int, default=5000, help="监听端口")
+    serve.add_argument('--templates', default=DEFAULT_TEMPLATE_FILE, help="模板库文件")
+    serve.add_argument('-j', '--jobs', type=int, default=default_workers(), help="工作进程数（默认CPU核数）")
+    serve.add_argument('--max-pending', type=int, default=32, help="同时处理和排队的请求数上限")
+    serve.add_argument('--allow-path', action='append', default=[], metavar='DIR',
+                       help="允许通过 path 参数读取的服务器目录，可以多次指定")
+    return parser
+
+
+def add_output_arguments(parser):
+    """模板和导出选项参数"""
+    parser.add_argument('-t', '--template', help="模板名称")
+    parser.add_argument('--template-file', help="模板文件（单个模板或模板集合的JSON，或 .wmbundle 模板包）")
+    parser.add_argument('--templates', default=DEFAULT_TEMPLATE_FILE,
+                        help=f"按名称查找模板时使用的模板库（默认 {DEFAULT_TEMPLATE_FILE}）")
+    parser.add_argument('-f', '--format', choices=["PNG", "JPEG"], default="PNG", type=str.upper, help="输出格式")
+    parser.add_argument('-q', '--quality', type=int, default=95, help="JPEG质量 1-100")
+    parser.add_argument('-s', '--scale', type=int, default=100, help="缩放比例(%%)")
+    parser.add_argument('-n', '--naming', choices=sorted(NAMING_CHOICES), default='suffix', help="命名规则")
+    parser.add_argument('--text', default="_watermarked", help="命名规则使用的前缀/后缀")
+
+
+def build_options(args, output_dir):
+    """检查并创建导出选项"""
+    if not 1 <= args.quality <= 100:
+        raise CLIError("JPEG质量应在 1-100 之间")
+    if args.scale <= 0:
+        raise CLIError("缩放比例必须大于0")
+    return ExportOptions(
+        output_dir=output_dir,
+        output_format=args.format,
+        quality=args.quality,
+        scale_percent=args.scale,
+        naming_rule=NAMING_CHOICES[args.naming],
+        custom_text=args.text
+    )
+
+
+def add_run_arguments(parser):
+    """导出执行相关的通用参数"""
+    parser.add_argument('-j', '--jobs', type=int, default=default_workers(), help="并行进程数（默认CPU核数）")
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+                        help="同时处理的图片的内存上限(MB)")
+    parser.add_argument('--quiet', action='store_true', help="不输出每张图片的进度")
+
+
+def progress_printer(quiet):
+    """返回打印每张图片进度的回调"""
+    def report(done, total, task, error):
+        if error is not None:
+            print(f"[{done}/{total}] 失败 {task.source_path}: {error}", file=sys.stderr)
+        elif not quiet:
+            print(f"[{done}/{total}] {os.path.basename(task.output_path)}")
+    return report
+
+
+def print_summary(result, elapsed):
+    """输出导出结果统计"""
+    print(f"成功 {len(result.succeeded)} 张，失败 {len(result.failed)} 张，"
+          f"跳过 {len(result.skipped)} 张，用时 {format_duration(elapsed)}")
+
+
+def run_batch(args):
+    """batch 子命令"""
+    # 使用绝对路径，任务日志和导出清单在其他工作目录中也能使用
+    source_paths = [os.path.abspath(path) for path in expand_inputs(args.inputs, args.recursive)]
+    if not source_paths:
+        raise CLIError("没有找到可处理的图片")
+    output_dir = os.path.abspath(args.output)
+    options = build_options(args, output_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+    # 与图形界面相同，禁止导出到原文件夹
+    source_dirs = {os.path.dirname(path) for path in source_paths}
+    if output_dir in source_dirs:
+        raise CLIError("为了安全起见，禁止导出到原文件夹")
+
+    snapshot = load_snapshot(args.template, args.template_file, args.templates)
+    return export_batch(source_paths, snapshot, options, workers=args.jobs,
+                        progress_callback=progress_printer(args.quiet),
+                        memory_limit=args.memory_limit * 1024 * 1024, incremental=args.incremental)
+
+
+def run_resume(args):
+    """resume 子命令"""
+    try:
+        return resume_export(args.output, workers=args.jobs, progress_callback=progress_printer(args.quiet),
+                             memory_limit=args.memory_limit * 1024 * 1024,
+                             retry_failed=not args.skip_failed)
+    except FileNotFoundError as e:
+        raise CLIError(str(e))
+
+
+def run_watch(args):
+    """watch 子命令（阻塞直到 Ctrl+C）"""
+    options = build_options(args, args.output)
+    snapshot = load_snapshot(args.template, args.template_file, args.templates)
+    try:
+        hot_folder = HotFolder(args.inputs, snapshot, options, workers=args.jobs,
+                               recursive=not args.no_recursive, settle_time=args.settle,
+                               poll_interval=args.poll, use_events=not args.no_events,
+                               memory_limit=args.memory_limit * 1024 * 1024)
+    except (FileNotFoundError, ValueError) as e:
+        raise CLIError(str(e))
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        hot_folder.run()
+    except KeyboardInterrupt:
+        hot_folder.stop()
+    return None
+
+
+def run_shard(args):
+    """shard 子命令：create / work / status"""
+    if args.shard_command == 'create':
+        source_paths = expand_inputs(args.inputs, args.recursive)
+        if not source_paths:
+            raise CLIError("没有找到可处理的图片")
+        if args.shard_size <= 0:
+            raise CLIError("分片大小必须大于0")
+        options = build_options(args, os.path.abspath(args.output))
+        snapshot = load_snapshot(args.template, args.template_file, args.templates)
+        try:
+            shard_count = create_job(args.job_dir, source_paths, snapshot, options, args.shard_size)
+        except FileExistsError as e:
+            raise CLIError(str(e))
+        except OSError as e:
+            raise CLIError(f"读取水印图片失败: {e}")
+        print(f"已创建任务: {len(source_paths)} 张图片，{shard_count} 个分片")
+        return None
+
+    if not os.path.exists(os.path.join(args.job_dir, JOB_FILE)):
+        raise CLIError(f"任务目录中没有任务: {args.job_dir}")
+    if args.shard_command == 'work':
+        completed = run_worker(args.job_dir, args.worker_id, args.jobs, args.lease_timeout,
+                               args.memory_limit * 1024 * 1024)
+        print(f"本进程完成 {completed} 个分片")
+        return ShardJob(args.job_dir).collect_results()
+
+    status = ShardJob(args.job_dir).status()
+    print(f"分片: 完成 {status['done']}/{status['shards']}，处理中 {status['leased']}，"
+          f"租约过期 {status['expired']}，等待 {status['pending']}")
+    print(f"图片: 成功 {status['succeeded']}，失败 {status['failed']}，共 {status['images']}")
+    return None
+
+
+def run_template(args):
+    """template 子命令：export / import"""
+    configure_storage(args.templates)
+    manager = TemplateManager(args.templates)
+    if args.template_command == 'export':
+        output = args.output or args.name + BUNDLE_EXTENSION
+        try:
+            manager.export_bundle(args.name, output, args.embed_font)
+        except KeyError:
+            raise CLIError(f"找不到模板 '{args.name}'（{args.templates}）")
+        except OSError as e:
+            raise CLIError(f"导出模板包失败: {e}")
+        print(f"已导出模板包: {output}")
+        return None
+
+    try:
+        name = manager.import_bundle(args.bundle, args.name)
+    except (OSError, ValueError) as e:
+        raise CLIError(f"导入模板包失败: {e}")
+    print(f"已导入模板: {name}")
+    return None
+
+
+def run_serve(args):
+    """serve 子命令（阻塞直到服务停止）"""
+    # Flask 只在启动服务时才需要
+    from .http_service import serve
+    serve(args.host, args.port, templates_file=args.templates, workers=args.jobs,
+          max_pending=args.max_pending, allowed_roots=args.allow_path)
+    return None
+
+
+COMMANDS = {
+    'batch': run_batch,
+    'resume': run_resume,
+    'watch': run_watch,
+    'shard': run_shard,
+    'template': run_template,
+    'serve': run_serve,
+}
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码：0 全部成功，1 有图片失败，2 参数或输入错误"""
+    args = build_parser().parse_args(argv)
+    start = time.monotonic()
+    try:
+        result = COMMANDS[args.command](args)
+    except CLIError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    if result is None:
+        return 0
+    print_summary(result, time.monotonic() - start)
+    return 1 if result.failed else 0
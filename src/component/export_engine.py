@@ -0,0 +1,321 @@
+"""批量导出引擎 - 不依赖Tk，把每张图片的 解码 -> 加水印 -> 缩放 -> 编码 分发到多个进程或进程内流水线"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .export_pipeline import (MemoryBudget, DEFAULT_MEMORY_LIMIT, estimate_export_bytes,
+                              decode_image, render_for_export, encode_image, run_pipeline, is_temp_output)
+from .export_journal import ExportJournal, has_journal
+from .export_manifest import ExportManifest, settings_digest, naming_digest, options_digest
+from .render_plan import global_plan_cache, cache_directories, set_cache_directories
+from .asset_store import global_asset_store, is_asset_ref
+
+# 命名规则
+NAMING_ORIGINAL = "原文件名"
+NAMING_PREFIX = "添加前缀"
+NAMING_SUFFIX = "添加后缀"
+NAMING_RULES = [NAMING_ORIGINAL, NAMING_PREFIX, NAMING_SUFFIX]
+
+OUTPUT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg"}
+# 支持导入的图片格式
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+
+_ExportOptionsFields = namedtuple('_ExportOptionsFields', [
+    'output_dir', 'output_format', 'quality', 'scale_percent', 'naming_rule', 'custom_text'
+])
+
+
+class ExportOptions(_ExportOptionsFields):
+    """导出选项（不可变，可传给工作进程）"""
+    __slots__ = ()
+
+    def __new__(cls, output_dir, output_format="PNG", quality=95, scale_percent=100,
+                naming_rule=NAMING_SUFFIX, custom_text="_watermarked"):
+        return super().__new__(cls, output_dir, output_format, quality, scale_percent,
+                               naming_rule, (custom_text or "").strip())
+
+
+# 单张图片的导出任务
+ExportTask = namedtuple('ExportTask', ['index', 'source_path', 'output_path'])
+
+# 批量导出结果：succeeded 为 [(源文件, 输出文件)]，failed 为 [(源文件, 错误信息)]，
+# cancelled 表示是否被中途取消（未处理的图片不计入 succeeded/failed），
+# skipped 为增量导出时因没有变化而跳过的 [(源文件, 输出文件)]
+ExportResult = namedtuple('ExportResult', ['succeeded', 'failed', 'cancelled', 'skipped'], defaults=((),))
+
+
+def default_workers():
+    """默认的工作进程数"""
+    return os.cpu_count() or 1
+
+
+def build_output_name(source_path, options, counter=0):
+    """根据命名规则生成输出文件名，counter > 0 时添加数字后缀避免重名"""
+    basename = os.path.splitext(os.path.basename(source_path))[0]
+    ext = OUTPUT_EXTENSIONS.get(options.output_format, ".jpg")
+    number = f"_{counter}" if counter else ""
+    custom_text = options.custom_text
+
+    if options.naming_rule == NAMING_ORIGINAL:
+        return f"{basename}{number}{ext}"
+    elif options.naming_rule == NAMING_PREFIX and custom_text:
+        return f"{custom_text}{basename}{number}{ext}"
+    elif options.naming_rule == NAMING_SUFFIX and custom_text:
+        return f"{basename}{custom_text}{number}{ext}"
+    else:
+        return f"{basename}_watermarked{number}{ext}"
+
+
+def plan_output_paths(source_paths, options, manifest=None):
+    """按输入顺序预先分配所有输出路径
+
+    已存在的文件和本批次中先分配的路径都视为占用，冲突时依次添加 _1、_2 ...，
+    因此结果与并行处理的完成顺序无关。
+    提供 manifest 时，之前导出过的源文件沿用清单中的输出文件名，覆盖旧的输出。
+    """
+    naming = naming_digest(options) if manifest is not None else None
+    reserved = set()
+    output_paths = []
+    for source_path in source_paths:
+        if manifest is not None:
+            output_path = manifest.reusable_output(source_path, naming)
+            if output_path is not None and output_path not in reserved:
+                reserved.add(output_path)
+                output_paths.append(output_path)
+                continue
+        counter = 0
+        while True:
+            output_path = os.path.join(options.output_dir, build_output_name(source_path, options, counter))
+            if output_path not in reserved and not os.path.exists(output_path):
+                break
+            counter += 1
+        reserved.add(output_path)
+        output_paths.append(output_path)
+    return output_paths
+
+
+def export_image(source_path, output_path, snapshot, options):
+    """处理单张图片并保存到 output_path，出错时抛出异常"""
+    image = decode_image(source_path)
+    image = render_for_export(image, snapshot, options)
+    return encode_image(image, output_path, options)
+
+
+def _init_worker(snapshot, directories, assets=None):
+    """导出进程启动时读取渲染计划，第一张图片不必再查找字体、栅格化文本或解码水印图片
+
+    assets 为主进程中只保存在内存里的资源 {引用: 内容}（如直接使用的模板包），工作进程无法从目录读取它们。
+    """
+    for data in (assets or {}).values():
+        global_asset_store.remember(data)
+    set_cache_directories(directories)
+    global_plan_cache.preload(snapshot)
+
+
+def snapshot_assets(snapshot):
+    """快照引用的、当前进程能读到的资源 {引用: 内容}，用于传给工作进程"""
+    refs = [snapshot.image_settings['image_path'], snapshot.text_settings['font_family']]
+    assets = {}
+    for ref in refs:
+        if is_asset_ref(ref) and ref in global_asset_store:
+            assets[ref] = global_asset_store.get(ref)
+    return assets
+
+
+def create_export_pool(snapshot, workers=None, include_assets=False, mp_context=None):
+    """创建已预加载 snapshot 渲染计划的导出进程池，供需要在多批导出之间复用进程的调用方使用
+
+    include_assets 为 True 时把快照引用的资源内容一起传给工作进程，资源只在内存中（没有写入资源目录）时也能渲染。
+    mp_context 为 multiprocessing 的上下文（如 get_context("spawn")），None 时使用默认的启动方式。
+    """
+    assets = snapshot_assets(snapshot) if include_assets else None
+    return ProcessPoolExecutor(max_workers=workers or default_workers(), mp_context=mp_context,
+                               initializer=_init_worker, initargs=(snapshot, cache_directories(), assets))
+
+
+def run_export_task(task, snapshot, options):
+    """在工作进程中执行单个任务，返回 (任务, 错误信息)，成功时错误信息为None"""
+    try:
+        export_image(task.source_path, task.output_path, snapshot, options)
+        return task, None
+    except Exception as e:
+        return task, str(e)
+
+
+def export_batch(source_paths, snapshot, options, workers=None, progress_callback=None,
+                 cancel_event=None, memory_limit=DEFAULT_MEMORY_LIMIT, incremental=False, executor=None):
+    """并行批量导出
+
+    snapshot 为 WatermarkSnapshot，会被复制到每个工作进程，工作进程不读取全局设置。
+    workers 为进程数（默认CPU核数），为1时在当前进程内用分阶段流水线处理。
+    progress_callback(done, total, task, error) 在每张图片完成后（在调用方进程中）被调用。
+    cancel_event 为 threading.Event，被设置后不再开始新的图片，已在处理中的图片会正常完成。
+    memory_limit 为所有同时处理中的图片估算峰值内存之和的上限（字节），None 表示不限制。
+    incremental 为 True 时使用输出目录中的导出清单：源文件、设置和选项都没变的图片直接跳过，
+    有变化的图片覆盖上次的输出文件，完成后更新清单。
+    executor 为 create_export_pool 创建的进程池（同一个 snapshot），给出时复用它而不是新建进程池。
+
+    导出过程记录在输出目录的任务日志中，中断后（或有失败的图片时）可以用 resume_export 继续。
+    """
+    manifest = None
+    skipped = []
+    if incremental:
+        manifest = ExportManifest(options.output_dir)
+        digests = (settings_digest(snapshot), naming_digest(options), options_digest(options))
+        pending_sources = []
+        for source_path in source_paths:
+            if manifest.is_current(source_path, *digests):
+                skipped.append((source_path, manifest.output_path(source_path)))
+            else:
+                pending_sources.append(source_path)
+        source_paths = pending_sources
+
+    output_paths = plan_output_paths(source_paths, options, manifest)
+    tasks = [ExportTask(i, source_path, output_path)
+             for i, (source_path, output_path) in enumerate(zip(source_paths, output_paths))]
+
+    journal = ExportJournal.create(snapshot, options, tasks, incremental)
+    return _export_tasks(journal, tasks, manifest, skipped, workers, progress_callback,
+                         cancel_event, memory_limit, executor)
+
+
+def resume_export(output_dir, workers=None, progress_callback=None, cancel_event=None,
+                  memory_limit=DEFAULT_MEMORY_LIMIT, retry_failed=True):
+    """从输出目录中的任务日志继续未完成的导出
+
+    使用日志中保存的设置快照、导出选项和输出文件名，只处理还没有完成的图片
+    （retry_failed 为 True 时包括上次失败的图片）；之前已完成的图片计入结果的 skipped。
+    没有未完成的任务时抛出 FileNotFoundError。
+    """
+    if not has_journal(output_dir):
+        raise FileNotFoundError(f"没有未完成的导出任务: {output_dir}")
+    journal = ExportJournal.load(output_dir, ExportTask, ExportOptions)
+    remove_temp_outputs(output_dir)
+
+    tasks = journal.remaining_tasks(retry_failed)
+    remaining = {task.index for task in tasks}
+    skipped = [(task.source_path, task.output_path) for task in journal.tasks
+               if task.index not in remaining and journal.completed[task.index] is None]
+    manifest = ExportManifest(journal.options.output_dir) if journal.incremental else None
+
+    journal.open_for_append()
+    return _export_tasks(journal, tasks, manifest, skipped, workers, progress_callback,
+                         cancel_event, memory_limit)
+
+
+def load_pending_job(output_dir):
+    """读取输出目录中未完成的任务日志（ExportJournal），没有或无法读取时返回None"""
+    if not has_journal(output_dir):
+        return None
+    try:
+        journal = ExportJournal.load(output_dir, ExportTask, ExportOptions)
+    except Exception as e:
+        print(f"读取任务日志出错: {e}")
+        return None
+    return journal
+
+
+def remove_temp_outputs(output_dir):
+    """删除崩溃时留下的临时输出文件"""
+    for filename in os.listdir(output_dir):
+        if is_temp_output(filename):
+            try:
+                os.remove(os.path.join(output_dir, filename))
+            except OSError as e:
+                print(f"删除临时文件 {filename} 出错: {e}")
+
+
+def _export_tasks(journal, tasks, manifest, skipped, workers, progress_callback, cancel_event, memory_limit,
+                  executor=None):
+    """执行 tasks 并把结果写入任务日志和导出清单"""
+    workers = workers or default_workers()
+    snapshot = journal.snapshot
+    options = journal.options
+    if manifest is not None:
+        digests = (settings_digest(snapshot), naming_digest(options), options_digest(options))
+
+    succeeded = []
+    failed = []
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def record(task, error):
+        journal.record(task, error)
+        if error is None:
+            succeeded.append((task.index, task.source_path, task.output_path))
+            if manifest is not None:
+                try:
+                    manifest.record(task.source_path, task.output_path, *digests)
+                except OSError as e:
+                    print(f"更新导出清单出错: {e}")
+        else:
+            failed.append((task.index, task.source_path, error))
+        if progress_callback:
+            progress_callback(len(succeeded) + len(failed), len(tasks), task, error)
+
+    completed = False
+    try:
+        execute_tasks(tasks, snapshot, options, workers, record, cancel_event, memory_limit, executor)
+        completed = not cancelled() and not journal.has_failures()
+    finally:
+        # 取消或出错时也保存已完成的部分；全部成功后才删除任务日志，有失败的图片时可以用 resume_export 重试
+        if manifest is not None:
+            manifest.save()
+        journal.close(finished=completed)
+
+    succeeded.sort()
+    failed.sort()
+    return ExportResult([item[1:] for item in succeeded], [item[1:] for item in failed], cancelled(), skipped)
+
+
+def execute_tasks(tasks, snapshot, options, workers, record, cancel_event=None,
+                  memory_limit=DEFAULT_MEMORY_LIMIT, executor=None):
+    """在进程内流水线或进程池中执行已分配好输出路径的 tasks，每完成一张调用 record(task, error)
+
+    不写任务日志和导出清单，供需要自行记录结果的调用方（如分片任务）使用。
+    给出 executor 时总是提交到这个进程池，用完不关闭。
+    """
+    workers = workers or default_workers()
+    if executor is not None:
+        _submit_tasks(executor, tasks, snapshot, options, workers, record, cancel_event, memory_limit)
+    elif workers <= 1 or len(tasks) <= 1:
+        global_plan_cache.preload(snapshot)
+        run_pipeline(tasks, snapshot, options, record, cancel_event, memory_limit)
+    else:
+        with create_export_pool(snapshot, workers) as executor:
+            _submit_tasks(executor, tasks, snapshot, options, workers, record, cancel_event, memory_limit)
+
+
+def _submit_tasks(executor, tasks, snapshot, options, workers, record, cancel_event, memory_limit):
+    """把 tasks 提交到进程池并等待全部完成"""
+    budget = MemoryBudget(memory_limit)
+    # 限制同时提交的任务数量，避免一次性排入上千个任务；
+    # 同时按估算内存准入，预算不足时先等待已提交的图片完成
+    pending = {}
+    task_iter = iter(tasks)
+    waiting = None
+    max_in_flight = workers * 2
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            # 取消尚未开始的任务，只等待正在处理的图片完成
+            for future in list(pending):
+                if future.cancel():
+                    budget.release(pending.pop(future))
+        else:
+            while len(pending) < max_in_flight:
+                if waiting is None:
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    waiting = (task, estimate_export_bytes(task.source_path, options))
+                task, cost = waiting
+                if not budget.try_acquire(cost):
+                    break
+                pending[executor.submit(run_export_task, task, snapshot, options)] = cost
+                waiting = None
+        if not pending:
+            break
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            budget.release(pending.pop(future))
+            record(*future.result())
@@ -0,0 +1,122 @@
+"""后台导出任务 - 在后台线程运行批量导出，界面通过轮询队列获取进度"""
+import queue
+import threading
+import time
+from .export_engine import export_batch, resume_export, load_pending_job, ExportResult, DEFAULT_MEMORY_LIMIT
+
+
+class ExportJob:
+    """在后台线程运行 export_batch，进度和结果通过队列传回调用方线程
+
+    Tk 控件只能在主线程操作，所以界面应使用 after() 定期调用 poll()。
+    """
+    def __init__(self, source_paths, snapshot, options, workers=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 incremental=False):
+        self.source_paths = list(source_paths)
+        self.snapshot = snapshot
+        self.options = options
+        self.workers = workers
+        self.memory_limit = memory_limit
+        self.incremental = incremental
+        self.resume = False
+        self.total = len(self.source_paths)
+        self.done = 0
+        self.failed = 0
+        self.result = None
+        self.start_time = None
+        self._events = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def resume_from(cls, output_dir, workers=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+        """为输出目录中未完成的导出创建继续任务，没有未完成的任务时返回None"""
+        journal = load_pending_job(output_dir)
+        if journal is None:
+            return None
+        job = cls([task.source_path for task in journal.tasks], journal.snapshot, journal.options,
+                  workers, memory_limit, journal.incremental)
+        job.resume = True
+        return job
+
+    def start(self):
+        """启动后台线程"""
+        self.start_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="watermark-export", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """请求取消：不再开始新的图片，正在处理的图片完成后结束"""
+        self._cancel_event.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.result is not None
+
+    def _run(self):
+        try:
+            if self.resume:
+                result = resume_export(self.options.output_dir, self.workers,
+                                       progress_callback=self._on_progress, cancel_event=self._cancel_event,
+                                       memory_limit=self.memory_limit)
+            else:
+                result = export_batch(self.source_paths, self.snapshot, self.options, self.workers,
+                                      progress_callback=self._on_progress, cancel_event=self._cancel_event,
+                                      memory_limit=self.memory_limit, incremental=self.incremental)
+        except Exception as e:
+            print(f"批量导出出错: {e}")
+            import traceback
+            traceback.print_exc()
+            result = None
+        self._events.put(('finished', result))
+
+    def _on_progress(self, done, total, task, error):
+        self._events.put(('progress', done, total, task, error))
+
+    def poll(self):
+        """处理队列中的事件（在界面线程中调用），返回本次收到的进度事件 [(任务, 错误信息)]"""
+        updates = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'progress':
+                # 增量导出时跳过的图片不计入 total
+                _, self.done, self.total, task, error = event
+                if error is not None:
+                    self.failed += 1
+                updates.append((task, error))
+            else:
+                self.result = event[1] or ExportResult([], [], self._cancel_event.is_set())
+        return updates
+
+    def elapsed(self):
+        """已用时间（秒）"""
+        return time.monotonic() - self.start_time if self.start_time else 0.0
+
+    def throughput(self):
+        """吞吐量（张/秒）"""
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """预计剩余时间（秒），还无法估计时返回None"""
+        rate = self.throughput()
+        if rate <= 0:
+            return None
+        return (self.total - self.done) / rate
+
+
+def format_duration(seconds):
+    """把秒数格式化为 mm:ss 或 h:mm:ss"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
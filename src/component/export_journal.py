@@ -0,0 +1,134 @@
+"""导出任务日志 - 每完成一张图片追加一行记录，程序崩溃或取消后可以从中断处继续导出
+
+日志为输出目录下的 JSON Lines 文件：
+第一行记录整个任务（设置快照、导出选项和预先分配好的 源文件 -> 输出文件 列表，都是绝对路径，
+可以在任何工作目录中继续），之后每完成一张图片追加一行 {"type": "done"/"failed", "index": ...}。
+任务全部成功后日志文件被删除，因此输出目录中存在日志就表示有未完成（或失败后待重试）的导出。
+"""
+import os
+import json
+from .watermark_settings import WatermarkSnapshot
+
+JOURNAL_NAME = ".watermark_job.jsonl"
+JOURNAL_VERSION = 1
+
+
+def journal_path(output_dir):
+    """输出目录中的任务日志路径"""
+    return os.path.join(output_dir, JOURNAL_NAME)
+
+
+def has_journal(output_dir):
+    """输出目录中是否有未完成的导出任务"""
+    return bool(output_dir) and os.path.exists(journal_path(output_dir))
+
+
+class ExportJournal:
+    """追加写入的任务日志，每条记录写入后立即刷新到磁盘"""
+    def __init__(self, path, snapshot, options, tasks, incremental=False, completed=None):
+        self.path = path
+        self.snapshot = snapshot
+        self.options = options
+        self.tasks = tasks
+        self.incremental = incremental
+        # 已完成的任务 {index: 错误信息或None}
+        self.completed = dict(completed or {})
+        self._file = None
+
+    @classmethod
+    def create(cls, snapshot, options, tasks, incremental=False):
+        """开始新任务：覆盖输出目录中已有的日志并写入任务记录（路径转换为绝对路径）"""
+        journal = cls(journal_path(options.output_dir), snapshot, options, tasks, incremental)
+        header = {
+            'type': 'job',
+            'version': JOURNAL_VERSION,
+            'snapshot': snapshot.to_dict(),
+            'options': options._replace(output_dir=os.path.abspath(options.output_dir))._asdict(),
+            'incremental': incremental,
+            'tasks': [[os.path.abspath(task.source_path), os.path.abspath(task.output_path)] for task in tasks]
+        }
+        journal._file = open(journal.path, 'w', encoding='utf-8')
+        journal._append(header)
+        return journal
+
+    @classmethod
+    def load(cls, output_dir, task_type, options_type):
+        """读取未完成的任务日志，用 task_type/options_type 还原任务和导出选项
+
+        最后一行可能因为崩溃只写了一半，这样的行会被忽略。
+        """
+        path = journal_path(output_dir)
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if not lines:
+            raise ValueError(f"任务日志为空: {path}")
+
+        header = json.loads(lines[0])
+        if header.get('type') != 'job' or header.get('version') != JOURNAL_VERSION:
+            raise ValueError(f"无法识别的任务日志: {path}")
+
+        completed = {}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('type') in ('done', 'failed'):
+                completed[record['index']] = record.get('error')
+
+        tasks = [task_type(i, source_path, output_path)
+                 for i, (source_path, output_path) in enumerate(header['tasks'])]
+        return cls(path, WatermarkSnapshot.from_dict(header['snapshot']), options_type(**header['options']),
+                   tasks, header.get('incremental', False), completed)
+
+    def remaining_tasks(self, retry_failed=True):
+        """还没有完成的任务；记录为完成但输出文件已不存在的任务也会重新处理
+
+        retry_failed 为 True 时上次失败的任务也重新处理。
+        """
+        remaining = []
+        for task in self.tasks:
+            if task.index not in self.completed:
+                remaining.append(task)
+            elif self.completed[task.index] is None:
+                if not os.path.exists(task.output_path):
+                    remaining.append(task)
+            elif retry_failed:
+                remaining.append(task)
+        return remaining
+
+    def has_failures(self):
+        """是否有最近一次处理失败的任务"""
+        return any(error is not None for error in self.completed.values())
+
+    def open_for_append(self):
+        """继续导出前以追加模式打开日志，崩溃时写了一半的最后一行会先被补上换行"""
+        torn = False
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            self._file.write("\n")
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, task, error):
+        """记录一张图片的结果"""
+        self.completed[task.index] = error
+        if error is None:
+            self._append({'type': 'done', 'index': task.index})
+        else:
+            self._append({'type': 'failed', 'index': task.index, 'error': error})
+
+    def close(self, finished):
+        """关闭日志；finished 为 True 时任务已全部成功完成，删除日志文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if finished and os.path.exists(self.path):
+            os.remove(self.path)
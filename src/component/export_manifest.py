@@ -0,0 +1,137 @@
+"""导出清单 - 记录输出目录中每个文件由哪张源图、哪套设置和导出选项生成，用于增量导出"""
+import os
+import json
+import hashlib
+from .watermark_settings import content_digest
+from .asset_store import source_signature
+
+MANIFEST_NAME = ".watermark_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_digest(snapshot):
+    """水印设置的摘要：快照的 render_digest，图片水印再加上水印图片文件的修改时间和大小（资源引用不需要）"""
+    if snapshot.watermark_type == "text" or not snapshot.image_settings['image_path']:
+        return snapshot.render_digest
+    try:
+        logo = source_signature(snapshot.image_settings['image_path'])
+    except OSError:
+        logo = None
+    return content_digest([snapshot.render_digest, logo])
+
+
+def naming_digest(options):
+    """决定输出文件名的选项的摘要"""
+    return content_digest([options.output_format, options.naming_rule, options.custom_text])
+
+
+def options_digest(options):
+    """影响输出内容的其他导出选项的摘要"""
+    return content_digest([options.output_format, options.quality, options.scale_percent])
+
+
+class ExportManifest:
+    """输出目录下的导出清单
+
+    每个条目以源文件绝对路径为键，记录源文件的 mtime/大小/内容哈希、设置摘要、选项摘要和输出文件名。
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.manifest_file = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = self.load()
+
+    def load(self):
+        """加载清单文件，不存在或损坏时返回空清单"""
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                return {}
+            return data.get('entries', {})
+        except Exception as e:
+            print(f"加载导出清单失败: {e}")
+            return {}
+
+    def save(self):
+        """保存清单文件（原子替换）"""
+        temp_file = self.manifest_file + ".tmp"
+        try:
+            # 先写临时文件再替换，避免中途崩溃留下损坏的清单
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+            os.replace(temp_file, self.manifest_file)
+            return True
+        except Exception as e:
+            print(f"保存导出清单失败: {e}")
+            return False
+
+    @staticmethod
+    def _key(source_path):
+        return os.path.abspath(source_path)
+
+    def _source_unchanged(self, entry, source_path):
+        """先比较 mtime 和大小，不一致时再比较内容哈希（例如文件被复制或 touch 过）"""
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return False
+        if entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            return True
+        if entry.get('size') != stat.st_size or not entry.get('hash'):
+            return False
+        try:
+            if file_digest(source_path) != entry['hash']:
+                return False
+        except OSError:
+            return False
+        entry['mtime'] = stat.st_mtime_ns
+        return True
+
+    def output_path(self, source_path):
+        """返回清单中记录的输出路径，没有记录时返回None"""
+        entry = self.entries.get(self._key(source_path))
+        if entry is None:
+            return None
+        return os.path.join(self.output_dir, entry['output'])
+
+    def is_current(self, source_path, settings, naming, options):
+        """源文件、设置和导出选项都没有变化，且输出文件仍然存在时返回True"""
+        entry = self.entries.get(self._key(source_path))
+        if entry is None:
+            return False
+        if (entry.get('settings'), entry.get('naming'), entry.get('options')) != (settings, naming, options):
+            return False
+        if not os.path.exists(os.path.join(self.output_dir, entry['output'])):
+            return False
+        return self._source_unchanged(entry, source_path)
+
+    def reusable_output(self, source_path, naming):
+        """命名规则没变时返回上次的输出路径（覆盖旧文件而不是生成 _1、_2 副本），否则返回None"""
+        entry = self.entries.get(self._key(source_path))
+        if entry is None or entry.get('naming') != naming:
+            return None
+        return os.path.join(self.output_dir, entry['output'])
+
+    def record(self, source_path, output_path, settings, naming, options):
+        """记录一次成功的导出"""
+        stat = os.stat(source_path)
+        self.entries[self._key(source_path)] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': file_digest(source_path),
+            'settings': settings,
+            'naming': naming,
+            'options': options,
+            'output': os.path.basename(output_path)
+        }
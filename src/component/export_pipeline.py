@@ -0,0 +1,314 @@
+"""分阶段导出流水线 - 解码 -> 渲染 -> 编码 三个阶段由有界队列连接，并按内存预算限流
+
+每张图片在流水线中只保留必要的整图缓冲：解码后立即转换为RGBA并释放原图，
+水印直接绘制在这份RGBA上，缩放和JPEG的RGB转换完成后立即释放上一份缓冲。
+开始解码前按文件头估算峰值内存并向 MemoryBudget 申请，超出上限时等待前面的图片编码完成。
+"""
+import io
+import os
+import re
+import queue
+import threading
+from PIL import Image
+from .render_engine import render_watermark, render_lock
+
+# 默认的导出内存上限（字节）
+DEFAULT_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+# 阶段之间队列的长度
+STAGE_QUEUE_SIZE = 2
+
+# 临时输出文件名：.原文件名.进程号.tmp
+TEMP_OUTPUT_PATTERN = re.compile(r'^\..+\.\d+\.tmp$')
+
+# 队列结束标记
+_DONE = object()
+# 阶段线程等待队列时检查停止标记的间隔（秒）
+_STOP_POLL_SECONDS = 0.1
+
+
+class _AnyEvent:
+    """任意一个事件被设置时 is_set() 为True（None 会被忽略）"""
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+def _put(stage_queue, item, stop_event):
+    """放入有界队列，stop_event 被设置时放弃并返回False"""
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=_STOP_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(stage_queue, stop_event):
+    """从队列读取，stop_event 被设置时返回结束标记"""
+    while not stop_event.is_set():
+        try:
+            return stage_queue.get(timeout=_STOP_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+class MemoryBudget:
+    """线程安全的内存预算
+
+    acquire 在已占用 + 申请量超过上限时阻塞；当前没有任何占用时总是放行，
+    这样单张超过上限的大图也能处理（只是独占整个预算），不会死锁。
+    """
+    def __init__(self, max_bytes=DEFAULT_MEMORY_LIMIT):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, nbytes):
+        return self.in_use == 0 or self.max_bytes is None or self.in_use + nbytes <= self.max_bytes
+
+    def try_acquire(self, nbytes):
+        """不阻塞地申请，成功返回True"""
+        with self._condition:
+            if not self._fits(nbytes):
+                return False
+            self._take(nbytes)
+            return True
+
+    def acquire(self, nbytes, cancel_event=None):
+        """阻塞申请；cancel_event 被设置时放弃并返回False"""
+        with self._condition:
+            while not self._fits(nbytes):
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                self._condition.wait(0.1)
+            self._take(nbytes)
+            return True
+
+    def _take(self, nbytes):
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    def release(self, nbytes):
+        """归还内存并唤醒等待的线程"""
+        with self._condition:
+            self.in_use = max(0, self.in_use - nbytes)
+            self._condition.notify_all()
+
+
+def estimate_export_bytes(source_path, options):
+    """只读取文件头，估算导出这张图片时的峰值内存（字节）；无法读取时返回0，错误留到解码阶段报告"""
+    try:
+        with Image.open(source_path) as img:
+            width, height = img.size
+            bands = len(img.getbands())
+    except Exception:
+        return 0
+
+    pixels = width * height
+    scale_factor = options.scale_percent / 100.0
+    output_pixels = int(width * scale_factor) * int(height * scale_factor)
+    # RGBA工作图常驻；解码时另有原图，之后可能同时存在缩放结果(RGBA)和JPEG用的RGB图
+    extra = max(pixels * bands, output_pixels * (4 + 3))
+    return pixels * 4 + extra
+
+
+def decode_image(source):
+    """解码阶段：读取图片并转换为RGBA，原始解码结果立即释放
+
+    source 为文件路径，或内存中的图片数据（bytes）。
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif not os.path.exists(source):
+        raise FileNotFoundError(f"图片文件不存在: {source}")
+    with Image.open(source) as original_img:
+        original_img.load()
+        if original_img.mode == 'RGBA':
+            return original_img
+        # 转换为RGBA模式
+        return original_img.convert("RGBA")
+
+
+def render_for_export(image, snapshot, options, lock=None):
+    """渲染阶段：在RGBA图上直接绘制水印并按导出比例缩放，水印应用失败时抛出异常
+
+    多个线程同时渲染时传入 render_engine.render_lock，只在绘制水印期间持有，缩放不持有。
+    """
+    if lock is None:
+        watermarked_img = render_watermark(image, snapshot, in_place=True, strict=True)
+    else:
+        with lock:
+            watermarked_img = render_watermark(image, snapshot, in_place=True, strict=True)
+    if watermarked_img is None:
+        raise ValueError("水印应用失败")
+
+    # 应用图片缩放
+    scale_factor = options.scale_percent / 100.0
+    if scale_factor != 1.0:
+        new_width = int(watermarked_img.width * scale_factor)
+        new_height = int(watermarked_img.height * scale_factor)
+        watermarked_img = watermarked_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return watermarked_img
+
+
+def temp_output_path(output_path):
+    """输出文件写入时使用的临时文件（同一目录下的隐藏文件，带进程号避免冲突）"""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+
+
+def is_temp_output(filename):
+    """是否为 temp_output_path 生成的临时文件名"""
+    return TEMP_OUTPUT_PATTERN.match(filename) is not None
+
+
+def _prepare_for_save(image, options):
+    """按导出格式转换图片，返回 (图片, save 参数)"""
+    save_kwargs = {}
+    if options.output_format == "JPEG":
+        image = image.convert("RGB")
+        save_kwargs['quality'] = options.quality
+        save_kwargs['optimize'] = True
+    return image, save_kwargs
+
+
+def fsync_directory(directory):
+    """把目录项（重命名结果）写入磁盘；不支持打开目录的平台（Windows）上忽略"""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def encode_image(image, output_path, options):
+    """编码阶段：按导出格式保存图片
+
+    先写入临时文件并 fsync，再原子地重命名为最终文件名，中途崩溃不会留下写了一半的输出文件。
+    """
+    image, save_kwargs = _prepare_for_save(image, options)
+    temp_path = temp_output_path(output_path)
+    try:
+        with open(temp_path, 'wb') as f:
+            image.save(f, options.output_format, **save_kwargs)
+            # 任务日志在记录完成时会 fsync，输出文件必须先落盘，崩溃后日志中"已完成"的文件才一定完整
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, output_path)
+        fsync_directory(os.path.dirname(output_path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return output_path
+
+
+def encode_to_bytes(image, options):
+    """按导出格式编码到内存，返回图片数据（bytes）"""
+    image, save_kwargs = _prepare_for_save(image, options)
+    buffer = io.BytesIO()
+    image.save(buffer, options.output_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+def export_to_bytes(source, snapshot, options):
+    """处理单张图片（路径或bytes）并返回编码后的数据，options.output_dir 不会被使用"""
+    image = decode_image(source)
+    image = render_for_export(image, snapshot, options)
+    return encode_to_bytes(image, options)
+
+
+def run_pipeline(tasks, snapshot, options, record, cancel_event=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 queue_size=STAGE_QUEUE_SIZE):
+    """在当前进程内用 解码线程 -> 渲染线程 -> 编码(调用方线程) 处理 tasks
+
+    Pillow 在解码、缩放和编码时会释放GIL，因此三个阶段可以重叠执行。
+    record(task, error) 在调用方线程中按完成顺序被调用，error 为 None 表示成功。
+    cancel_event 被设置后不再开始解码新的图片，已进入流水线的图片会正常完成。
+    record 或编码循环抛出异常时，解码和渲染线程会停止并被回收，队列中的图片随之释放，异常继续向上抛出。
+    """
+    budget = MemoryBudget(memory_limit)
+    render_queue = queue.Queue(queue_size)
+    encode_queue = queue.Queue(queue_size)
+    # 调用方线程结束（包括出错）时设置，阶段线程不会永远阻塞在已满的队列上
+    stop_event = threading.Event()
+    stop_or_cancel = _AnyEvent(stop_event, cancel_event)
+
+    def decode_stage():
+        try:
+            for task in tasks:
+                if stop_or_cancel.is_set():
+                    break
+                cost = estimate_export_bytes(task.source_path, options)
+                if not budget.acquire(cost, stop_or_cancel):
+                    break
+                try:
+                    item = (task, cost, decode_image(task.source_path), None)
+                except Exception as e:
+                    item = (task, cost, None, str(e))
+                if not _put(render_queue, item, stop_event):
+                    break
+        finally:
+            _put(render_queue, _DONE, stop_event)
+
+    def render_stage():
+        try:
+            while True:
+                item = _get(render_queue, stop_event)
+                if item is _DONE:
+                    break
+                task, cost, image, error = item
+                if error is None:
+                    try:
+                        # 图形界面中预览可能同时在其他线程渲染，共用同一批字体对象
+                        image = render_for_export(image, snapshot, options, render_lock)
+                    except Exception as e:
+                        image, error = None, str(e)
+                if not _put(encode_queue, (task, cost, image, error), stop_event):
+                    break
+        finally:
+            _put(encode_queue, _DONE, stop_event)
+
+    threads = [threading.Thread(target=decode_stage, name="export-decode", daemon=True),
+               threading.Thread(target=render_stage, name="export-render", daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = encode_queue.get()
+            if item is _DONE:
+                break
+            task, cost, image, error = item
+            item = None
+            if error is None:
+                try:
+                    encode_image(image, task.output_path, options)
+                except Exception as e:
+                    error = str(e)
+            # 先释放图片再归还预算，让解码线程尽快开始下一张
+            image = None
+            budget.release(cost)
+            record(task, error)
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        # 出错退出时队列中可能还有图片，丢弃它们
+        for stage_queue in (render_queue, encode_queue):
+            while True:
+                try:
+                    stage_queue.get_nowait()
+                except queue.Empty:
+                    break
+    return budget.peak
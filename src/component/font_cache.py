@@ -0,0 +1,102 @@
+"""字体缓存 - 字体查找和解析只做一次，之后复用 FreeTypeFont 对象"""
+import os
+from PIL import ImageFont
+from .lru_cache import LRUCache
+from .font_index import global_font_index
+from .asset_store import global_asset_store, is_asset_ref
+
+
+def _open_font_file(name, font_size):
+    """与 ImageFont.truetype(name) 相同：先当作路径打开，再按文件名在系统字体目录中查找（通过字体索引），找不到时返回None"""
+    if os.path.isfile(name):
+        try:
+            return ImageFont.truetype(name, font_size)
+        except OSError:
+            pass
+    path = global_font_index.find_file(os.path.basename(name))
+    if path is None:
+        return None
+    try:
+        return ImageFont.truetype(path, font_size)
+    except OSError:
+        return None
+
+
+def _open_font_face(font_family, font_size, is_bold, is_italic):
+    """按字体族和样式在字体索引中查找字体，找不到时返回None"""
+    face = global_font_index.find(font_family, is_bold, is_italic)
+    if face is None:
+        return None
+    try:
+        return ImageFont.truetype(face[0], font_size, index=face[1])
+    except OSError:
+        return None
+
+
+def load_font(font_family, font_size, is_bold=False, is_italic=False, font_index=0):
+    """按 "字体 Bold Italic" 文件名 -> 字体族和样式 -> 常规字体 -> 默认字体 的顺序加载字体（不缓存）
+
+    文件名、字体族和样式都通过系统字体索引查找，找不到的字体不会在每次加载时搜索字体目录。
+    font_family 为资源引用（模板包中嵌入的字体文件）时直接加载该字体，font_index 为字体集（.ttc）中的序号；
+    按名称查找的字体由字体索引确定序号，忽略 font_index。
+    """
+    if is_asset_ref(font_family):
+        try:
+            return ImageFont.truetype(global_asset_store.open(font_family), font_size, index=font_index)
+        except Exception as e:
+            print(f"加载嵌入的字体出错: {e}")
+            return ImageFont.load_default()
+
+    if is_bold and is_italic:
+        font_name = f"{font_family} Bold Italic"
+    elif is_bold:
+        font_name = f"{font_family} Bold"
+    elif is_italic:
+        font_name = f"{font_family} Italic"
+    else:
+        font_name = font_family
+
+    font = (_open_font_file(font_name, font_size) or
+            _open_font_face(font_family, font_size, is_bold, is_italic))
+    if font is None and (is_bold or is_italic):
+        # 没有对应的粗体/斜体字体时使用常规字体
+        font = (_open_font_file(font_family, font_size) or
+                _open_font_face(font_family, font_size, False, False))
+    return font or ImageFont.load_default()
+
+
+class FontCache:
+    """以 (字体, 字号, 粗体, 斜体, 字体集序号) 为键的有界字体缓存"""
+    def __init__(self, max_entries=64):
+        self._cache = LRUCache(max_entries)
+
+    def get_font(self, font_family, font_size, is_bold=False, is_italic=False, font_index=0):
+        """获取字体对象，回退链的结果（包括默认字体）同样会被缓存"""
+        key = (font_family, font_size, bool(is_bold), bool(is_italic), font_index)
+        return self._cache.get_or_create(
+            key, lambda: load_font(font_family, font_size, is_bold, is_italic, font_index))
+
+    def put_font(self, font_family, font_size, is_bold, is_italic, font, font_index=0):
+        """直接放入已加载的字体（例如从渲染计划中记录的字体文件加载），之后 get_font 不再查找字体"""
+        self._cache.put((font_family, font_size, bool(is_bold), bool(is_italic), font_index), font)
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    def stats(self):
+        """返回命中/未命中统计"""
+        return self._cache.stats()
+
+    def clear(self):
+        """清空缓存（例如安装了新字体之后），字体索引也会在下次查找时重新检查字体目录"""
+        self._cache.clear()
+        global_font_index.invalidate()
+
+
+# 创建全局字体缓存实例
+global_font_cache = FontCache()
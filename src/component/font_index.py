@@ -0,0 +1,221 @@
+"""系统字体索引 - 扫描一次系统字体目录，读取每个字体的 family/style，之后按名称查找字体不再搜索文件系统
+
+索引包含:
+    按 (字体族, 粗体, 斜体) 查找字体文件和其中的字体序号（.ttc 字体集合中有多个字体）
+    按文件名查找字体文件，规则与 ImageFont.truetype 找不到文件时搜索系统字体目录相同
+    所有字体族名称（用于界面中的字体列表）
+
+索引保存在用户缓存目录中，记录了扫描时每个字体目录（包括子目录）的修改时间；
+安装或删除字体会改变所在目录的修改时间，下次启动时发现变化就重新扫描。
+"""
+import os
+import sys
+import json
+import threading
+from PIL import ImageFont
+
+INDEX_VERSION = 1
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc', '.otc')
+# 字体集合中最多读取的字体数
+MAX_FACES_PER_FILE = 64
+
+# 常规、粗体、斜体、粗斜体的标准 style 名称，同一字体族有多个粗体（如 Bold Condensed）时优先使用
+CANONICAL_STYLES = {
+    (False, False): ("regular", "book", "normal", "roman"),
+    (True, False): ("bold",),
+    (False, True): ("italic", "oblique"),
+    (True, True): ("bold italic", "bold oblique"),
+}
+
+
+def font_directories():
+    """系统字体目录，与 ImageFont.truetype 搜索的目录相同"""
+    if sys.platform == "win32":
+        windir = os.environ.get("WINDIR")
+        return [os.path.join(windir, "fonts")] if windir else []
+    if sys.platform == "darwin":
+        return ["/Library/Fonts", "/System/Library/Fonts", os.path.expanduser("~/Library/Fonts")]
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    data_dirs = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+    return [os.path.join(directory, "fonts") for directory in [data_home] + data_dirs.split(":")]
+
+
+def default_index_file():
+    """索引文件在用户缓存目录中的位置"""
+    if sys.platform == "darwin":
+        cache_dir = os.path.expanduser("~/Library/Caches/WatermarkApp")
+    elif sys.platform == "win32":
+        cache_dir = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "WatermarkApp")
+    else:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "watermark-app")
+    return os.path.join(cache_dir, "font_index.json")
+
+
+def _dir_mtime(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _style_flags(style):
+    """根据 style 名称判断是否为粗体/斜体"""
+    style = style.lower()
+    bold = any(word in style for word in ("bold", "black", "heavy"))
+    italic = "italic" in style or "oblique" in style
+    return bold, italic
+
+
+def _read_faces(path):
+    """读取字体文件中每个字体的 (family, style, 序号)，无法读取的文件返回空列表"""
+    faces = []
+    count = MAX_FACES_PER_FILE if path.lower().endswith(('.ttc', '.otc')) else 1
+    for index in range(count):
+        try:
+            family, style = ImageFont.truetype(path, 12, index=index).getname()
+        except Exception:
+            break
+        if family:
+            faces.append((family, style or "", index))
+    return faces
+
+
+class FontIndex:
+    """系统字体索引，第一次查找时加载（索引文件有效时）或扫描"""
+    def __init__(self, index_file=None, directories=None):
+        self.index_file = index_file
+        self.directories = directories
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dir_mtimes = {}
+        self._files = []      # 按扫描顺序排列的字体文件
+        self._faces = []      # [(family, style, 路径, 序号)]
+        self._by_style = {}   # {(family小写, 粗体, 斜体): (路径, 序号)}
+        self._by_name = {}    # {文件名: 路径}
+        self._families = []
+
+    def _roots(self):
+        return self.directories if self.directories is not None else font_directories()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if not self._load():
+                self._scan()
+                self._save()
+            self._build_tables()
+            self._loaded = True
+
+    def _is_current(self, dir_mtimes):
+        """索引记录的目录修改时间是否与现在相同（字体目录本身不存在时记录为None）"""
+        if any(_dir_mtime(root) != dir_mtimes.get(root) for root in self._roots()):
+            return False
+        return all(_dir_mtime(directory) == mtime for directory, mtime in dir_mtimes.items())
+
+    def _load(self):
+        """读取索引文件，文件不存在、格式不对或已过期时返回False"""
+        if self.index_file is None:
+            return False
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('roots') != self._roots():
+            return False
+        if not self._is_current(data['dir_mtimes']):
+            return False
+        self._dir_mtimes = data['dir_mtimes']
+        self._files = data['files']
+        self._faces = [tuple(face) for face in data['faces']]
+        return True
+
+    def _scan(self):
+        """扫描字体目录，读取所有字体文件的 family/style"""
+        self._dir_mtimes = {}
+        self._files = []
+        self._faces = []
+        for root in self._roots():
+            self._dir_mtimes[root] = _dir_mtime(root)
+            for walkroot, _, walkfilenames in os.walk(root):
+                self._dir_mtimes[walkroot] = _dir_mtime(walkroot)
+                for walkfilename in walkfilenames:
+                    if not walkfilename.lower().endswith(FONT_EXTENSIONS):
+                        continue
+                    path = os.path.join(walkroot, walkfilename)
+                    self._files.append(path)
+                    for family, style, index in _read_faces(path):
+                        self._faces.append((family, style, path, index))
+
+    def _save(self):
+        if self.index_file is None:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'roots': self._roots(),
+            'dir_mtimes': self._dir_mtimes,
+            'files': self._files,
+            'faces': self._faces
+        }
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            temp_file = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_file, self.index_file)
+        except OSError as e:
+            print(f"保存字体索引出错: {e}")
+
+    def _build_tables(self):
+        self._by_name = {}
+        stems_ttf = {}
+        stems_other = {}
+        for path in self._files:
+            filename = os.path.basename(path)
+            self._by_name.setdefault(filename, path)
+            stem, ext = os.path.splitext(filename)
+            # 与 ImageFont.truetype 相同：没有扩展名时优先 .ttf，否则使用第一个找到的其他扩展名
+            (stems_ttf if ext == ".ttf" else stems_other).setdefault(stem, path)
+        for stem in set(stems_ttf) | set(stems_other):
+            self._by_name[stem] = stems_ttf.get(stem) or stems_other[stem]
+
+        self._by_style = {}
+        exact = set()
+        families = {}
+        for family, style, path, index in self._faces:
+            families.setdefault(family.lower(), family)
+            flags = _style_flags(style)
+            key = (family.lower(),) + flags
+            is_exact = style.lower() in CANONICAL_STYLES[flags]
+            if key not in self._by_style or (is_exact and key not in exact):
+                self._by_style[key] = (path, index)
+                if is_exact:
+                    exact.add(key)
+        self._families = sorted(families.values(), key=str.lower)
+
+    def find(self, family, bold=False, italic=False):
+        """按字体族和粗体/斜体查找，返回 (字体文件, 序号)，没有时返回None"""
+        self._ensure_loaded()
+        return self._by_style.get((family.lower(), bool(bold), bool(italic)))
+
+    def find_file(self, name):
+        """按文件名（可以省略扩展名）在系统字体目录中查找字体文件，没有时返回None"""
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    def families(self):
+        """所有字体族名称（按名称排序）"""
+        self._ensure_loaded()
+        return list(self._families)
+
+    def invalidate(self):
+        """下次查找时重新检查字体目录（安装了新字体之后调用）"""
+        with self._lock:
+            self._loaded = False
+
+
+# 创建全局字体索引实例
+global_font_index = FontIndex(default_index_file())
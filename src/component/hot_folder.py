@@ -0,0 +1,273 @@
+"""监视文件夹 - 放入输入文件夹的图片自动加水印并导出到输出文件夹
+
+安装了 watchdog 时使用系统的文件事件（Linux 上为 inotify），空闲时不占用CPU；
+否则退回到轮询：修改时间变化了的文件夹重新列出文件，已知的图片逐个比较 (修改时间, 大小)，
+原地覆盖（文件夹修改时间不变）的图片也能发现。
+文件的大小和修改时间在 settle_time 秒内都没有变化才认为已经写完，然后交给 export_batch 导出。
+导出使用增量模式，重启后不会重复处理已经导出过的图片；整个监视期间复用同一个导出进程池。
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from .export_engine import export_batch, create_export_pool, default_workers, SUPPORTED_FORMATS
+from .export_pipeline import DEFAULT_MEMORY_LIMIT
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# 文件大小和修改时间保持不变多久后才开始处理（秒）
+DEFAULT_SETTLE_TIME = 2.0
+# 轮询模式下检查文件夹的间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 下载或复制中的临时文件后缀
+PARTIAL_SUFFIXES = ('.tmp', '.part', '.crdownload', '.download')
+
+
+def events_available():
+    """是否可以使用文件系统事件（需要安装 watchdog）"""
+    return Observer is not None
+
+
+def _is_candidate(path):
+    name = os.path.basename(path)
+    if name.startswith('.') or name.lower().endswith(PARTIAL_SUFFIXES):
+        return False
+    return name.lower().endswith(SUPPORTED_FORMATS)
+
+
+def _signature(path):
+    """文件的 (修改时间, 大小)，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class _EventHandler(FileSystemEventHandler):
+    """把 watchdog 的事件转发到 HotFolder"""
+    def __init__(self, notify):
+        self.notify = notify
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        self.notify(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.notify(dest_path)
+
+
+class HotFolder:
+    """监视 input_dirs，把写完的图片按相同的子文件夹结构导出到 options.output_dir 下
+
+    只有一个输入文件夹时，其中的子文件夹直接对应输出文件夹的子文件夹；
+    有多个输入文件夹时，输出再按输入文件夹的名称分开。
+    """
+    def __init__(self, input_dirs, snapshot, options, workers=None, recursive=True,
+                 settle_time=DEFAULT_SETTLE_TIME, poll_interval=DEFAULT_POLL_INTERVAL, use_events=True,
+                 memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.input_dirs = [os.path.abspath(path) for path in input_dirs]
+        self.snapshot = snapshot
+        self.options = options
+        self.workers = workers
+        self.recursive = recursive
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.use_events = use_events and events_available()
+        self.memory_limit = memory_limit
+
+        output_root = os.path.abspath(options.output_dir)
+        for input_dir in self.input_dirs:
+            if not os.path.isdir(input_dir):
+                raise FileNotFoundError(f"输入文件夹不存在: {input_dir}")
+            if os.path.commonpath([input_dir, output_root]) in (input_dir, output_root):
+                raise ValueError("输出文件夹不能与输入文件夹相互包含")
+
+        # 等待写完的文件 {路径: (签名, 签名最后变化的时间)}
+        self._candidates = {}
+        # 已处理过的文件 {路径: 签名}，签名变化后会重新处理；文件被删除后移除
+        self._processed = {}
+        # 轮询模式下各文件夹的修改时间
+        self._dir_mtimes = {}
+        self._events = queue.Queue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        # run() 期间复用的导出进程池（单进程导出时为None）
+        self._executor = None
+        self.exported = 0
+        self.failed = 0
+
+    def stop(self):
+        """请求停止 run()，正在导出的这一批会先完成"""
+        self._stop.set()
+        self._wake.set()
+
+    def _notify(self, path):
+        self._events.put(path)
+        self._wake.set()
+
+    def _observe(self, path):
+        """发现新文件或文件有变化时加入等待列表"""
+        if not _is_candidate(path):
+            return
+        signature = _signature(path)
+        if signature is None:
+            # 文件已被删除（或移走），不再记住它
+            self._processed.pop(path, None)
+            return
+        if self._processed.get(path) == signature:
+            return
+        current = self._candidates.get(path)
+        if current is None or current[0] != signature:
+            self._candidates[path] = (signature, time.monotonic())
+
+    def _scan_dir(self, directory):
+        """列出文件夹中的文件（递归模式下也登记子文件夹）"""
+        try:
+            self._dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except OSError:
+            self._dir_mtimes.pop(directory, None)
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive and not entry.name.startswith('.') and entry.path not in self._dir_mtimes:
+                    self._scan_dir(entry.path)
+            elif entry.is_file():
+                self._observe(entry.path)
+
+    def _poll_dirs(self):
+        """轮询：重新列出修改时间变化了的文件夹，并逐个检查已处理过的图片是否被覆盖或删除"""
+        for directory, mtime in list(self._dir_mtimes.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self._dir_mtimes[directory]
+                continue
+            if current != mtime:
+                self._scan_dir(directory)
+        # 原地覆盖文件不会改变文件夹的修改时间；等待列表中的文件由 _ready_files 检查
+        for path in list(self._processed):
+            self._observe(path)
+
+    def _ready_files(self):
+        """返回已经写完（签名保持 settle_time 秒不变）的文件，并更新其他文件的签名"""
+        now = time.monotonic()
+        ready = []
+        for path, (signature, since) in list(self._candidates.items()):
+            current = _signature(path)
+            if current is None:
+                del self._candidates[path]
+            elif current != signature:
+                self._candidates[path] = (current, now)
+            elif now - since >= self.settle_time:
+                del self._candidates[path]
+                ready.append((path, signature))
+        return ready
+
+    def _next_deadline(self):
+        """距离下一个文件可能写完还有多久（秒），没有等待的文件时返回None"""
+        if not self._candidates:
+            return None
+        now = time.monotonic()
+        earliest = min(since for _, since in self._candidates.values())
+        return max(0.05, earliest + self.settle_time - now)
+
+    def output_dir_for(self, path):
+        """图片对应的输出文件夹（保持输入文件夹中的子文件夹结构）"""
+        for input_dir in self.input_dirs:
+            if os.path.commonpath([input_dir, path]) == input_dir:
+                relative = os.path.relpath(os.path.dirname(path), input_dir)
+                if len(self.input_dirs) > 1:
+                    relative = os.path.join(os.path.basename(input_dir), relative)
+                return os.path.normpath(os.path.join(self.options.output_dir, relative))
+        return self.options.output_dir
+
+    def process(self, ready):
+        """按输出文件夹分组导出写完的图片"""
+        groups = {}
+        for path, signature in ready:
+            groups.setdefault(self.output_dir_for(path), []).append(path)
+            # 无论成功与否都记下签名，失败的文件被修改后才会重试
+            self._processed[path] = signature
+
+        for output_dir, paths in groups.items():
+            os.makedirs(output_dir, exist_ok=True)
+            options = self.options._replace(output_dir=output_dir)
+            try:
+                result = export_batch(paths, self.snapshot, options, self.workers,
+                                      memory_limit=self.memory_limit, incremental=True, executor=self._executor)
+            except BrokenProcessPool as e:
+                # 工作进程崩溃后进程池不能再用，换一个新的进程池，后面的图片照常处理
+                print(f"导出到 {output_dir} 时出错: {e}")
+                self.failed += len(paths)
+                self._executor.shutdown(wait=False)
+                self._executor = create_export_pool(self.snapshot, self.workers)
+                continue
+            except Exception as e:
+                print(f"导出到 {output_dir} 时出错: {e}")
+                self.failed += len(paths)
+                continue
+            for source_path, output_path in result.succeeded:
+                print(f"已导出: {source_path} -> {output_path}")
+            for source_path, error in result.failed:
+                print(f"处理图片 {source_path} 时出错: {error}")
+            self.exported += len(result.succeeded)
+            self.failed += len(result.failed)
+
+    def run(self):
+        """开始监视（阻塞，直到 stop() 被调用）"""
+        observer = None
+        if self.use_events:
+            observer = Observer()
+            handler = _EventHandler(self._notify)
+            for input_dir in self.input_dirs:
+                observer.schedule(handler, input_dir, recursive=self.recursive)
+            observer.start()
+
+        mode = "文件系统事件" if observer is not None else f"轮询（每 {self.poll_interval} 秒）"
+        print(f"开始监视 {', '.join(self.input_dirs)}，方式: {mode}")
+        # 启动时已有的文件也会被处理（增量导出会跳过已经导出过的图片）
+        for input_dir in self.input_dirs:
+            self._scan_dir(input_dir)
+
+        if (self.workers or default_workers()) > 1:
+            self._executor = create_export_pool(self.snapshot, self.workers)
+        try:
+            while not self._stop.is_set():
+                if observer is not None:
+                    while True:
+                        try:
+                            self._observe(self._events.get_nowait())
+                        except queue.Empty:
+                            break
+                else:
+                    self._poll_dirs()
+
+                ready = self._ready_files()
+                if ready:
+                    self.process(ready)
+                    continue
+
+                # 空闲时在事件模式下一直等待，直到有新事件或有文件可能写完
+                timeout = self._next_deadline()
+                if observer is None:
+                    timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+                self._wake.wait(timeout)
+                self._wake.clear()
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        print(f"停止监视，共导出 {self.exported} 张，失败 {self.failed} 张")
@@ -0,0 +1,353 @@
+"""HTTP水印服务 - 基于Flask，供上传流程等其他程序调用，不依赖Tk
+
+接口:
+    GET  /health      服务状态
+    GET  /templates   可用的模板名称
+    POST /watermark   添加水印并返回图片数据
+
+POST /watermark 的参数（表单字段或JSON）:
+    image     上传的图片文件（multipart），也可以直接把图片数据作为请求体（Content-Type: image/*）
+    path      服务器上的图片路径（只允许 allowed_roots 下的文件）
+    template  模板名称；settings 模板格式的设置（JSON），两者都没有时使用默认设置
+              settings 中的水印图片和字体只能是资源引用 asset:<SHA-256>，或 allowed_roots 下的文件
+    format    输出格式 PNG/JPEG（默认PNG），quality JPEG质量，scale 缩放比例(%)
+
+工作进程崩溃时进程池会重建并重试一次，仍然失败时返回500；进程池不可用时 /health 返回503。
+"""
+import io
+import os
+import re
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, jsonify, request, send_file
+from .watermark_settings import WatermarkSnapshot
+from .template_manager import TemplateManager, configure_storage
+from .render_plan import global_plan_cache, cache_directories, set_cache_directories
+from .export_engine import ExportOptions, OUTPUT_EXTENSIONS, default_workers
+from .export_pipeline import export_to_bytes
+from .asset_store import ASSET_SCHEME, is_asset_ref
+
+DEFAULT_TEMPLATE_FILE = "watermark_templates.json"
+# 同时处理和排队的请求数上限，超出时返回503
+DEFAULT_MAX_PENDING = 32
+# 排队等待的最长时间（秒）
+DEFAULT_QUEUE_TIMEOUT = 30
+# 上传图片的大小上限（字节）
+DEFAULT_MAX_UPLOAD = 256 * 1024 * 1024
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg"}
+
+ASSET_REF_PATTERN = re.compile(re.escape(ASSET_SCHEME) + r'[0-9a-f]{64}$')
+# load_font 除了字体名称本身，还会尝试这些带样式的文件名
+FONT_STYLE_SUFFIXES = ("", " Bold", " Italic", " Bold Italic")
+
+
+class ServiceBusy(Exception):
+    """排队的请求已满"""
+
+
+class WorkerCrashed(Exception):
+    """工作进程异常退出，重建进程池后重试仍然失败"""
+
+
+def _init_worker(snapshots, directories):
+    """工作进程启动时读取模板的渲染计划，预加载字体、文本图层和水印图片"""
+    set_cache_directories(directories)
+    for snapshot in snapshots:
+        global_plan_cache.preload(snapshot)
+
+
+def _ping():
+    return os.getpid()
+
+
+class WatermarkService:
+    """常驻的水印服务：持有预热好的进程池和模板，限制同时处理的请求数
+
+    请求先占用一个名额（最多 max_pending 个，包括正在处理和排队的），
+    等待超过 queue_timeout 秒仍拿不到名额时抛出 ServiceBusy。
+    """
+    def __init__(self, templates_file=DEFAULT_TEMPLATE_FILE, workers=None, max_pending=DEFAULT_MAX_PENDING,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, allowed_roots=None):
+        self.templates_file = templates_file
+        self.workers = workers or default_workers()
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.allowed_roots = [os.path.realpath(root) for root in (allowed_roots or [])]
+        # 模板库在其他程序修改后会自动读到新内容，不需要重新加载
+        configure_storage(templates_file)
+        self.template_manager = TemplateManager(templates_file)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+
+        snapshots = [self.get_template_snapshot(name) for name in self.template_names()]
+        self._initargs = (snapshots, cache_directories())
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self._initargs)
+
+    def _rebuild_executor(self, broken):
+        """替换已损坏的进程池；多个请求同时发现损坏时只重建一次"""
+        with self._pool_lock:
+            if self.executor is not broken:
+                return
+            print("工作进程异常退出，重建进程池")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._create_executor()
+            with self._lock:
+                self.pool_restarts += 1
+
+    def check_pool(self):
+        """检查进程池是否可用，已损坏时重建并返回False"""
+        executor = self.executor
+        try:
+            executor.submit(_ping)
+        except BrokenProcessPool:
+            self._rebuild_executor(executor)
+            return False
+        except RuntimeError:
+            # 进程池已关闭
+            return False
+        return True
+
+    def warm_up(self):
+        """启动所有工作进程（并执行预加载），避免第一批请求承担进程启动的开销"""
+        futures = [self.executor.submit(_ping) for _ in range(self.workers)]
+        return {future.result() for future in futures}
+
+    def template_names(self):
+        """可用的模板名称"""
+        return self.template_manager.get_template_names()
+
+    def get_template_snapshot(self, name):
+        """按名称获取模板的设置快照，不存在时抛出 KeyError"""
+        template = self.template_manager.load_template(name)
+        if template is None:
+            raise KeyError(name)
+        return WatermarkSnapshot.from_dict(template)
+
+    def resolve_path(self, path):
+        """检查服务器端路径是否位于允许的目录中，返回规范化后的路径"""
+        real_path = os.path.realpath(path)
+        for root in self.allowed_roots:
+            if os.path.commonpath([root, real_path]) == root:
+                return real_path
+        raise PermissionError(f"不允许访问该路径: {path}")
+
+    def resolve_settings(self, settings):
+        """检查请求中的设置（模板格式的字典）引用的文件，返回可以安全使用的设置
+
+        水印图片和字体只能是资源引用，或 allowed_roots 下的文件（替换为规范化后的路径）；
+        其他路径抛出 PermissionError。不是路径的字体名称（如 "Arial"）按系统字体查找。
+        """
+        settings = json.loads(json.dumps(settings))
+        image_settings = settings.get('image_settings')
+        if isinstance(image_settings, dict) and image_settings.get('image_path'):
+            image_settings['image_path'] = self._resolve_asset(image_settings['image_path'], 'image_path')
+
+        text_settings = settings.get('text_settings')
+        if isinstance(text_settings, dict):
+            font_index = text_settings.get('font_index', 0)
+            if not isinstance(font_index, int) or isinstance(font_index, bool) or font_index < 0:
+                raise ValueError("font_index 必须是非负整数")
+        if isinstance(text_settings, dict) and text_settings.get('font_family'):
+            font_family = text_settings['font_family']
+            if not isinstance(font_family, str):
+                raise ValueError("font_family 必须是字符串")
+            if is_asset_ref(font_family) or _is_path_like(font_family):
+                text_settings['font_family'] = self._resolve_asset(font_family, 'font_family')
+            else:
+                # 与字体名称同名的文件（包括带样式后缀的）会被当作字体文件打开，同样要在允许的目录中
+                for suffix in FONT_STYLE_SUFFIXES:
+                    if os.path.exists(font_family + suffix):
+                        self.resolve_path(font_family + suffix)
+        return settings
+
+    def _resolve_asset(self, value, name):
+        """资源引用原样返回（格式必须正确），文件路径必须位于允许的目录中"""
+        if not isinstance(value, str):
+            raise ValueError(f"{name} 必须是字符串")
+        if is_asset_ref(value):
+            if not ASSET_REF_PATTERN.match(value):
+                raise ValueError(f"{name} 不是有效的资源引用")
+            return value
+        return self.resolve_path(value)
+
+    def render(self, source, snapshot, options):
+        """在进程池中处理一张图片（路径或bytes），返回编码后的数据"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceBusy("服务繁忙，请稍后重试")
+        with self._lock:
+            self.pending += 1
+        try:
+            for attempt in range(2):
+                executor = self.executor
+                try:
+                    return executor.submit(export_to_bytes, source, snapshot, options).result()
+                except BrokenProcessPool:
+                    # 工作进程被杀死或崩溃后进程池不能再使用：重建后重试一次
+                    self._rebuild_executor(executor)
+            raise WorkerCrashed("工作进程异常退出")
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.served += 1
+            self._slots.release()
+
+    def stats(self):
+        """返回服务状态"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'served': self.served,
+                'rejected': self.rejected,
+                'pool_restarts': self.pool_restarts
+            }
+
+    def shutdown(self):
+        """关闭进程池"""
+        with self._pool_lock:
+            self.executor.shutdown(wait=True)
+
+
+def _is_path_like(value):
+    """字体名称是否为文件路径（而不是字体族名称）"""
+    separators = [sep for sep in (os.sep, os.altsep) if sep]
+    return os.path.isabs(value) or any(sep in value for sep in separators)
+
+
+def _parse_int(value, name, minimum, maximum):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 必须是整数")
+    if not minimum <= number <= maximum:
+        raise ValueError(f"{name} 应在 {minimum}-{maximum} 之间")
+    return number
+
+
+def _request_params():
+    """合并表单字段和JSON请求体中的参数"""
+    params = dict(request.form.items())
+    if request.is_json:
+        params.update(request.get_json(silent=True) or {})
+    for key, value in request.args.items():
+        params.setdefault(key, value)
+    return params
+
+
+def _request_snapshot(service, params):
+    """按 template 或 settings 参数得到设置快照"""
+    settings = params.get('settings')
+    if settings:
+        if isinstance(settings, str):
+            try:
+                settings = json.loads(settings)
+            except ValueError:
+                raise ValueError("settings 不是有效的JSON")
+        if not isinstance(settings, dict):
+            raise ValueError("settings 必须是JSON对象")
+        return WatermarkSnapshot.from_dict(service.resolve_settings(settings))
+    name = params.get('template')
+    if name:
+        try:
+            return service.get_template_snapshot(name)
+        except KeyError:
+            raise FileNotFoundError(f"找不到模板: {name}")
+    return WatermarkSnapshot.from_dict({})
+
+
+def _request_source(service, params):
+    """返回 (图片来源, 文件名)：上传的文件、请求体中的图片数据或服务器端路径"""
+    upload = request.files.get('image')
+    if upload is not None:
+        return upload.read(), upload.filename or "image"
+    if request.mimetype and request.mimetype.startswith('image/'):
+        return request.get_data(), "image"
+    path = params.get('path')
+    if path:
+        return service.resolve_path(path), os.path.basename(path)
+    raise ValueError("请上传图片（image）或提供服务器端路径（path）")
+
+
+def _error(message, status):
+    return jsonify({'error': message}), status
+
+
+def create_app(service=None, max_upload=DEFAULT_MAX_UPLOAD, **service_options):
+    """创建Flask应用；未提供 service 时用 service_options 创建 WatermarkService"""
+    if service is None:
+        service = WatermarkService(**service_options)
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = max_upload
+    app.extensions['watermark_service'] = service
+
+    @app.get('/health')
+    def health():
+        # 进程池损坏时返回503（同时开始重建），负载均衡可以暂时摘除这个节点
+        if not service.check_pool():
+            return jsonify(dict(service.stats(), status='unhealthy')), 503
+        return jsonify(dict(service.stats(), status='ok'))
+
+    @app.get('/templates')
+    def templates():
+        return jsonify({'templates': service.template_names()})
+
+    @app.post('/watermark')
+    def watermark():
+        try:
+            params = _request_params()
+            output_format = str(params.get('format', 'PNG')).upper()
+            if output_format not in MIME_TYPES:
+                raise ValueError(f"不支持的输出格式: {output_format}")
+            options = ExportOptions(
+                output_dir=None,
+                output_format=output_format,
+                quality=_parse_int(params.get('quality', 95), 'quality', 1, 100),
+                scale_percent=_parse_int(params.get('scale', 100), 'scale', 1, 1000)
+            )
+            snapshot = _request_snapshot(service, params)
+            source, filename = _request_source(service, params)
+            data = service.render(source, snapshot, options)
+        except ValueError as e:
+            return _error(str(e), 400)
+        except PermissionError as e:
+            return _error(str(e), 403)
+        except FileNotFoundError as e:
+            return _error(str(e), 404)
+        except ServiceBusy as e:
+            return _error(str(e), 503)
+        except WorkerCrashed as e:
+            return _error(str(e), 500)
+        except Exception as e:
+            print(f"处理请求出错: {e}")
+            return _error(f"无法处理图片: {e}", 422)
+
+        output_name = os.path.splitext(filename)[0] + OUTPUT_EXTENSIONS[output_format]
+        return send_file(io.BytesIO(data), mimetype=MIME_TYPES[output_format], download_name=output_name)
+
+    return app
+
+
+def serve(host="127.0.0.1", port=5000, **service_options):
+    """启动服务（阻塞），启动前先预热进程池"""
+    service = WatermarkService(**service_options)
+    pids = service.warm_up()
+    print(f"水印服务已启动: http://{host}:{port}  工作进程 {len(pids)} 个")
+    app = create_app(service)
+    try:
+        app.run(host=host, port=port, threaded=True)
+    finally:
+        service.shutdown()
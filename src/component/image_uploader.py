@@ -1,21 +1,46 @@
 import os
-from tkinter import Frame, Button, Listbox, filedialog, Label, Scrollbar, Canvas, NW, StringVar, OptionMenu, RIGHT, Y, BOTH, END
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from tkinter import Frame, Button, filedialog, Label, Scrollbar, Canvas, NW, StringVar, OptionMenu, RIGHT, Y, BOTH, END
+from PIL import ImageTk
 from .watermark_options import WatermarkOptions, global_watermark_settings
+from .render_engine import render_watermark, build_overlay, render_lock
+from .preview_proxy import PreviewProxyCache, build_proxy
+from .thumbnail_list import ThumbnailList, THUMB_SIZE
+from .lru_cache import LRUCache, image_nbytes
+from .asset_store import source_signature
+from .thumbnail_pool import ThumbnailPool, PRIORITY_SELECTED, PRIORITY_VISIBLE, PRIORITY_PREFETCH
+from .export_engine import SUPPORTED_FORMATS
 from tkinterdnd2 import DND_FILES
 
-SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+DRAG_FRAME_MS = 16  # 拖拽时每帧最多更新一次（约60fps）
+THUMBNAIL_POLL_MS = 15  # 后台线程有任务时读取结果的间隔
+LIST_THUMBNAIL_CACHE = 512  # 最多保留的列表缩略图数量（PhotoImage）
+PREVIEW_CACHE_BYTES = 128 * 1024 * 1024  # 带水印预览缓存的上限（字节）
+PREFETCH_PAGES = 1  # 在可见区域上下各预取几屏的缩略图
+_MISSING = object()
 
 class ImageUploader(Frame):
     def __init__(self, master):
         super().__init__(master)
-        self.images = []  # [(filepath, original_thumb_tk, watermarked_thumb_tk, original_image)]
+        self.images = []  # 图片路径列表，导入时只记录路径，缩略图和预览按需生成
+        self.image_set = set()  # 与 images 相同的路径，用于判断重复
+        self.proxy_cache = PreviewProxyCache()  # 预览代理图缓存
+        # 带水印的预览，按图片和影响渲染的设置内容的哈希缓存：来回切换图片或撤销设置修改时不再渲染
+        self.preview_cache = LRUCache(max_entries=None, max_bytes=PREVIEW_CACHE_BYTES, sizeof=image_nbytes)
+        self.list_thumbnails = LRUCache(LIST_THUMBNAIL_CACHE)  # {路径: 列表缩略图PhotoImage，生成失败时为None}
+        # 缩略图和预览在后台线程生成：选中的图片 -> 可见的行 -> 预取
+        self.thumbnail_pool = ThumbnailPool()
+        self.thumbnail_poll_id = None
+        self.preview_tk = None  # 选中图片带水印的预览（只保留当前这一张）
+        self.original_preview_tk = None  # 拖拽水印时显示的无水印代理图
         self.selected_index = None
         self.watermark_options = None
         self.current_watermark_pos = None
         self.dragging_watermark = False
         self.drag_start_pos = None
         self.saved_scroll_position = (0.0, 0.0)  # 保存滚动位置
+        self.drag_overlay = None  # 拖拽中的水印画布元素 (item, PhotoImage, 快照, 代理图尺寸, 缩放比例)
+        self.pending_drag_position = None  # 尚未绘制的最新拖拽位置
+        self.drag_after_id = None  # 已安排的拖拽帧回调
         
         # 左侧区域：文件列表
         left_frame = Frame(self)
@@ -23,14 +48,9 @@ class ImageUploader(Frame):
         
         # 图片列表及滚动条
         Label(left_frame, text="图片列表", font=("Arial", 10, "bold")).pack(pady=(0, 5))
-        self.file_list = Listbox(left_frame, width=25, height=15)
-        self.file_list.pack(side='left', fill='both', expand=True)
-        self.file_list.bind('<<ListboxSelect>>', self.show_thumbnail)
-
-        self.scrollbar = Scrollbar(left_frame)
-        self.scrollbar.pack(side='right', fill='y')
-        self.file_list.config(yscrollcommand=self.scrollbar.set)
-        self.scrollbar.config(command=self.file_list.yview)
+        self.file_list = ThumbnailList(left_frame, self.images, thumbnail_provider=self.list_thumbnail,
+                                       on_select=self.show_thumbnail, on_redraw=self.prefetch_thumbnails)
+        self.file_list.pack(fill='both', expand=True)
 
         # 右侧区域：拖拽上传和预览
         right_frame = Frame(self)
@@ -146,127 +166,124 @@ class ImageUploader(Frame):
     def upload_folder(self):
         folder = filedialog.askdirectory()
         if folder:
-            for fname in os.listdir(folder):
-                fpath = os.path.join(folder, fname)
-                if os.path.isfile(fpath) and fpath.lower().endswith(SUPPORTED_FORMATS):
-                    self.add_files([fpath])
+            with os.scandir(folder) as entries:
+                self.add_files(sorted(entry.path for entry in entries
+                                      if entry.is_file() and entry.name.lower().endswith(SUPPORTED_FORMATS)))
 
     def add_files(self, files):
+        """导入图片：只记录路径（不解码图片），列表一次刷新"""
+        added = False
         for f in files:
-            if f.lower().endswith(SUPPORTED_FORMATS) and f not in [img[0] for img in self.images]:
-                original_thumb_tk, watermarked_thumb_tk, original_img = self.make_thumbnails(f)
-                self.images.append((f, original_thumb_tk, watermarked_thumb_tk, original_img))
-                self.file_list.insert(END, os.path.basename(f))
-
-    def make_thumbnails(self, filepath):
-        """创建原始缩略图和水印缩略图 - 统一尺寸"""
-        try:
-            original_img = Image.open(filepath).convert("RGBA")
-            
-            # 统一缩略图尺寸
-            thumb_size = (800, 600)
-            
-            # 1. 原始缩略图
-            original_thumb = original_img.copy()
-            original_thumb.thumbnail(thumb_size, Image.Resampling.LANCZOS)
-            original_thumb_tk = ImageTk.PhotoImage(original_thumb)
-            
-            # 2. 水印缩略图 - 使用全局设置
-            watermarked_thumb = self.apply_watermark_to_thumbnail(original_img.copy())
-            watermarked_thumb.thumbnail(thumb_size, Image.Resampling.LANCZOS)
-            watermarked_thumb_tk = ImageTk.PhotoImage(watermarked_thumb)
-            
-            return original_thumb_tk, watermarked_thumb_tk, original_img
-        except Exception as e:
-            print(f"创建缩略图时出错: {e}")
-            return None, None, None
-
-    def apply_watermark_to_thumbnail(self, image):
-        """应用水印到缩略图（使用全局配置）"""
-        try:
-            # 使用全局水印设置应用水印
-            watermarked = self.apply_watermark_with_global_settings(image)
-            return watermarked
-        except Exception as e:
-            print(f"应用水印时出错: {e}")
-            return image
-
-    def apply_watermark_with_global_settings(self, image):
-        """使用全局水印设置应用水印"""
-        try:
-            # 检查是否使用自定义位置
-            if global_watermark_settings.use_custom_position and global_watermark_settings.custom_position:
-                # 使用自定义位置
-                rel_x, rel_y = global_watermark_settings.custom_position
-                return self.apply_watermark_with_custom_position(image, rel_x, rel_y)
-            else:
-                # 使用预设位置
-                if global_watermark_settings.watermark_type == "text":
-                    return self.watermark_options.text_options.apply_watermark(image)
-                else:
-                    return self.watermark_options.image_options.apply_watermark(image)
-        except Exception as e:
-            print(f"应用全局水印设置时出错: {e}")
-            return image
+            if f.lower().endswith(SUPPORTED_FORMATS) and f not in self.image_set:
+                self.image_set.add(f)
+                self.images.append(f)
+                added = True
+        if added:
+            self.file_list.refresh()
+
+    def list_thumbnail(self, index):
+        """列表第 index 行的缩略图，还没有生成时提交给后台线程并返回None"""
+        filepath = self.images[index]
+        thumb = self.list_thumbnails.get(filepath, _MISSING)
+        if thumb is not _MISSING:
+            return thumb
+        self.submit_job(('thumbnail', filepath), make_list_thumbnail, filepath, priority=PRIORITY_VISIBLE)
+        return None
+
+    def prefetch_thumbnails(self, visible):
+        """列表重绘后预取可见区域上下的缩略图，已经滚出这个范围的排队任务被取消"""
+        page = max(1, len(visible)) * PREFETCH_PAGES
+        nearby = range(max(0, visible.start - page), min(len(self.images), visible.stop + page))
+        wanted = {('thumbnail', self.images[i]) for i in nearby}
+        self.thumbnail_pool.retain('thumbnail', wanted)
+        for i in nearby:
+            if i not in visible and self.images[i] not in self.list_thumbnails:
+                self.submit_job(('thumbnail', self.images[i]), make_list_thumbnail, self.images[i])
+
+    def submit_job(self, key, func, *args, priority=PRIORITY_PREFETCH):
+        """提交后台任务，并在需要时开始轮询结果"""
+        self.thumbnail_pool.submit(key, func, *args, priority=priority)
+        if self.thumbnail_poll_id is None:
+            self.thumbnail_poll_id = self.after(THUMBNAIL_POLL_MS, self.poll_thumbnail_pool)
+
+    def poll_thumbnail_pool(self):
+        """在主线程中把后台线程生成的图片转换为 PhotoImage 并显示"""
+        self.thumbnail_poll_id = None
+        redraw_list = False
+        for (kind, filepath), result, error in self.thumbnail_pool.poll():
+            if error is not None:
+                print(f"{'更新预览' if kind == 'preview' else '创建缩略图'}时出错: {error}")
+            if kind == 'thumbnail':
+                # 生成失败时也记录下来（None），不再重试
+                self.list_thumbnails.put(filepath, ImageTk.PhotoImage(result) if result is not None else None)
+                redraw_list = True
+            elif kind == 'preview':
+                self.show_preview_result(filepath, result)
+        if redraw_list:
+            self.file_list.redraw()
+        if self.thumbnail_pool.busy:
+            self.thumbnail_poll_id = self.after(THUMBNAIL_POLL_MS, self.poll_thumbnail_pool)
+
+    def render_preview(self, filepath, snapshot=None):
+        """在预览代理图上渲染水印，设置按代理图的缩放比例换算，效果与原图导出一致"""
+        if snapshot is None:
+            snapshot = global_watermark_settings.snapshot()
+        cache_key = (filepath, os.path.getmtime(filepath), snapshot.render_digest, logo_signature(snapshot))
+        cached = self.preview_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        proxy, scale = self.proxy_cache.get_proxy(filepath)
+        # 字体对象在线程间共享，同一时间只渲染一张预览
+        with render_lock:
+            result = render_watermark(proxy, snapshot, scale)
+        self.preview_cache.put(cache_key, result)
+        return result
 
     def update_preview(self):
-        """更新所有图片的预览 - 使用全局配置"""
+        """更新预览 - 使用全局配置；只有选中的图片显示水印预览，其他图片在选中时再渲染"""
         print("更新预览...")  # 调试信息
         
-        for i, (filepath, original_thumb_tk, _, original_img) in enumerate(self.images):
-            try:
-                # 重新从文件加载图片，避免引用丢失
-                img = Image.open(filepath).convert("RGBA")
-                
-                # 应用水印 - 使用全局配置
-                watermarked_thumb = self.apply_watermark_with_global_settings(img.copy())
-                watermarked_thumb.thumbnail((800, 600), Image.Resampling.LANCZOS)
-                watermarked_thumb_tk = ImageTk.PhotoImage(watermarked_thumb)
-                
-                # 更新水印缩略图，保持原始缩略图和原图引用
-                self.images[i] = (filepath, original_thumb_tk, watermarked_thumb_tk, original_img)
-                
-            except Exception as e:
-                print(f"更新预览时出错: {e}")
-        
         # 刷新当前显示的预览
         if self.selected_index is not None:
             self.show_thumbnail(None)
             
     def show_thumbnail(self, event):
-        """显示选中的图片预览（带九宫格参考线）- 修复：确保使用最新的全局设置"""
-        selection = self.file_list.curselection()
-        if selection:
-            idx = selection[0]
+        """在后台渲染选中图片的预览 - 确保使用最新的全局设置；之前选中的图片或旧设置的预览任务被取消"""
+        idx = self.file_list.selection()
+        if idx is not None:
             self.selected_index = idx
+            filepath = self.images[idx]
             
-            # 保存当前滚动位置
-            current_scroll = self.canvas.yview()
-            
-            # 获取水印缩略图 - 重新应用水印确保使用最新的全局设置
-            filepath, original_thumb_tk, _, original_img = self.images[idx]
-            
-            try:
-                # 重新从文件加载图片并应用水印，确保使用最新的全局设置
-                img = Image.open(filepath).convert("RGBA")
-                watermarked_thumb = self.apply_watermark_with_global_settings(img.copy())
-                watermarked_thumb.thumbnail((800, 600), Image.Resampling.LANCZOS)
-                watermarked_thumb_tk = ImageTk.PhotoImage(watermarked_thumb)
-                
-                # 更新图片数据
-                self.images[idx] = (filepath, original_thumb_tk, watermarked_thumb_tk, original_img)
-            except Exception as e:
-                print(f"更新预览时出错: {e}")
-                watermarked_thumb_tk = self.images[idx][2]  # 使用旧的缩略图
-            
-            if watermarked_thumb_tk:
-                self.canvas.delete("all")
-                
-                # 显示完整图片
-                self.create_preview_with_grid(watermarked_thumb_tk)
-                
-                # 恢复滚动位置
-                self.canvas.yview_moveto(current_scroll[0])
+            self.thumbnail_pool.cancel('preview')
+            self.submit_job(('preview', filepath), self.render_preview, filepath,
+                            global_watermark_settings.snapshot(), priority=PRIORITY_SELECTED)
+            # 预先解码相邻图片的代理图，用方向键切换时预览更快
+            for neighbor in (idx + 1, idx - 1):
+                if 0 <= neighbor < len(self.images):
+                    self.submit_job(('proxy', self.images[neighbor]), self.proxy_cache.get_proxy,
+                                    self.images[neighbor])
+
+    def show_preview_result(self, filepath, watermarked_img):
+        """显示后台渲染好的预览（带九宫格参考线）"""
+        if self.selected_index is None or self.images[self.selected_index] != filepath:
+            return
+        # 拖拽中不替换预览，松开鼠标后会重新渲染
+        if watermarked_img is None or self.dragging_watermark:
+            return
+        
+        # 保存当前滚动位置
+        current_scroll = self.canvas.yview()
+        
+        self.preview_tk = ImageTk.PhotoImage(watermarked_img)
+        self.original_preview_tk = None
+        self.canvas.delete("all")
+        
+        # 显示完整图片
+        self.create_preview_with_grid(self.preview_tk)
+        
+        # 恢复滚动位置
+        self.canvas.yview_moveto(current_scroll[0])
 
     def create_preview_with_grid(self, thumb_image):
         """创建带九宫格参考线的预览 - 修改版：添加图片上边距"""
@@ -320,112 +337,122 @@ class ImageUploader(Frame):
         # 更新预览
         self.update_preview()
 
+    def event_to_relative_position(self, event):
+        """把鼠标事件坐标换算为预览图内的相对坐标 (rel_x, rel_y)，不在预览图上时返回None"""
+        img_items = self.canvas.find_withtag("preview_image")
+        if not img_items or self.selected_index is None or self.preview_tk is None:
+            return None
+        
+        # 使用 canvasx/canvasy 获取相对于画布的真实坐标（考虑滚动）
+        canvas_x = self.canvas.canvasx(event.x)
+        canvas_y = self.canvas.canvasy(event.y)
+        
+        img_x, img_y = self.canvas.coords(img_items[0])
+        img_width = self.preview_tk.width()
+        img_height = self.preview_tk.height()
+        if img_width <= 0 or img_height <= 0:
+            return None
+        
+        # 计算鼠标位置在图片内的相对坐标并限制在0-1范围
+        rel_x = max(0, min(1, (canvas_x - img_x) / img_width))
+        rel_y = max(0, min(1, (canvas_y - img_y) / img_height))
+        return rel_x, rel_y
+
     def on_watermark_press(self, event):
-        """鼠标按下事件 - 开始拖拽水印"""
+        """鼠标按下事件 - 开始拖拽水印：预览换成无水印的代理图，水印作为单独的画布元素移动"""
         # 检查是否点击在图片区域内
         items = self.canvas.find_overlapping(event.x, event.y, event.x, event.y)
-        if items and "preview_image" in self.canvas.gettags(items[0]):
-            self.dragging_watermark = True
-            self.drag_start_pos = (event.x, event.y)
-            
-            # 保存当前的滚动位置
-            self.saved_scroll_position = self.canvas.yview()
-            
-            # 获取图片位置和尺寸
-            img_items = self.canvas.find_withtag("preview_image")
-            if img_items:
-                # 使用 canvasx/canvasy 获取相对于画布的真实坐标（考虑滚动）
-                canvas_x = self.canvas.canvasx(event.x)
-                canvas_y = self.canvas.canvasy(event.y)
-                
-                img_coords = self.canvas.coords(img_items[0])
-                img_x, img_y = img_coords
-                img_width = self.images[self.selected_index][2].width() if self.selected_index is not None else 0
-                img_height = self.images[self.selected_index][2].height() if self.selected_index is not None else 0
-                
-                if img_width > 0 and img_height > 0:
-                    # 计算点击位置在图片内的相对坐标（0-1范围）
-                    rel_x = (canvas_x - img_x) / img_width
-                    rel_y = (canvas_y - img_y) / img_height
-                    
-                    # 限制在图片范围内
-                    rel_x = max(0, min(1, rel_x))
-                    rel_y = max(0, min(1, rel_y))
-                    
-                    print(f"点击位置: 相对坐标({rel_x:.2f}, {rel_y:.2f}), 画布坐标({canvas_x}, {canvas_y})")
-                    
-                    # 立即更新水印位置到点击位置 - 使用全局配置
-                    self.set_custom_watermark_position(rel_x, rel_y)
+        if not (items and "preview_image" in self.canvas.gettags(items[0])):
+            return
+        
+        rel_pos = self.event_to_relative_position(event)
+        if rel_pos is None:
+            return
+        
+        self.dragging_watermark = True
+        self.drag_start_pos = (event.x, event.y)
+        
+        # 保存当前的滚动位置
+        self.saved_scroll_position = self.canvas.yview()
+        
+        print(f"点击位置: 相对坐标({rel_pos[0]:.2f}, {rel_pos[1]:.2f})")
+        self.start_drag_overlay()
+        self.pending_drag_position = rel_pos
+        self.apply_pending_drag()
+
+    def start_drag_overlay(self):
+        """创建拖拽用的水印画布元素"""
+        filepath = self.images[self.selected_index]
+        proxy, scale = self.proxy_cache.get_proxy(filepath)
+        snapshot = global_watermark_settings.snapshot()._replace(use_custom_position=True)
+        
+        self.drag_overlay = None
+        overlay = build_overlay(snapshot._replace(custom_position=(0, 0)), proxy.size, scale)
+        if overlay is None:
+            return
+        
+        # 预览图换成不带水印的代理图
+        img_items = self.canvas.find_withtag("preview_image")
+        if img_items:
+            if self.original_preview_tk is None:
+                self.original_preview_tk = ImageTk.PhotoImage(proxy)
+            self.canvas.itemconfig(img_items[0], image=self.original_preview_tk)
+        
+        sprite_tk = ImageTk.PhotoImage(overlay[0])
+        item = self.canvas.create_image(0, 0, anchor=NW, image=sprite_tk, tags="watermark_overlay")
+        self.drag_overlay = (item, sprite_tk, snapshot, proxy.size, scale)
 
     def on_watermark_drag(self, event):
-        """鼠标拖拽事件 - 实时更新水印位置"""
-        if self.dragging_watermark:
-            # 检查是否在图片区域内
-            items = self.canvas.find_overlapping(event.x, event.y, event.x, event.y)
-            if items and "preview_image" in self.canvas.gettags(items[0]):
-                # 获取图片位置和尺寸
-                img_items = self.canvas.find_withtag("preview_image")
-                if img_items:
-                    # 使用 canvasx/canvasy 获取相对于画布的真实坐标（考虑滚动）
-                    canvas_x = self.canvas.canvasx(event.x)
-                    canvas_y = self.canvas.canvasy(event.y)
-                    
-                    img_coords = self.canvas.coords(img_items[0])
-                    img_x, img_y = img_coords
-                    img_width = self.images[self.selected_index][2].width() if self.selected_index is not None else 0
-                    img_height = self.images[self.selected_index][2].height() if self.selected_index is not None else 0
-                    
-                    if img_width > 0 and img_height > 0:
-                        # 计算鼠标位置在图片内的相对坐标（0-1范围）
-                        rel_x = (canvas_x - img_x) / img_width
-                        rel_y = (canvas_y - img_y) / img_height
-                        
-                        # 限制在图片范围内
-                        rel_x = max(0, min(1, rel_x))
-                        rel_y = max(0, min(1, rel_y))
-                        
-                        # 实时更新水印位置 - 使用全局配置
-                        self.set_custom_watermark_position(rel_x, rel_y)
-                        
-                        # 恢复滚动位置
-                        self.canvas.yview_moveto(self.saved_scroll_position[0])
+        """鼠标拖拽事件 - 记录最新位置，每帧最多移动一次水印元素"""
+        if not self.dragging_watermark:
+            return
+        
+        rel_pos = self.event_to_relative_position(event)
+        if rel_pos is None:
+            return
+        
+        self.pending_drag_position = rel_pos
+        if self.drag_after_id is None:
+            self.drag_after_id = self.after(DRAG_FRAME_MS, self.apply_pending_drag)
+
+    def apply_pending_drag(self):
+        """把水印画布元素移动到最近一次记录的拖拽位置"""
+        self.drag_after_id = None
+        if not self.drag_overlay or self.pending_drag_position is None:
+            return
+        
+        item, _, snapshot, image_size, scale = self.drag_overlay
+        overlay = build_overlay(snapshot._replace(custom_position=self.pending_drag_position), image_size, scale)
+        img_items = self.canvas.find_withtag("preview_image")
+        if overlay is None or not img_items:
+            return
+        
+        img_x, img_y = self.canvas.coords(img_items[0])
+        x, y = overlay[1]
+        self.canvas.coords(item, img_x + x, img_y + y)
 
     def on_watermark_release(self, event):
-        """鼠标释放事件 - 结束拖拽水印"""
-        if self.dragging_watermark:
-            self.dragging_watermark = False
-            
-            # 检查是否释放在图片区域内
-            items = self.canvas.find_overlapping(event.x, event.y, event.x, event.y)
-            if items and "preview_image" in self.canvas.gettags(items[0]):
-                # 获取图片位置和尺寸
-                img_items = self.canvas.find_withtag("preview_image")
-                if img_items:
-                    # 使用 canvasx/canvasy 获取相对于画布的真实坐标（考虑滚动）
-                    canvas_x = self.canvas.canvasx(event.x)
-                    canvas_y = self.canvas.canvasy(event.y)
-                    
-                    img_coords = self.canvas.coords(img_items[0])
-                    img_x, img_y = img_coords
-                    img_width = self.images[self.selected_index][2].width() if self.selected_index is not None else 0
-                    img_height = self.images[self.selected_index][2].height() if self.selected_index is not None else 0
-                    
-                    if img_width > 0 and img_height > 0:
-                        # 计算释放位置在图片内的相对坐标（0-1范围）
-                        rel_x = (canvas_x - img_x) / img_width
-                        rel_y = (canvas_y - img_y) / img_height
-                        
-                        # 限制在图片范围内
-                        rel_x = max(0, min(1, rel_x))
-                        rel_y = max(0, min(1, rel_y))
-                        
-                        print(f"释放位置: 相对坐标({rel_x:.2f}, {rel_y:.2f}), 画布坐标({canvas_x}, {canvas_y})")
-                        
-                        # 最终更新水印位置 - 使用全局配置
-                        self.set_custom_watermark_position(rel_x, rel_y)
-            
-            # 恢复滚动位置
-            self.canvas.yview_moveto(self.saved_scroll_position[0])
+        """鼠标释放事件 - 结束拖拽，只在这里真正合成一次水印"""
+        if not self.dragging_watermark:
+            return
+        self.dragging_watermark = False
+        
+        if self.drag_after_id is not None:
+            self.after_cancel(self.drag_after_id)
+            self.drag_after_id = None
+        
+        rel_pos = self.event_to_relative_position(event) or self.pending_drag_position
+        self.pending_drag_position = None
+        self.drag_overlay = None
+        # 水印画布元素保留到新的预览在后台渲染完成（重绘预览时一起删除），避免水印闪烁
+        
+        if rel_pos is not None:
+            print(f"释放位置: 相对坐标({rel_pos[0]:.2f}, {rel_pos[1]:.2f})")
+            # 最终更新水印位置 - 使用全局配置
+            self.set_custom_watermark_position(*rel_pos)
+        
+        # 恢复滚动位置
+        self.canvas.yview_moveto(self.saved_scroll_position[0])
 
     def set_custom_watermark_position(self, rel_x, rel_y):
         """设置自定义水印位置（基于相对坐标）- 使用全局配置"""
@@ -443,23 +470,7 @@ class ImageUploader(Frame):
                 # 保存当前滚动位置
                 current_scroll = self.canvas.yview()
                 
-                # 获取原图
-                filepath, _, _, original_img = self.images[self.selected_index]
-                img = Image.open(filepath).convert("RGBA")
-                
-                # 应用水印到原图（使用自定义位置）
-                watermarked_img = self.apply_watermark_with_custom_position(img.copy(), rel_x, rel_y)
-                
-                # 创建缩略图
-                watermarked_thumb = watermarked_img.copy()
-                watermarked_thumb.thumbnail((800, 600), Image.Resampling.LANCZOS)
-                watermarked_thumb_tk = ImageTk.PhotoImage(watermarked_thumb)
-                
-                # 更新图片数据
-                original_thumb_tk = self.images[self.selected_index][1]
-                self.images[self.selected_index] = (filepath, original_thumb_tk, watermarked_thumb_tk, original_img)
-                
-                # 刷新显示
+                # 刷新显示 - show_thumbnail 会在后台按新的自定义位置在代理图上渲染一次
                 self.show_thumbnail(None)
                 
                 # 恢复滚动位置
@@ -468,179 +479,18 @@ class ImageUploader(Frame):
             except Exception as e:
                 print(f"更新自定义位置水印时出错: {e}")
 
-    def apply_watermark_with_custom_position(self, image, rel_x, rel_y):
-        """使用自定义位置应用水印"""
-        if not self.watermark_options:
-            return image
-        
-        if global_watermark_settings.watermark_type == "text":
-            return self.apply_text_watermark_custom(image, rel_x, rel_y)
-        else:
-            return self.apply_image_watermark_custom(image, rel_x, rel_y)
-
-    def apply_text_watermark_custom(self, image, rel_x, rel_y):
-        """应用文本水印到自定义位置 - 使用全局设置中的字号"""
-        if not global_watermark_settings.text_settings['text'].strip():
-            return image
-            
-        # 创建水印层
-        watermark = Image.new("RGBA", image.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(watermark)
-        
-        # 修复：直接从全局设置中获取字号，不使用固定比例
-        # 确保字号有效
-        font_size = global_watermark_settings.text_settings['font_size']
-        if font_size < 12:  # 设置最小字号限制
-            font_size = 12
-        print(f"应用文本水印 - 使用全局字号: {font_size}")  # 调试信息
-        
-        # 重新创建字体对象
-        font_family = global_watermark_settings.text_settings['font_family']
-        is_bold = global_watermark_settings.text_settings['bold'] == 1
-        is_italic = global_watermark_settings.text_settings['italic'] == 1
-        
-        if is_bold and is_italic:
-            font_name = f"{font_family} Bold Italic"
-        elif is_bold:
-            font_name = f"{font_family} Bold"
-        elif is_italic:
-            font_name = f"{font_family} Italic"
-        else:
-            font_name = font_family
-        
-        try:
-            font = ImageFont.truetype(font_name, font_size)
-        except:
-            try:
-                base_font = ImageFont.truetype(font_family, font_size)
-                if is_bold and is_italic:
-                    font = base_font.font_variant(bold=True, italic=True)
-                elif is_bold:
-                    font = base_font.font_variant(bold=True)
-                elif is_italic:
-                    font = base_font.font_variant(italic=True)
-                else:
-                    font = base_font
-            except:
-                font = ImageFont.load_default()
-        
-        # 获取文本
-        text = global_watermark_settings.text_settings['text']
-        
-        # 计算文本尺寸
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except:
-            text_width = len(text) * font_size // 2
-            text_height = font_size
-        
-        # 计算自定义位置（将相对坐标转换为绝对坐标）
-        img_width, img_height = image.size
-        position_x = int(rel_x * (img_width - text_width))
-        position_y = int(rel_y * (img_height - text_height))
-        
-        # 设置透明度
-        opacity = int(255 * global_watermark_settings.text_settings['opacity'] / 100)
-        color = global_watermark_settings.text_settings['color']
-        fill_color = self.watermark_options.text_options.hex_to_rgba(color, opacity)
-        
-        # 应用样式效果
-        if global_watermark_settings.text_settings['stroke']:
-            self.watermark_options.text_options.add_stroke(draw, text, (position_x, position_y), font, fill_color)
-        elif global_watermark_settings.text_settings['shadow']:
-            self.watermark_options.text_options.add_shadow(draw, text, (position_x, position_y), font, fill_color)
-        else:
-            draw.text((position_x, position_y), text, font=font, fill=fill_color)
-        
-        # 合并水印和原图
-        return Image.alpha_composite(image.convert("RGBA"), watermark)
-
-    def apply_image_watermark_custom(self, image, rel_x, rel_y):
-        """应用图片水印到自定义位置"""
-        if not global_watermark_settings.image_settings['image_path']:
-            return image
-            
-        try:
-            # 打开水印图片
-            watermark = Image.open(global_watermark_settings.image_settings['image_path']).convert("RGBA")
-            
-            # 缩放水印 - 使用全局设置中的缩放比例
-            base_size = min(image.width, image.height)
-            scale_factor = global_watermark_settings.image_settings['scale_percent'] / 100.0
-            
-            # 使用固定比例而不是绝对值
-            target_size = int(base_size * scale_factor * 0.15)  # 15% 的图片高度
-            
-            # 保持水印图片的宽高比
-            wm_ratio = watermark.width / watermark.height
-            if wm_ratio > 1:
-                new_width = target_size
-                new_height = int(target_size / wm_ratio)
-            else:
-                new_height = target_size
-                new_width = int(target_size * wm_ratio)
-            
-            # 确保水印不会太小或太大
-            min_size = base_size * 0.05  # 最小5%
-            max_size = base_size * 0.3   # 最大30%
-            
-            if new_width < min_size or new_height < min_size:
-                if new_width < new_height:
-                    new_width = int(min_size)
-                    new_height = int(min_size / wm_ratio)
-                else:
-                    new_height = int(min_size)
-                    new_width = int(min_size * wm_ratio)
-            elif new_width > max_size or new_height > max_size:
-                if new_width > new_height:
-                    new_width = int(max_size)
-                    new_height = int(max_size / wm_ratio)
-                else:
-                    new_height = int(max_size)
-                    new_width = int(max_size * wm_ratio)
-            
-            watermark = watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 使用全局设置中的透明度
-            opacity = global_watermark_settings.image_settings['opacity'] / 100.0
-            watermark = self.apply_opacity_to_image(watermark, opacity)
-            
-            # 计算自定义位置（将相对坐标转换为绝对坐标）
-            img_width, img_height = image.size
-            position_x = int(rel_x * (img_width - new_width))
-            position_y = int(rel_y * (img_height - new_height))
-            
-            # 创建结果图片
-            result = image.convert("RGBA")
-            result.paste(watermark, (position_x, position_y), watermark)
-            
-            return result
-            
-        except Exception as e:
-            print(f"应用自定义位置图片水印时出错: {e}")
-            return image
-
-    def apply_opacity_to_image(self, image, opacity):
-        """调整图片透明度"""
-        if opacity >= 1.0:
-            return image
-            
-        # 创建一个新的alpha通道
-        alpha = image.split()[3]
-        alpha = alpha.point(lambda p: p * opacity)
-        image.putalpha(alpha)
-        return image
-
     def delete_selected(self):
-        selection = self.file_list.curselection()
-        if selection:
-            idx = selection[0]
-            self.file_list.delete(idx)
-            del self.images[idx]
+        idx = self.file_list.selection()
+        if idx is not None:
+            filepath = self.images.pop(idx)
+            self.image_set.discard(filepath)
+            self.thumbnail_pool.cancel('preview')
+            self.file_list.clear_selection()
+            self.file_list.refresh()
             self.canvas.delete("all")
             self.selected_index = None
+            self.preview_tk = None
+            self.original_preview_tk = None
             self.canvas.configure(scrollregion=(0, 0, 600, 800))
 
     def drop_files(self, event):
@@ -654,4 +504,27 @@ class ImageUploader(Frame):
                             all_files.append(os.path.join(root, fname))
             else:
                 all_files.append(f)
-        self.add_files(all_files)
\ No newline at end of file
+        self.add_files(all_files)
+
+    def destroy(self):
+        self.thumbnail_pool.close()
+        super().destroy()
+
+
+def make_list_thumbnail(filepath):
+    """在后台线程中生成列表缩略图（PIL图片）"""
+    thumb, _ = build_proxy(filepath, THUMB_SIZE)
+    return thumb
+
+
+def logo_signature(snapshot):
+    """图片水印的水印图片版本（替换了同名的水印图片后预览缓存失效），文本水印或文件不存在时为None"""
+    image_path = snapshot.image_settings['image_path']
+    if snapshot.watermark_type != "image" or not image_path:
+        return None
+    try:
+        signature = source_signature(image_path)
+    except OSError:
+        return None
+    # 文件的版本是 [修改时间, 大小]，转为元组才能作为缓存键
+    return tuple(signature) if isinstance(signature, list) else signature
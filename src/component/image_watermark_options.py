@@ -1,7 +1,6 @@
 import os
 from tkinter import Frame, Label, Button, Entry, Scale, StringVar, OptionMenu, END
 from tkinter import filedialog, colorchooser
-from PIL import Image, ImageTk
 from .watermark_settings import global_watermark_settings
 
 class ImageWatermarkOptions(Frame):
@@ -101,115 +100,6 @@ class ImageWatermarkOptions(Frame):
         except Exception as e:
             print(f"位置变化处理出错: {e}")
 
-    def apply_watermark(self, image):
-        """应用图片水印到图片"""
-        if image is None:
-            print("错误: 图片对象为None")
-            return None
-            
-        if not global_watermark_settings.image_settings['image_path']:
-            return image
-            
-        try:
-            # 打开水印图片
-            watermark = Image.open(global_watermark_settings.image_settings['image_path']).convert("RGBA")
-            
-            # 使用全局设置中的缩放比例
-            base_size = min(image.width, image.height)
-            scale_factor = global_watermark_settings.image_settings['scale_percent'] / 100.0
-            
-            # 使用固定比例而不是绝对值
-            target_size = int(base_size * scale_factor * 0.15)  # 15% 的图片高度
-            
-            # 保持水印图片的宽高比
-            wm_ratio = watermark.width / watermark.height
-            if wm_ratio > 1:
-                new_width = target_size
-                new_height = int(target_size / wm_ratio)
-            else:
-                new_height = target_size
-                new_width = int(target_size * wm_ratio)
-            
-            # 确保水印不会太小或太大
-            min_size = base_size * 0.05  # 最小5%
-            max_size = base_size * 0.3   # 最大30%
-            
-            if new_width < min_size or new_height < min_size:
-                if new_width < new_height:
-                    new_width = int(min_size)
-                    new_height = int(min_size / wm_ratio)
-                else:
-                    new_height = int(min_size)
-                    new_width = int(min_size * wm_ratio)
-            elif new_width > max_size or new_height > max_size:
-                if new_width > new_height:
-                    new_width = int(max_size)
-                    new_height = int(max_size / wm_ratio)
-                else:
-                    new_height = int(max_size)
-                    new_width = int(max_size * wm_ratio)
-            
-            watermark = watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 使用全局设置中的透明度
-            opacity = global_watermark_settings.image_settings['opacity'] / 100.0
-            watermark = self.apply_opacity_to_image(watermark, opacity)
-            
-            # 计算位置
-            position = self.get_watermark_position(image.size, (new_width, new_height))
-            
-            # 创建结果图片
-            result = image.convert("RGBA")
-            result.paste(watermark, position, watermark)
-            
-            return result
-            
-        except Exception as e:
-            print(f"应用图片水印时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return image
-    
-    def get_watermark_position(self, image_size, watermark_size):
-        """根据位置设置计算水印坐标"""
-        img_width, img_height = image_size
-        wm_width, wm_height = watermark_size
-        
-        position = global_watermark_settings.image_settings['position']
-        margin = 20  # 边距
-        
-        if position == "center":
-            return ((img_width - wm_width) // 2, (img_height - wm_height) // 2)
-        elif position == "top-left":
-            return (margin, margin)
-        elif position == "top":
-            return ((img_width - wm_width) // 2, margin)
-        elif position == "top-right":
-            return (img_width - wm_width - margin, margin)
-        elif position == "left":
-            return (margin, (img_height - wm_height) // 2)
-        elif position == "right":
-            return (img_width - wm_width - margin, (img_height - wm_height) // 2)
-        elif position == "bottom-left":
-            return (margin, img_height - wm_height - margin)
-        elif position == "bottom":
-            return ((img_width - wm_width) // 2, img_height - wm_height - margin)
-        elif position == "bottom-right":
-            return (img_width - wm_width - margin, img_height - wm_height - margin)
-        else:
-            return (margin, margin)  # 默认位置
-
-    def apply_opacity_to_image(self, image, opacity):
-        """调整图片透明度"""
-        if opacity >= 1.0:
-            return image
-            
-        # 创建一个新的alpha通道
-        alpha = image.split()[3]
-        alpha = alpha.point(lambda p: p * opacity)
-        image.putalpha(alpha)
-        return image
-
     def get_settings(self):
         """获取当前图片水印设置"""
         return global_watermark_settings.image_settings.copy()
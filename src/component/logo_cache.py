@@ -0,0 +1,58 @@
+"""水印图片缓存 - 批量处理时水印图片只解码一次，缩放和透明度处理的结果按尺寸复用"""
+import os
+from PIL import Image
+from .lru_cache import LRUCache, image_nbytes
+from .asset_store import global_asset_store, is_asset_ref
+
+
+class LogoCache:
+    """水印图片缓存，按占用字节数淘汰
+
+    解码后的原图以 (路径, 修改时间) 为键，处理后的水印以
+    (路径, 修改时间, 目标尺寸, 透明度) 为键，文件被修改后旧条目自然失效。
+    路径也可以是资源引用（asset:<哈希>），内容不会变，以引用本身代替修改时间。
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self._cache = LRUCache(max_entries=None, max_bytes=max_bytes, sizeof=image_nbytes)
+
+    def get_source(self, image_path):
+        """获取解码后的RGBA水印原图，返回 (修改时间, 图片)"""
+        if is_asset_ref(image_path):
+            image = self._cache.get_or_create(
+                ('source', image_path, image_path), lambda: _decode(global_asset_store.open(image_path)))
+            return image_path, image
+        mtime = os.path.getmtime(image_path)
+        image = self._cache.get_or_create(
+            ('source', image_path, mtime), lambda: _decode(image_path))
+        return mtime, image
+
+    def put_source(self, image_path, mtime, image):
+        """直接放入解码好的RGBA原图（mtime 为 os.path.getmtime 的结果），之后 get_source 不再解码文件"""
+        self._cache.put(('source', image_path, mtime), image)
+
+    def get_logo(self, image_path, size, opacity, prepare):
+        """获取缩放到 size 并应用了透明度（0~100）的水印图片
+
+        prepare(source) 负责实际的缩放和透明度处理，只在缓存未命中时调用。
+        返回的图片是共享的，调用方不能修改它。
+        """
+        mtime, source = self.get_source(image_path)
+        return self._cache.get_or_create(
+            ('sized', image_path, mtime, tuple(size), opacity), lambda: prepare(source))
+
+    def stats(self):
+        """返回缓存统计信息"""
+        return self._cache.stats()
+
+    def clear(self):
+        """清空缓存"""
+        self._cache.clear()
+
+
+def _decode(source):
+    with Image.open(source) as image:
+        return image.convert("RGBA")
+
+
+# 创建全局水印图片缓存实例
+global_logo_cache = LogoCache()
@@ -0,0 +1,98 @@
+"""线程安全的LRU缓存，带命中/未命中计数"""
+import threading
+from collections import OrderedDict
+
+
+def image_nbytes(image):
+    """估算PIL图片占用的内存字节数"""
+    return image.width * image.height * len(image.getbands())
+
+
+class LRUCache:
+    """LRU缓存，可按条目数和/或字节数限制大小
+
+    max_bytes 不为 None 时需要提供 sizeof(value) 用于计算每个条目的字节数。
+    """
+    def __init__(self, max_entries=128, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.current_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """读取缓存，命中时将条目移到最近使用的位置"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.current_bytes -= self._sizes.pop(key, 0)
+            self._data[key] = value
+            if self.sizeof is not None:
+                size = self.sizeof(value)
+                self._sizes[key] = size
+                self.current_bytes += size
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        """读取缓存，未命中时调用 factory() 创建并写入"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        # 在锁外创建，避免耗时操作阻塞其他线程
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def _evict(self):
+        while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries) or
+                (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            key, _ = self._data.popitem(last=False)
+            self.current_bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存（保留统计数据）"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
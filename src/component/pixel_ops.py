@@ -0,0 +1,21 @@
+"""像素操作 - 透明度缩放和通道提取，使用预先计算的查找表"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=128)
+def opacity_lut(opacity):
+    """返回把 alpha 值乘以 opacity（0~1）的256项查找表"""
+    return tuple(round(p * opacity) for p in range(256))
+
+
+def extract_alpha(image):
+    """只取出 alpha 通道，不拆分其余通道"""
+    return image.getchannel('A')
+
+
+def scale_alpha(image, opacity):
+    """原地把RGBA图片的透明度乘以 opacity（0~1），返回该图片"""
+    if opacity >= 1.0:
+        return image
+    image.putalpha(extract_alpha(image).point(list(opacity_lut(opacity))))
+    return image
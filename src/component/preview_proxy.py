@@ -0,0 +1,39 @@
+"""预览代理图 - 预览只在缩小后的代理图上渲染水印，不再处理全分辨率原图"""
+import os
+from PIL import Image
+from .lru_cache import LRUCache, image_nbytes
+
+# 预览代理图的最大尺寸
+PREVIEW_SIZE = (800, 600)
+
+
+def build_proxy(filepath, size=PREVIEW_SIZE):
+    """解码并缩小图片，返回 (代理图, 代理图相对原图的缩放比例)"""
+    with Image.open(filepath) as img:
+        full_width = img.width
+        # JPEG 可以直接按 1/2、1/4、1/8 解码，避免解码全分辨率
+        img.draft(None, size)
+        proxy = img.convert("RGBA")
+    proxy.thumbnail(size, Image.Resampling.LANCZOS)
+    return proxy, proxy.width / full_width
+
+
+class PreviewProxyCache:
+    """以 (路径, 修改时间) 为键的代理图缓存，按占用字节数淘汰"""
+    def __init__(self, max_bytes=192 * 1024 * 1024, size=PREVIEW_SIZE):
+        self.size = size
+        self._cache = LRUCache(max_entries=None, max_bytes=max_bytes,
+                               sizeof=lambda entry: image_nbytes(entry[0]))
+
+    def get_proxy(self, filepath):
+        """获取代理图，返回 (代理图, 缩放比例)；返回的图片是共享的，调用方不能修改它"""
+        key = (filepath, os.path.getmtime(filepath))
+        return self._cache.get_or_create(key, lambda: build_proxy(filepath, self.size))
+
+    def stats(self):
+        """返回缓存统计信息"""
+        return self._cache.stats()
+
+    def clear(self):
+        """清空缓存"""
+        self._cache.clear()
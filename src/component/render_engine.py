@@ -0,0 +1,368 @@
+"""水印渲染引擎 - 不依赖Tk，输入设置快照和图片，输出加好水印的图片"""
+import threading
+from collections import namedtuple
+from PIL import Image, ImageDraw
+from .font_cache import global_font_cache
+from .logo_cache import global_logo_cache
+from .pixel_ops import scale_alpha
+from .lru_cache import LRUCache
+
+# 预设位置的边距
+MARGIN = 20
+# 文本水印的最小字号
+MIN_FONT_SIZE = 12
+
+PRESET_POSITIONS = ["top-left", "top", "top-right",
+                    "left", "center", "right",
+                    "bottom-left", "bottom", "bottom-right"]
+
+# 缓存的 FreeType 字体对象在所有线程间共享，不能同时用于绘制；
+# 同一进程中多个线程渲染水印时，绘制期间持有这个锁（解码、缩放和编码不需要）
+render_lock = threading.Lock()
+
+
+def render_watermark(image, snapshot, scale=1.0, in_place=False, strict=False):
+    """根据设置快照给图片添加水印，返回RGBA结果；出错时返回原图（strict 为 True 时抛出异常）
+
+    scale 用于在缩小的预览图上渲染：字号、描边宽度、阴影偏移和边距等
+    以像素为单位的设置都会乘以该比例，使结果与原图导出后再缩小一致。
+    in_place 为 True 且 image 已是RGBA时直接在 image 上绘制，省去一份整图拷贝（导出时使用）。
+    界面预览出错时仍显示原图；导出使用 strict=True，失败的图片计为失败，不会当作成功写出没有水印的文件。
+    """
+    if image is None:
+        print("错误: 图片对象为None")
+        return None
+
+    custom_position = snapshot.active_custom_position
+    try:
+        if snapshot.watermark_type == "text":
+            return render_text_watermark(image, snapshot.text_settings, custom_position, scale, in_place)
+        return render_image_watermark(image, snapshot.image_settings, custom_position, scale, in_place)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"应用水印时出错: {e}")
+        import traceback
+        traceback.print_exc()
+        return image
+
+
+def preload_resources(snapshot):
+    """提前加载快照用到的字体、文本图层和水印图片，让第一次渲染不必等待（常驻服务启动时使用）"""
+    try:
+        if snapshot.watermark_type == "text":
+            get_text_sprite(snapshot.text_settings)
+        elif snapshot.image_settings['image_path']:
+            global_logo_cache.get_source(snapshot.image_settings['image_path'])
+    except Exception as e:
+        print(f"预加载水印资源出错: {e}")
+
+
+def scale_length(value, scale):
+    """按比例缩放以像素为单位的长度，非零值至少保留1像素"""
+    if scale == 1.0 or not value:
+        return value
+    return max(1, int(round(value * scale)))
+
+
+def font_size_from_settings(text_settings, scale=1.0):
+    """实际使用的字号：先应用最小字号限制，再按比例缩放"""
+    return scale_length(max(text_settings['font_size'], MIN_FONT_SIZE), scale)
+
+
+def build_overlay(snapshot, image_size, scale=1.0):
+    """只计算水印图层及其在目标图片上的左上角坐标，不做合成
+
+    返回 (图层, (x, y))，没有水印时返回 None。图层是共享的缓存对象，调用方不能修改它。
+    用于拖拽时在画布上单独移动水印。
+    """
+    custom_position = snapshot.active_custom_position
+    if snapshot.watermark_type == "text":
+        return text_overlay(snapshot.text_settings, image_size, custom_position, scale)
+    return image_overlay(snapshot.image_settings, image_size, custom_position, scale)
+
+
+def font_from_settings(text_settings, scale=1.0):
+    """根据文本水印设置加载字体（应用最小字号限制）"""
+    font_size = font_size_from_settings(text_settings, scale)
+    return global_font_cache.get_font(text_settings['font_family'], font_size,
+                                      text_settings['bold'] == 1, text_settings['italic'] == 1,
+                                      text_settings['font_index'])
+
+
+def hex_to_rgba(hex_color, alpha):
+    """将十六进制颜色转换为RGBA"""
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return (r, g, b, alpha)
+
+
+def get_preset_position(position, image_size, watermark_size, margin=MARGIN):
+    """根据九宫格预设位置计算水印左上角坐标"""
+    img_width, img_height = image_size
+    wm_width, wm_height = watermark_size
+
+    if position == "center":
+        return ((img_width - wm_width) // 2, (img_height - wm_height) // 2)
+    elif position == "top-left":
+        return (margin, margin)
+    elif position == "top":
+        return ((img_width - wm_width) // 2, margin)
+    elif position == "top-right":
+        return (img_width - wm_width - margin, margin)
+    elif position == "left":
+        return (margin, (img_height - wm_height) // 2)
+    elif position == "right":
+        return (img_width - wm_width - margin, (img_height - wm_height) // 2)
+    elif position == "bottom-left":
+        return (margin, img_height - wm_height - margin)
+    elif position == "bottom":
+        return ((img_width - wm_width) // 2, img_height - wm_height - margin)
+    elif position == "bottom-right":
+        return (img_width - wm_width - margin, img_height - wm_height - margin)
+    else:
+        return (margin, margin)  # 默认位置
+
+
+def get_custom_position(custom_position, image_size, watermark_size):
+    """将相对坐标 (rel_x, rel_y) 转换为水印左上角的绝对坐标"""
+    rel_x, rel_y = custom_position
+    img_width, img_height = image_size
+    wm_width, wm_height = watermark_size
+    return (int(rel_x * (img_width - wm_width)), int(rel_y * (img_height - wm_height)))
+
+
+def resolve_position(position, custom_position, image_size, watermark_size, margin=MARGIN):
+    """自定义位置优先，否则使用预设位置"""
+    if custom_position:
+        return get_custom_position(custom_position, image_size, watermark_size)
+    return get_preset_position(position, image_size, watermark_size, margin)
+
+
+def measure_text(draw, text, font, font_size):
+    """计算文本尺寸，失败时使用估计值"""
+    try:
+        bbox = draw.textbbox((0, 0), text, font=font)
+        return (bbox[2] - bbox[0], bbox[3] - bbox[1])
+    except:
+        return (len(text) * font_size // 2, font_size)
+
+
+def render_text_watermark(image, text_settings, custom_position=None, scale=1.0, in_place=False):
+    """应用文本水印，custom_position 为 None 时使用预设位置"""
+    overlay = text_overlay(text_settings, image.size, custom_position, scale)
+    if overlay is None:
+        return image
+    return composite_sprite(image, *overlay, in_place=in_place)
+
+
+def text_overlay(text_settings, image_size, custom_position=None, scale=1.0):
+    """返回 (文本图层, 图层左上角坐标)，空文本返回 None"""
+    sprite = get_text_sprite(text_settings, scale)
+    if sprite is None:
+        return None
+
+    anchor = resolve_position(text_settings['position'], custom_position, image_size,
+                              sprite.text_size, scale_length(MARGIN, scale))
+    return sprite.image, (anchor[0] + sprite.offset[0], anchor[1] + sprite.offset[1])
+
+
+# 预渲染的文本水印：image 为紧凑的RGBA图层，offset 为图层左上角相对文本锚点的偏移
+TextSprite = namedtuple('TextSprite', ['image', 'offset', 'text_size'])
+
+# 影响文本图层像素的设置项（位置只影响图层贴到哪里）
+SPRITE_KEYS = ('text', 'font_family', 'font_index', 'font_size', 'bold', 'italic', 'color',
+               'opacity', 'shadow', 'stroke', 'stroke_width', 'stroke_style')
+
+# 渲染时在图层四周额外留出的透明边距
+SPRITE_PADDING = 2
+
+_sprite_cache = LRUCache(32)
+
+
+def _sprite_key(text_settings, scale):
+    return tuple(text_settings[k] for k in SPRITE_KEYS) + (scale,)
+
+
+def get_text_sprite(text_settings, scale=1.0):
+    """获取文本水印图层，同一组设置（和缩放比例）只栅格化一次"""
+    return _sprite_cache.get_or_create(_sprite_key(text_settings, scale),
+                                       lambda: build_text_sprite(text_settings, scale))
+
+
+def put_text_sprite(text_settings, sprite, scale=1.0):
+    """直接放入已栅格化的文本图层（例如从磁盘上的渲染计划读取的）"""
+    _sprite_cache.put(_sprite_key(text_settings, scale), sprite)
+
+
+def build_text_sprite(text_settings, scale=1.0):
+    """把文本（含描边/阴影）栅格化到刚好容纳它的透明图层上；空文本返回None"""
+    text = text_settings['text']
+    if not text.strip():
+        return None
+
+    font_size = font_size_from_settings(text_settings, scale)
+    font = font_from_settings(text_settings, scale)
+    measure_draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    text_size = measure_text(measure_draw, text, font, font_size)
+
+    # 设置透明度
+    opacity = int(255 * text_settings['opacity'] / 100)
+    fill_color = hex_to_rgba(text_settings['color'], opacity)
+
+    if text_settings['stroke'] and text_settings['stroke_style'] == "native":
+        sprite, offset = _rasterize_native_stroke(
+            text, font, fill_color, scale_length(text_settings['stroke_width'], scale), measure_draw)
+    else:
+        sprite, offset = _rasterize_passes(
+            text, font, _text_passes(text_settings, fill_color, scale), measure_draw)
+    return TextSprite(sprite, offset, text_size)
+
+
+def _text_passes(text_settings, fill_color, scale=1.0):
+    """每次绘制相对锚点的偏移和颜色，与直接在整幅图层上绘制的顺序一致"""
+    if text_settings['stroke']:
+        # 旧的描边方式：在八个方向各绘制一次黑色文本
+        stroke_width = scale_length(text_settings['stroke_width'], scale)
+        passes = [((dx, dy), (0, 0, 0, fill_color[3]))
+                  for dx in [-stroke_width, 0, stroke_width]
+                  for dy in [-stroke_width, 0, stroke_width]
+                  if dx != 0 or dy != 0]
+        passes.append(((0, 0), fill_color))
+        return passes
+    if text_settings['shadow']:
+        shadow_offset = scale_length(2, scale)
+        return [((shadow_offset, shadow_offset), (0, 0, 0, fill_color[3] // 2)), ((0, 0), fill_color)]
+    return [((0, 0), fill_color)]
+
+
+def _rasterize_passes(text, font, passes, measure_draw):
+    """按顺序执行多次绘制，返回 (图层, 图层相对锚点的偏移)"""
+    # 计算所有绘制的并集范围
+    left, top, right, bottom = measure_draw.textbbox((0, 0), text, font=font)
+    dxs = [offset[0] for offset, _ in passes]
+    dys = [offset[1] for offset, _ in passes]
+    left = left + min(dxs) - SPRITE_PADDING
+    top = top + min(dys) - SPRITE_PADDING
+    right = right + max(dxs) + SPRITE_PADDING
+    bottom = bottom + max(dys) + SPRITE_PADDING
+
+    sprite = Image.new("RGBA", (right - left, bottom - top), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(sprite)
+    for (dx, dy), color in passes:
+        draw.text((dx - left, dy - top), text, font=font, fill=color)
+    return sprite, (left, top)
+
+
+def _rasterize_native_stroke(text, font, fill_color, stroke_width, measure_draw):
+    """使用 FreeType 描边器一次绘制描边和文本，返回 (图层, 图层相对锚点的偏移)"""
+    stroke_fill = (0, 0, 0, fill_color[3])
+    left, top, right, bottom = measure_draw.textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+    left -= SPRITE_PADDING
+    top -= SPRITE_PADDING
+    right += SPRITE_PADDING
+    bottom += SPRITE_PADDING
+
+    sprite = Image.new("RGBA", (right - left, bottom - top), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(sprite)
+    draw.text((-left, -top), text, font=font, fill=fill_color,
+              stroke_width=stroke_width, stroke_fill=stroke_fill)
+    return sprite, (left, top)
+
+
+def rgba_target(image, in_place=False):
+    """返回用于绘制水印的RGBA图片：in_place 且已是RGBA时直接使用原图，否则转换出一份新图"""
+    if in_place and image.mode == "RGBA":
+        return image
+    return image.convert("RGBA")
+
+
+def composite_sprite(image, sprite, position, in_place=False):
+    """只在图层覆盖的区域内做 alpha 混合，返回RGBA图片（in_place 见 rgba_target）"""
+    result = rgba_target(image, in_place)
+    x, y = position
+
+    # 裁掉超出目标图片的部分（alpha_composite 不接受负坐标）
+    left = max(x, 0)
+    top = max(y, 0)
+    right = min(x + sprite.width, result.width)
+    bottom = min(y + sprite.height, result.height)
+    if left >= right or top >= bottom:
+        return result
+
+    if (left, top, right, bottom) != (x, y, x + sprite.width, y + sprite.height):
+        sprite = sprite.crop((left - x, top - y, right - x, bottom - y))
+    result.alpha_composite(sprite, dest=(left, top))
+    return result
+
+
+def fit_logo_size(logo_size, image_size, scale_percent):
+    """根据目标图片尺寸和缩放比例计算水印图片尺寸（保持宽高比，限制在5%~30%之间）"""
+    logo_width, logo_height = logo_size
+    base_size = min(image_size)
+    scale_factor = scale_percent / 100.0
+
+    # 使用固定比例而不是绝对值
+    target_size = int(base_size * scale_factor * 0.15)  # 15% 的图片高度
+
+    # 保持水印图片的宽高比
+    wm_ratio = logo_width / logo_height
+    if wm_ratio > 1:
+        new_width = target_size
+        new_height = int(target_size / wm_ratio)
+    else:
+        new_height = target_size
+        new_width = int(target_size * wm_ratio)
+
+    # 确保水印不会太小或太大
+    min_size = base_size * 0.05  # 最小5%
+    max_size = base_size * 0.3   # 最大30%
+
+    if new_width < min_size or new_height < min_size:
+        if new_width < new_height:
+            new_width = int(min_size)
+            new_height = int(min_size / wm_ratio)
+        else:
+            new_height = int(min_size)
+            new_width = int(min_size * wm_ratio)
+    elif new_width > max_size or new_height > max_size:
+        if new_width > new_height:
+            new_width = int(max_size)
+            new_height = int(max_size / wm_ratio)
+        else:
+            new_height = int(max_size)
+            new_width = int(max_size * wm_ratio)
+
+    return (new_width, new_height)
+
+
+def render_image_watermark(image, image_settings, custom_position=None, scale=1.0, in_place=False):
+    """应用图片水印，custom_position 为 None 时使用预设位置"""
+    overlay = image_overlay(image_settings, image.size, custom_position, scale)
+    if overlay is None:
+        return image
+
+    watermark, position = overlay
+    result = rgba_target(image, in_place)
+    result.paste(watermark, position, watermark)
+    return result
+
+
+def image_overlay(image_settings, image_size, custom_position=None, scale=1.0):
+    """返回 (处理好的水印图片, 左上角坐标)，未选择水印图片时返回 None"""
+    image_path = image_settings['image_path']
+    if not image_path:
+        return None
+
+    _, source = global_logo_cache.get_source(image_path)
+    new_size = fit_logo_size(source.size, image_size, image_settings['scale_percent'])
+    opacity = image_settings['opacity']
+    watermark = global_logo_cache.get_logo(
+        image_path, new_size, opacity,
+        lambda logo: scale_alpha(logo.resize(new_size, Image.Resampling.LANCZOS), opacity / 100.0))
+
+    position = resolve_position(image_settings['position'], custom_position, image_size,
+                                new_size, scale_length(MARGIN, scale))
+    return watermark, position
@@ -0,0 +1,234 @@
+"""渲染计划 - 把模板设置预先编译成可以直接使用的渲染资源，并保存在磁盘上
+
+文本水印的计划记录实际使用的字体文件（按名称查找字体的回退链只走一次）和导出尺寸下栅格化好的文本图层
+（颜色、透明度、描边和阴影都已处理，偏移量随图层保存，定位时只需一次加法）；
+图片水印的计划保存解码好的RGBA水印原图。
+
+计划以内容哈希命名，保存在模板库旁边的 <模板文件名>.plans 目录中：
+    <哈希>.json   计划描述
+    <哈希>.rgba   图层/原图的RGBA像素（不需要解码）
+相同的设置在任何进程、任何模板中都对应同一个计划，新启动的导出进程读取计划后即可直接渲染。
+计划中的字体文件被修改或删除后，计划会重新编译；安装了新字体后可以删除 .plans 目录。
+"""
+import os
+import json
+from PIL import Image, ImageFont
+from .watermark_settings import content_digest
+from .font_cache import global_font_cache
+from .logo_cache import global_logo_cache
+from .lru_cache import LRUCache
+from .asset_store import global_asset_store, source_signature
+from .render_engine import (SPRITE_KEYS, TextSprite, font_from_settings, font_size_from_settings,
+                            get_text_sprite, put_text_sprite, preload_resources)
+
+PLAN_VERSION = 2
+
+
+def plan_dir_for(template_file):
+    """模板文件对应的渲染计划目录"""
+    return os.path.splitext(template_file)[0] + ".plans"
+
+
+def plan_key(snapshot):
+    """计划的内容哈希：只包含影响计划内容的设置"""
+    if snapshot.watermark_type == "text":
+        content = {k: snapshot.text_settings[k] for k in SPRITE_KEYS}
+    else:
+        image_path = snapshot.image_settings['image_path']
+        content = {'image_path': image_path}
+        if image_path:
+            content['logo'] = source_signature(image_path)
+    return content_digest([PLAN_VERSION, snapshot.watermark_type, content])
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class RenderPlan:
+    """编译好的渲染计划，install() 把其中的资源放入渲染引擎的缓存"""
+    def __init__(self, key, watermark_type, settings, font=None, sprite=None, logo=None):
+        self.key = key
+        self.watermark_type = watermark_type
+        self.settings = settings
+        # 文本水印: {'path', 'index', 'signature'}，使用默认字体时为None
+        self.font = font
+        # 文本水印在导出尺寸下的 TextSprite，空文本时为None
+        self.sprite = sprite
+        # 图片水印: (路径, 修改时间, RGBA原图)，未选择图片时为None
+        self.logo = logo
+
+    @classmethod
+    def compile(cls, snapshot, key=None):
+        """根据设置快照编译计划（同时会预热渲染引擎的缓存）"""
+        key = key or plan_key(snapshot)
+        if snapshot.watermark_type == "text":
+            text_settings = snapshot.text_settings
+            font = font_from_settings(text_settings)
+            font_info = None
+            if isinstance(getattr(font, 'path', None), str):
+                font_info = {'path': font.path, 'index': font.index,
+                             'signature': _file_signature(font.path)}
+            return cls(key, "text", text_settings, font=font_info, sprite=get_text_sprite(text_settings))
+
+        image_settings = snapshot.image_settings
+        logo = None
+        if image_settings['image_path']:
+            mtime, source = global_logo_cache.get_source(image_settings['image_path'])
+            logo = (image_settings['image_path'], mtime, source)
+        return cls(key, "image", image_settings, logo=logo)
+
+    def pixels(self):
+        """需要保存的像素图片"""
+        if self.sprite is not None:
+            return self.sprite.image
+        if self.logo is not None:
+            return self.logo[2]
+        return None
+
+    def to_dict(self):
+        data = {'version': PLAN_VERSION, 'key': self.key, 'watermark_type': self.watermark_type,
+                'font': self.font, 'sprite': None, 'logo': None}
+        if self.sprite is not None:
+            data['sprite'] = {'size': list(self.sprite.image.size), 'offset': list(self.sprite.offset),
+                              'text_size': list(self.sprite.text_size)}
+        if self.logo is not None:
+            data['logo'] = {'path': self.logo[0], 'mtime': self.logo[1], 'size': list(self.logo[2].size)}
+        return data
+
+    @classmethod
+    def from_dict(cls, data, settings, pixels):
+        """从 to_dict() 的结果和像素数据恢复计划"""
+        sprite = logo = None
+        if data['sprite'] is not None:
+            image = Image.frombytes("RGBA", tuple(data['sprite']['size']), pixels)
+            sprite = TextSprite(image, tuple(data['sprite']['offset']), tuple(data['sprite']['text_size']))
+        if data['logo'] is not None:
+            image = Image.frombytes("RGBA", tuple(data['logo']['size']), pixels)
+            logo = (data['logo']['path'], data['logo']['mtime'], image)
+        return cls(data['key'], data['watermark_type'], settings, font=data['font'], sprite=sprite, logo=logo)
+
+    def is_valid(self):
+        """计划引用的字体文件是否没有变化"""
+        return self.font is None or _file_signature(self.font['path']) == self.font['signature']
+
+    def install(self):
+        """把字体、文本图层和水印原图放入渲染引擎的缓存，之后的渲染不再查找字体或解码文件"""
+        if self.watermark_type == "text":
+            text_settings = self.settings
+            if self.font is not None:
+                font_size = font_size_from_settings(text_settings)
+                font = ImageFont.truetype(self.font['path'], font_size, index=self.font['index'])
+                global_font_cache.put_font(text_settings['font_family'], font_size,
+                                           text_settings['bold'] == 1, text_settings['italic'] == 1, font,
+                                           text_settings['font_index'])
+            put_text_sprite(text_settings, self.sprite)
+        elif self.logo is not None:
+            global_logo_cache.put_source(*self.logo)
+
+
+class RenderPlanCache:
+    """内存中的计划缓存，设置了 directory 时同时读写磁盘上的计划"""
+    def __init__(self, directory=None, max_entries=16):
+        self.directory = directory
+        self._cache = LRUCache(max_entries)
+
+    def set_directory(self, directory):
+        self.directory = directory
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".rgba"
+
+    def _load(self, key, snapshot):
+        """读取磁盘上的计划，不存在或已失效时返回None"""
+        json_path, pixels_path = self._paths(key)
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != PLAN_VERSION or data.get('key') != key:
+                return None
+            pixels = None
+            if data['sprite'] is not None or data['logo'] is not None:
+                with open(pixels_path, 'rb') as f:
+                    pixels = f.read()
+            settings = snapshot.text_settings if snapshot.watermark_type == "text" else snapshot.image_settings
+            plan = RenderPlan.from_dict(data, settings, pixels)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"读取渲染计划 {key} 出错: {e}")
+            return None
+        return plan if plan.is_valid() else None
+
+    def _save(self, plan):
+        """先写像素再写描述，描述存在时像素一定已经完整"""
+        os.makedirs(self.directory, exist_ok=True)
+        json_path, pixels_path = self._paths(plan.key)
+        suffix = f".{os.getpid()}.tmp"
+        pixels = plan.pixels()
+        if pixels is not None:
+            with open(pixels_path + suffix, 'wb') as f:
+                f.write(pixels.tobytes())
+            os.replace(pixels_path + suffix, pixels_path)
+        with open(json_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(plan.to_dict(), f, ensure_ascii=False)
+        os.replace(json_path + suffix, json_path)
+
+    def _load_or_compile(self, key, snapshot):
+        if self.directory is None:
+            return RenderPlan.compile(snapshot, key)
+        plan = self._load(key, snapshot)
+        if plan is not None:
+            plan.install()
+            return plan
+        plan = RenderPlan.compile(snapshot, key)
+        try:
+            self._save(plan)
+        except OSError as e:
+            print(f"保存渲染计划出错: {e}")
+        return plan
+
+    def get(self, snapshot):
+        """获取快照的渲染计划：内存 -> 磁盘 -> 重新编译"""
+        key = plan_key(snapshot)
+        return self._cache.get_or_create(key, lambda: self._load_or_compile(key, snapshot))
+
+    def preload(self, snapshot):
+        """为即将开始的渲染准备好资源；没有设置目录时与 render_engine.preload_resources 相同"""
+        if self.directory is None:
+            preload_resources(snapshot)
+            return
+        try:
+            self.get(snapshot)
+        except Exception as e:
+            print(f"加载渲染计划出错: {e}")
+            preload_resources(snapshot)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        return self._cache.stats()
+
+    def clear(self):
+        """清空内存中的计划"""
+        self._cache.clear()
+
+
+# 创建全局渲染计划缓存实例，template_manager.configure_storage 会把目录设置为模板库旁边的 .plans 目录
+global_plan_cache = RenderPlanCache()
+
+
+def cache_directories():
+    """当前进程使用的 (渲染计划目录, 资源目录)，传给工作进程的 set_cache_directories"""
+    return global_plan_cache.directory, global_asset_store.directory
+
+
+def set_cache_directories(directories):
+    """在工作进程中使用与主进程相同的渲染计划和资源目录"""
+    plan_dir, asset_dir = directories
+    global_plan_cache.set_directory(plan_dir)
+    global_asset_store.set_directory(asset_dir)
@@ -0,0 +1,333 @@
+"""分片批量任务 - 把大批量导出拆成分片记录在共享存储的任务目录中，由多台机器上的工作进程领取处理
+
+任务目录结构:
+    job.json              设置快照、导出选项和分片数量
+    shards/00000.json     每个分片的 [源文件, 输出文件] 列表（输出路径由创建任务时统一分配，不会冲突）
+    leases/00000.lease    工作进程领取分片时用 O_EXCL 创建的租约文件（记录工作进程标识和随机令牌），
+                          处理期间定期更新修改时间
+    done/00000.json       分片完成后写入的结果清单
+    plans/                编译好的渲染计划（见 render_plan），新加入的工作进程不必重新编译
+    assets/               水印图片和字体文件（见 asset_store），job.json 中的设置以资源引用代替本机路径
+
+租约文件的修改时间超过 lease_timeout 秒没有更新时视为过期（工作进程已退出），
+其他工作进程会先把它原子地改名再重新创建，保证同一时刻只有一个进程能接手。
+续约和释放前都会核对租约中的令牌，租约已被其他进程接手时原进程停止处理，不会改动对方的租约。
+输出文件按预先分配的路径原子写入，分片被重复处理也只会得到相同的结果。
+"""
+import os
+import json
+import time
+import socket
+import secrets
+import threading
+from .watermark_settings import WatermarkSnapshot
+from .export_engine import (ExportOptions, ExportTask, ExportResult, plan_output_paths, execute_tasks)
+from .export_pipeline import DEFAULT_MEMORY_LIMIT
+from .render_plan import RenderPlanCache, set_cache_directories
+from .asset_store import AssetStore
+from .template_bundle import embed_assets
+
+JOB_FILE = "job.json"
+JOB_VERSION = 1
+DEFAULT_SHARD_SIZE = 200
+# 租约超时时间（秒），工作进程每隔 1/3 超时时间续约一次
+DEFAULT_LEASE_TIMEOUT = 120
+
+
+def _write_json_atomic(path, data):
+    """先写临时文件再替换，其他机器不会读到写了一半的文件"""
+    temp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _shard_name(index):
+    return f"{index:05d}"
+
+
+class LeaseLost(Exception):
+    """分片租约已过期并被其他工作进程接手（或已被删除）"""
+    pass
+
+
+def default_worker_id():
+    """主机名和进程号组成的工作进程标识"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def create_job(job_dir, source_paths, snapshot, options, shard_size=DEFAULT_SHARD_SIZE):
+    """创建分片任务，返回分片数量
+
+    所有输出路径在这里统一分配，各工作进程不需要再检查重名。
+    """
+    if os.path.exists(os.path.join(job_dir, JOB_FILE)):
+        raise FileExistsError(f"任务目录中已有任务: {job_dir}")
+    for name in ("shards", "leases", "done", "plans", "assets"):
+        os.makedirs(os.path.join(job_dir, name), exist_ok=True)
+    os.makedirs(options.output_dir, exist_ok=True)
+
+    output_paths = plan_output_paths(source_paths, options)
+    pairs = [[os.path.abspath(source), os.path.abspath(output)]
+             for source, output in zip(source_paths, output_paths)]
+    shard_count = 0
+    for start in range(0, len(pairs), shard_size):
+        _write_json_atomic(os.path.join(job_dir, "shards", _shard_name(shard_count) + ".json"),
+                           {'start': start, 'tasks': pairs[start:start + shard_size]})
+        shard_count += 1
+
+    # 水印图片和字体放入任务目录，其他机器不需要相同的文件路径或字体
+    snapshot = embed_assets(snapshot, AssetStore(os.path.join(job_dir, "assets")), include_font=True)
+    RenderPlanCache(os.path.join(job_dir, "plans")).preload(snapshot)
+
+    # job.json 最后写入，工作进程看到它时所有分片都已就绪
+    _write_json_atomic(os.path.join(job_dir, JOB_FILE), {
+        'version': JOB_VERSION,
+        'snapshot': snapshot.to_dict(),
+        'options': options._asdict(),
+        'shards': shard_count,
+        'images': len(pairs),
+        'created': time.time()
+    })
+    return shard_count
+
+
+class ShardJob:
+    """已创建的分片任务"""
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        job = _read_json(os.path.join(job_dir, JOB_FILE))
+        if job.get('version') != JOB_VERSION:
+            raise ValueError(f"无法识别的任务: {job_dir}")
+        self.snapshot = WatermarkSnapshot.from_dict(job['snapshot'])
+        self.options = ExportOptions(**job['options'])
+        self.shard_count = job['shards']
+        self.image_count = job['images']
+
+    def shard_path(self, index):
+        return os.path.join(self.job_dir, "shards", _shard_name(index) + ".json")
+
+    def lease_path(self, index):
+        return os.path.join(self.job_dir, "leases", _shard_name(index) + ".lease")
+
+    def done_path(self, index):
+        return os.path.join(self.job_dir, "done", _shard_name(index) + ".json")
+
+    def is_done(self, index):
+        return os.path.exists(self.done_path(index))
+
+    def load_tasks(self, index):
+        """读取分片中的任务，index 为整个任务中的序号"""
+        shard = _read_json(self.shard_path(index))
+        return [ExportTask(shard['start'] + i, source, output)
+                for i, (source, output) in enumerate(shard['tasks'])]
+
+    def lease_expired(self, index, lease_timeout):
+        """租约文件存在且超时未续约"""
+        try:
+            return time.time() - os.path.getmtime(self.lease_path(index)) > lease_timeout
+        except OSError:
+            return False
+
+    def read_lease(self, index):
+        """读取租约内容 {'worker', 'token', 'claimed'}，没有租约或无法读取时返回None"""
+        try:
+            return _read_json(self.lease_path(index))
+        except (OSError, ValueError):
+            return None
+
+    def owns_lease(self, index, token):
+        """租约是否仍然属于持有 token 的工作进程"""
+        lease = self.read_lease(index)
+        return lease is not None and lease.get('token') == token
+
+    def try_claim(self, index, worker_id, lease_timeout):
+        """尝试领取分片，成功时返回租约令牌（续约和释放时使用），否则返回None；过期的租约会被回收"""
+        lease_path = self.lease_path(index)
+        if self.lease_expired(index, lease_timeout):
+            # 改名是原子的，多个进程同时回收时只有一个能成功
+            stale_path = f"{lease_path}.stale-{worker_id}"
+            try:
+                os.rename(lease_path, stale_path)
+                if time.time() - os.path.getmtime(stale_path) <= lease_timeout:
+                    # 与其他进程同时回收时，改名拿到的可能是对方刚创建的新租约，还回去
+                    os.rename(stale_path, lease_path)
+                    return None
+                os.remove(stale_path)
+                print(f"回收过期的分片租约: {_shard_name(index)}")
+            except OSError:
+                return None
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        token = secrets.token_hex(16)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'worker': worker_id, 'token': token, 'claimed': time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # 领取前另一个进程可能刚好完成了这个分片
+        if self.is_done(index):
+            self.release(index, token)
+            return None
+        return token
+
+    def renew(self, index, token):
+        """续约：核对令牌后更新租约文件的修改时间，租约已不属于 token 时抛出 LeaseLost"""
+        if not self.owns_lease(index, token):
+            raise LeaseLost(f"分片 {_shard_name(index)} 的租约已被其他工作进程接手")
+        try:
+            os.utime(self.lease_path(index))
+        except OSError as e:
+            raise LeaseLost(f"分片 {_shard_name(index)} 的租约已失效: {e}")
+
+    def release(self, index, token):
+        """释放租约，只删除仍属于 token 的租约文件；租约已被接手时返回False"""
+        if not self.owns_lease(index, token):
+            return False
+        try:
+            os.remove(self.lease_path(index))
+        except OSError:
+            pass
+        return True
+
+    def status(self, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        """返回分片状态统计和已完成分片中的图片结果数"""
+        done = leased = expired = 0
+        succeeded = failed = 0
+        for index in range(self.shard_count):
+            if self.is_done(index):
+                done += 1
+                results = _read_json(self.done_path(index))['results']
+                failed += sum(1 for item in results if item['error'] is not None)
+                succeeded += sum(1 for item in results if item['error'] is None)
+            elif os.path.exists(self.lease_path(index)):
+                if self.lease_expired(index, lease_timeout):
+                    expired += 1
+                else:
+                    leased += 1
+        return {
+            'shards': self.shard_count,
+            'done': done,
+            'leased': leased,
+            'expired': expired,
+            'pending': self.shard_count - done - leased - expired,
+            'images': self.image_count,
+            'succeeded': succeeded,
+            'failed': failed
+        }
+
+    def collect_results(self):
+        """合并所有已完成分片的结果清单"""
+        succeeded = []
+        failed = []
+        for index in range(self.shard_count):
+            if not self.is_done(index):
+                continue
+            for item in _read_json(self.done_path(index))['results']:
+                if item['error'] is None:
+                    succeeded.append((item['source'], item['output']))
+                else:
+                    failed.append((item['source'], item['error']))
+        return ExportResult(succeeded, failed, False)
+
+
+class _LeaseKeeper:
+    """后台线程定期续约；续约失败（租约被其他进程回收）时设置 lost 事件，让处理尽快停止"""
+    def __init__(self, job, index, token, interval):
+        self.job = job
+        self.index = index
+        self.token = token
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.job.renew(self.index, self.token)
+            except LeaseLost as e:
+                print(f"{e}，停止处理")
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def process_shard(job, index, worker_id, token, workers=None, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                  memory_limit=DEFAULT_MEMORY_LIMIT):
+    """处理已领取（租约令牌为 token）的分片并写入结果清单，返回是否完成（租约丢失时返回False）"""
+    tasks = job.load_tasks(index)
+    results = []
+
+    def record(task, error):
+        results.append({'index': task.index, 'source': task.source_path,
+                        'output': task.output_path, 'error': error})
+
+    start = time.time()
+    with _LeaseKeeper(job, index, token, lease_timeout / 3.0) as keeper:
+        execute_tasks(tasks, job.snapshot, job.options, workers, record, keeper.lost, memory_limit)
+    if keeper.lost.is_set():
+        return False
+    # 最后一次续约之后租约也可能已经过期并被接手，由新的持有者写结果清单
+    if not job.owns_lease(index, token):
+        print(f"分片 {_shard_name(index)} 的租约已被其他工作进程接手，放弃结果")
+        return False
+
+    results.sort(key=lambda item: item['index'])
+    _write_json_atomic(job.done_path(index), {
+        'worker': worker_id,
+        'started': start,
+        'finished': time.time(),
+        'results': results
+    })
+    job.release(index, token)
+    return True
+
+
+def run_worker(job_dir, worker_id=None, workers=None, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+               memory_limit=DEFAULT_MEMORY_LIMIT, stop_event=None):
+    """领取并处理分片，直到所有分片都已完成，返回本进程完成的分片数
+
+    其他进程持有的租约在过期前不会被抢占；没有可领取的分片时等待一段时间再检查，
+    这样异常退出的进程留下的分片最终会被回收处理。
+    """
+    job = ShardJob(job_dir)
+    set_cache_directories((os.path.join(job_dir, "plans"), os.path.join(job_dir, "assets")))
+    worker_id = worker_id or default_worker_id()
+    completed = 0
+    while stop_event is None or not stop_event.is_set():
+        remaining = [index for index in range(job.shard_count) if not job.is_done(index)]
+        if not remaining:
+            break
+        claimed = False
+        for index in remaining:
+            if stop_event is not None and stop_event.is_set():
+                break
+            if job.is_done(index):
+                continue
+            token = job.try_claim(index, worker_id, lease_timeout)
+            if token is None:
+                continue
+            claimed = True
+            print(f"[{worker_id}] 处理分片 {_shard_name(index)}")
+            if process_shard(job, index, worker_id, token, workers, lease_timeout, memory_limit):
+                completed += 1
+        if not claimed:
+            # 剩下的分片都被其他进程持有，等待它们完成或租约过期
+            time.sleep(min(5.0, lease_timeout / 3.0))
+    return completed
@@ -0,0 +1,137 @@
+"""模板包 - 把模板和它用到的水印图片（可选字体文件）打包成一个自包含的文件，可以在其他机器上直接使用
+
+模板包是一个zip文件:
+    bundle.json       格式版本、模板名称、模板内容和资源列表
+    assets/<哈希>     资源内容，文件名为内容的SHA-256
+
+包中模板的 image_path（和嵌入了字体时的 font_family）是资源引用 asset:<哈希>，
+不依赖任何本机路径；嵌入的字体来自 .ttc 字体集时，text_settings 的 font_index 记录使用其中的第几个字体。读取时校验每个资源的哈希，可以从文件、bytes 或文件对象读取。
+"""
+import io
+import json
+import zipfile
+from collections import namedtuple
+from .asset_store import global_asset_store, is_asset_ref, asset_ref, ASSET_SCHEME
+from .font_cache import load_font
+from .watermark_settings import WatermarkSnapshot
+
+BUNDLE_EXTENSION = ".wmbundle"
+BUNDLE_FORMAT = "watermark-template-bundle"
+BUNDLE_VERSION = 1
+BUNDLE_MANIFEST = "bundle.json"
+
+# template 为模板格式的字典（资源以引用表示），assets 为 {引用: 内容}
+TemplateBundle = namedtuple('TemplateBundle', ['name', 'template', 'assets'])
+
+
+def _read_asset(path, store):
+    """读取资源引用或本地文件的内容"""
+    if is_asset_ref(path):
+        return store.get(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def build_bundle(name, template, include_font=False, store=global_asset_store):
+    """把模板引用的水印图片（include_font 为 True 时还有字体文件）嵌入，返回 TemplateBundle
+
+    只有字体能解析到字体文件时才会嵌入，使用默认字体时保持原来的字体名称。
+    图片水印模板的水印图片读取失败时抛出 OSError（文本水印模板中残留的图片路径读取失败时保持原样）。
+    """
+    template = json.loads(json.dumps(template))
+    is_text = template.get('watermark_type', 'text') == "text"
+    assets = {}
+
+    def embed(data):
+        ref = asset_ref(data)
+        assets[ref] = data
+        return ref
+
+    image_settings = template.get('image_settings') or {}
+    if image_settings.get('image_path'):
+        try:
+            image_settings['image_path'] = embed(_read_asset(image_settings['image_path'], store))
+        except (OSError, KeyError):
+            if not is_text:
+                raise
+
+    if include_font and is_text:
+        text_settings = WatermarkSnapshot.from_dict(template).text_settings
+        font_family = text_settings['font_family']
+        if is_asset_ref(font_family):
+            template['text_settings']['font_family'] = embed(store.get(font_family))
+        else:
+            font = load_font(font_family, text_settings['font_size'],
+                             text_settings['bold'] == 1, text_settings['italic'] == 1)
+            font_path = getattr(font, 'path', None)
+            if isinstance(font_path, str):
+                with open(font_path, 'rb') as f:
+                    template_text = template.setdefault('text_settings', {})
+                    template_text['font_family'] = embed(f.read())
+                    # 字体索引中的粗体/斜体可能是字体集中的另一个字体，嵌入整个文件时要记下序号
+                    template_text['font_index'] = font.index
+            else:
+                print(f"找不到字体 '{font_family}' 的字体文件，模板包中不包含字体")
+    return TemplateBundle(name, template, assets)
+
+
+def write_bundle(bundle, target):
+    """把模板包写入 target（文件路径或文件对象）"""
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'name': bundle.name,
+        'template': bundle.template,
+        'assets': {ref: len(data) for ref, data in bundle.assets.items()}
+    }
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(BUNDLE_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2))
+        for ref, data in bundle.assets.items():
+            # 图片和字体本身大多已经压缩过，直接存储读取更快
+            archive.writestr(f"assets/{ref[len(ASSET_SCHEME):]}", data, zipfile.ZIP_STORED)
+
+
+def bundle_to_bytes(bundle):
+    """把模板包写到内存中，返回 bytes"""
+    buffer = io.BytesIO()
+    write_bundle(bundle, buffer)
+    return buffer.getvalue()
+
+
+def read_bundle(source):
+    """读取模板包，source 可以是文件路径、bytes 或文件对象；格式不对或资源损坏时抛出 ValueError"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        with zipfile.ZipFile(source) as archive:
+            manifest = json.loads(archive.read(BUNDLE_MANIFEST).decode('utf-8'))
+            if manifest.get('format') != BUNDLE_FORMAT or manifest.get('version') != BUNDLE_VERSION:
+                raise ValueError("不是可识别的模板包")
+            assets = {}
+            for ref in manifest['assets']:
+                data = archive.read(f"assets/{ref[len(ASSET_SCHEME):]}")
+                if asset_ref(data) != ref:
+                    raise ValueError(f"模板包中的资源已损坏: {ref}")
+                assets[ref] = data
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"无法读取模板包: {e}")
+    return TemplateBundle(manifest.get('name'), manifest['template'], assets)
+
+
+def install_bundle(bundle, store=global_asset_store):
+    """把模板包中的资源放入资源存储，返回可以直接使用的模板字典"""
+    for data in bundle.assets.values():
+        store.add(data)
+    return bundle.template
+
+
+def embed_assets(snapshot, store, include_font=False):
+    """把设置快照用到的水印图片（和字体文件）放入 store 并改用资源引用，返回新的快照
+
+    资源同时放入全局资源存储，当前进程可以直接渲染新的快照。
+    """
+    bundle = build_bundle(None, snapshot.to_dict(), include_font)
+    install_bundle(bundle, store)
+    if store is not global_asset_store:
+        install_bundle(bundle, global_asset_store)
+    return WatermarkSnapshot.from_dict(bundle.template)
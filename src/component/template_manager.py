@@ -1,69 +1,114 @@
 import os
-import json
+import time
+from .template_store import open_template_store
+from .render_plan import plan_dir_for, set_cache_directories
+from .template_bundle import build_bundle, write_bundle, read_bundle, install_bundle
+
+DEFAULT_TEMPLATE_FILE = "watermark_templates.json"
+
+
+def asset_dir_for(template_file):
+    """模板库对应的资源目录（从模板包导入的水印图片和字体）"""
+    return os.path.splitext(template_file)[0] + ".assets"
+
+
+def configure_storage(template_file=DEFAULT_TEMPLATE_FILE):
+    """让当前进程使用模板库旁边的渲染计划目录和资源目录（绝对路径），返回 (计划目录, 资源目录)
+
+    程序入口（图形界面、命令行、HTTP服务）在使用模板库之前调用一次；只设置路径，不创建模板库或目录。
+    """
+    template_file = os.path.abspath(template_file)
+    directories = (plan_dir_for(template_file), asset_dir_for(template_file))
+    set_cache_directories(directories)
+    return directories
+
 
 class TemplateManager:
-    def __init__(self, template_file="watermark_templates.json"):
+    def __init__(self, template_file=DEFAULT_TEMPLATE_FILE, backend=None):
+        """backend 为 "sqlite" 或 "json"，为 None 时见 template_store.open_template_store
+
+        不修改渲染计划和资源目录，需要时先调用 configure_storage(template_file)。
+        """
         self.template_file = template_file
-        self.templates = self.load_templates()
-    
+        self.store = open_template_store(template_file, backend)
+
+    @staticmethod
+    def _with_defaults(template):
+        """确保向后兼容性：如果模板中没有位置模式信息，添加默认值"""
+        template.setdefault('use_custom_position', False)
+        template.setdefault('custom_position', None)
+        return template
+
     def load_templates(self):
-        """加载模板文件"""
-        if os.path.exists(self.template_file):
-            try:
-                with open(self.template_file, 'r', encoding='utf-8') as f:
-                    templates = json.load(f)
-                    # 确保向后兼容性：如果模板中没有位置模式信息，添加默认值
-                    for name, template in templates.items():
-                        if 'use_custom_position' not in template:
-                            template['use_custom_position'] = False
-                        if 'custom_position' not in template:
-                            template['custom_position'] = None
-                    return templates
-            except Exception as e:
-                print(f"加载模板文件失败: {e}")
-                return {}
-        return {}
-    
-    def save_templates(self):
-        """保存模板到文件"""
+        """加载全部模板"""
         try:
-            with open(self.template_file, 'w', encoding='utf-8') as f:
-                json.dump(self.templates, f, ensure_ascii=False, indent=2)
-            return True
+            templates = self.store.all()
         except Exception as e:
-            print(f"保存模板文件失败: {e}")
-            return False
-    
+            print(f"加载模板失败: {e}")
+            return {}
+        for template in templates.values():
+            self._with_defaults(template)
+        return templates
+
     def save_template(self, name, watermark_type, text_settings, image_settings, use_custom_position=False, custom_position=None):
         """保存模板"""
-        self.templates[name] = {
+        template = {
             'watermark_type': watermark_type,
             'text_settings': text_settings,
             'image_settings': image_settings,
             'use_custom_position': use_custom_position,
             'custom_position': custom_position,
-            'timestamp': os.path.getmtime(self.template_file) if os.path.exists(self.template_file) else 0
+            'timestamp': time.time()
         }
-        return self.save_templates()
-    
+        try:
+            self.store.put(name, template)
+            return True
+        except Exception as e:
+            print(f"保存模板失败: {e}")
+            return False
+
     def load_template(self, name):
-        """加载模板"""
-        template = self.templates.get(name)
-        if template:
-            # 确保向后兼容性：如果模板中没有位置模式信息，添加默认值
-            if 'use_custom_position' not in template:
-                template['use_custom_position'] = False
-            if 'custom_position' not in template:
-                template['custom_position'] = None
-        return template
-    
+        """加载模板（只读取这一个模板）"""
+        try:
+            template = self.store.get(name)
+        except Exception as e:
+            print(f"加载模板 {name} 失败: {e}")
+            return None
+        return self._with_defaults(template) if template else template
+
     def delete_template(self, name):
         """删除模板"""
-        if name in self.templates:
-            del self.templates[name]
-            return self.save_templates()
-        return False
-    
+        try:
+            return self.store.delete(name)
+        except Exception as e:
+            print(f"删除模板失败: {e}")
+            return False
+
+    def has_template(self, name):
+        """模板是否存在"""
+        return name in self.store
+
     def get_template_names(self):
         """获取所有模板名称"""
-        return list(self.templates.keys())
\ No newline at end of file
+        return self.store.names()
+
+    def find_templates(self, prefix):
+        """获取以 prefix 开头的模板名称"""
+        return self.store.names(prefix)
+
+    def export_bundle(self, name, target, include_font=False):
+        """把模板和它用到的水印图片（可选字体文件）导出为模板包，target 为文件路径或文件对象"""
+        template = self.load_template(name)
+        if template is None:
+            raise KeyError(f"找不到模板: {name}")
+        write_bundle(build_bundle(name, template, include_font), target)
+
+    def import_bundle(self, source, name=None):
+        """导入模板包（文件路径、bytes 或文件对象），资源保存到模板库的资源目录，返回模板名称"""
+        bundle = read_bundle(source)
+        template = self._with_defaults(install_bundle(bundle))
+        name = name or bundle.name
+        if not name:
+            raise ValueError("模板包中没有模板名称")
+        self.store.put(name, template)
+        return name
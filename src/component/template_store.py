@@ -0,0 +1,235 @@
+"""模板存储后端 - JSON 文件或 SQLite 数据库
+
+两种后端提供相同的接口:
+    names(prefix=None)  模板名称列表（可按前缀筛选），不读取模板内容
+    get(name)           读取单个模板，不存在时返回 None
+    put(name, template) 保存单个模板
+    delete(name)        删除模板，返回是否存在
+    name in store, len(store)
+
+JSONTemplateStore 与原来的 watermark_templates.json 完全兼容，每次保存都重写整个文件。
+SQLiteTemplateStore 按名称建索引，只在需要时读取单个模板，每次写入只涉及一行并在事务中完成，
+多个进程可以同时读写同一个数据库。
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+# 未指定后端时使用的默认值，可以用环境变量修改
+BACKEND_ENV = "WATERMARK_TEMPLATE_BACKEND"
+DEFAULT_BACKEND = BACKEND_SQLITE
+
+# 并发写入时等待数据库锁的时间（秒）
+SQLITE_TIMEOUT = 10.0
+
+
+class JSONTemplateStore:
+    """整个模板库保存在一个JSON文件中；文件被其他程序修改后会自动重新加载"""
+    def __init__(self, path):
+        self.path = path
+        self._templates = {}
+        self._mtime = None
+        self._lock = threading.RLock()
+        self._reload_if_changed()
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            self._templates = {}
+            if mtime is None:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._templates = json.load(f)
+            except Exception as e:
+                print(f"加载模板文件失败: {e}")
+
+    def _save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self._templates, f, ensure_ascii=False, indent=2)
+        self._mtime = self._file_mtime()
+
+    def names(self, prefix=None):
+        self._reload_if_changed()
+        with self._lock:
+            return [name for name in self._templates if prefix is None or name.startswith(prefix)]
+
+    def get(self, name):
+        self._reload_if_changed()
+        with self._lock:
+            template = self._templates.get(name)
+            return dict(template) if template is not None else None
+
+    def all(self):
+        """读取全部模板 {名称: 模板}"""
+        self._reload_if_changed()
+        with self._lock:
+            return {name: dict(template) for name, template in self._templates.items()}
+
+    def put(self, name, template):
+        self._reload_if_changed()
+        with self._lock:
+            self._templates[name] = template
+            self._save()
+
+    def delete(self, name):
+        self._reload_if_changed()
+        with self._lock:
+            if name not in self._templates:
+                return False
+            del self._templates[name]
+            self._save()
+            return True
+
+    def __contains__(self, name):
+        self._reload_if_changed()
+        return name in self._templates
+
+    def __len__(self):
+        self._reload_if_changed()
+        return len(self._templates)
+
+
+class SQLiteTemplateStore:
+    """以模板名称为主键的SQLite模板库
+
+    模板内容以JSON保存在 data 列，列出名称时不会读取它。
+    数据库使用 WAL 模式，读操作不会被写操作阻塞；每个线程使用自己的连接。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS templates (
+            name TEXT PRIMARY KEY,
+            watermark_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def names(self, prefix=None):
+        conn = self._connect()
+        if prefix is None:
+            rows = conn.execute("SELECT name FROM templates ORDER BY rowid")
+        else:
+            # 用范围查询代替 LIKE，可以直接使用主键索引，也不需要转义 % 和 _
+            rows = conn.execute("SELECT name FROM templates WHERE name >= ? AND name < ? ORDER BY name",
+                                (prefix, prefix + "\U0010ffff"))
+        return [row[0] for row in rows]
+
+    def get(self, name):
+        row = self._connect().execute("SELECT data FROM templates WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def all(self):
+        """读取全部模板 {名称: 模板}"""
+        rows = self._connect().execute("SELECT name, data FROM templates ORDER BY rowid")
+        return {name: json.loads(data) for name, data in rows}
+
+    def put(self, name, template):
+        self.put_many([(name, template)])
+
+    def put_many(self, items):
+        """在一个事务中保存多个模板 [(名称, 模板)]"""
+        conn = self._connect()
+        with conn:
+            # 使用 UPSERT 而不是 REPLACE，覆盖时保留原来的 rowid（列表顺序不变）
+            conn.executemany(
+                "INSERT INTO templates (name, watermark_type, data, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET watermark_type = excluded.watermark_type, "
+                "data = excluded.data, updated = excluded.updated",
+                [(name, template.get('watermark_type', 'text'), json.dumps(template, ensure_ascii=False), time.time())
+                 for name, template in items])
+
+    def delete(self, name):
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM templates WHERE name = ?", (name,)).rowcount > 0
+
+    def get_meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key, value):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __contains__(self, name):
+        return self._connect().execute("SELECT 1 FROM templates WHERE name = ?", (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+
+def migrate_json_templates(json_path, store):
+    """把JSON模板文件导入SQLite模板库（只执行一次，已存在的同名模板不会被覆盖），返回导入的数量"""
+    if store.get_meta('migrated_from') is not None or not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            templates = json.load(f)
+    except Exception as e:
+        print(f"读取模板文件 {json_path} 失败，跳过迁移: {e}")
+        return 0
+    items = [(name, template) for name, template in templates.items() if name not in store]
+    store.put_many(items)
+    store.set_meta('migrated_from', os.path.abspath(json_path))
+    print(f"已将 {len(items)} 个模板从 {json_path} 迁移到 {store.path}")
+    return len(items)
+
+
+def open_template_store(template_file, backend=None):
+    """打开模板库
+
+    backend 为 None 时使用环境变量 WATERMARK_TEMPLATE_BACKEND 或默认的 sqlite。
+    template_file 以 .db 结尾时总是使用 SQLite；
+    使用 SQLite 而 template_file 是JSON文件时，数据库放在同名的 .db 文件中，第一次打开时自动导入JSON中的模板。
+    """
+    backend = backend or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    root, ext = os.path.splitext(template_file)
+    if ext.lower() == ".db":
+        return SQLiteTemplateStore(template_file)
+    if backend == BACKEND_JSON:
+        return JSONTemplateStore(template_file)
+    if backend != BACKEND_SQLITE:
+        raise ValueError(f"未知的模板存储后端: {backend}")
+    store = SQLiteTemplateStore(root + ".db")
+    migrate_json_templates(template_file, store)
+    return store
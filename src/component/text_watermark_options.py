@@ -1,9 +1,10 @@
 import os
 from tkinter import Frame, Label, Entry, Button, Scale, StringVar, OptionMenu, Radiobutton, END, IntVar
 from tkinter import colorchooser
+from tkinter import ttk
 import tkinter as tk
-from PIL import Image, ImageDraw, ImageFont, ImageTk
-from .watermark_settings import global_watermark_settings
+from .watermark_settings import global_watermark_settings, load_text_settings
+from .font_index import global_font_index
 
 class TextWatermarkOptions(Frame):
     def __init__(self, master, update_callback=None):
@@ -45,11 +46,15 @@ class TextWatermarkOptions(Frame):
             "Lucida Grande": "Lucida Grande",
         }
         
-        self.available_fonts = list(self.font_mapping.keys())
+        # 常用字体在前，然后是字体索引中本机安装的其他字体
+        installed_fonts = global_font_index.families()
+        self.available_fonts = list(self.font_mapping.keys()) + [
+            name for name in installed_fonts if name not in self.font_mapping]
         self.font_family = StringVar(value=global_watermark_settings.text_settings['font_family'])
         
-        font_menu = OptionMenu(font_frame, self.font_family, *self.available_fonts)
-        font_menu.config(width=12)
+        # 字体较多，使用可以滚动的下拉列表
+        font_menu = ttk.Combobox(font_frame, textvariable=self.font_family, values=self.available_fonts,
+                                 state='readonly', width=14)
         font_menu.pack(side='left', padx=(0, 10))
         if update_callback:
             self.font_family.trace('w', self.on_setting_change)
@@ -136,7 +141,14 @@ class TextWatermarkOptions(Frame):
         
         # 描边宽度确认按钮
         self.stroke_confirm_btn = Button(style_frame, text="确认", command=self.confirm_stroke, width=6)
-        self.stroke_confirm_btn.pack(side='left')
+        self.stroke_confirm_btn.pack(side='left', padx=(0, 10))
+        
+        # 描边方式：native 使用 FreeType 描边（平滑），offset 为旧的偏移绘制方式
+        Label(style_frame, text="描边方式:").pack(side='left', padx=(0, 5))
+        self.stroke_style = StringVar(value=global_watermark_settings.text_settings['stroke_style'])
+        stroke_style_menu = OptionMenu(style_frame, self.stroke_style, "native", "offset")
+        stroke_style_menu.pack(side='left')
+        self.stroke_style.trace('w', self.on_setting_change)
         
         # 位置选择 - 单独一行
         position_frame = Frame(self)
@@ -166,7 +178,9 @@ class TextWatermarkOptions(Frame):
             font_size_value = self.get_safe_int_value(self.font_size)
             stroke_width_value = self.get_safe_int_value(self.stroke_width)
             
-            # 更新全局设置
+            # 更新全局设置；换了字体时字体集序号回到第一个
+            if self.font_family.get() != global_watermark_settings.text_settings['font_family']:
+                global_watermark_settings.update_text_setting('font_index', 0)
             global_watermark_settings.update_text_setting('font_family', self.font_family.get())
             if font_size_value is not None:
                 global_watermark_settings.update_text_setting('font_size', font_size_value)
@@ -174,6 +188,7 @@ class TextWatermarkOptions(Frame):
             global_watermark_settings.update_text_setting('opacity', self.opacity.get())
             if stroke_width_value is not None:
                 global_watermark_settings.update_text_setting('stroke_width', stroke_width_value)
+            global_watermark_settings.update_text_setting('stroke_style', self.stroke_style.get())
             
             if self.update_callback:
                 self.update_callback(immediate=True)  # 设置变化立即更新
@@ -269,196 +284,6 @@ class TextWatermarkOptions(Frame):
             if self.update_callback:
                 self.update_callback(immediate=True)
 
-    def get_font(self):
-        """获取字体对象 - 简化版本"""
-        try:
-            font_size = global_watermark_settings.text_settings['font_size']
-            font_family = global_watermark_settings.text_settings['font_family']
-            is_bold = global_watermark_settings.text_settings['bold'] == 1
-            is_italic = global_watermark_settings.text_settings['italic'] == 1
-            
-            # 构建字体名称
-            if is_bold and is_italic:
-                font_name = f"{font_family} Bold Italic"
-            elif is_bold:
-                font_name = f"{font_family} Bold"
-            elif is_italic:
-                font_name = f"{font_family} Italic"
-            else:
-                font_name = font_family
-            
-            try:
-                # 尝试加载字体
-                return ImageFont.truetype(font_name, font_size)
-            except:
-                # 如果失败，尝试基础字体
-                try:
-                    base_font = ImageFont.truetype(font_family, font_size)
-                    # 使用font_variant应用样式
-                    if is_bold and is_italic:
-                        return base_font.font_variant(bold=True, italic=True)
-                    elif is_bold:
-                        return base_font.font_variant(bold=True)
-                    elif is_italic:
-                        return base_font.font_variant(italic=True)
-                    else:
-                        return base_font
-                except:
-                    return ImageFont.load_default()
-                    
-        except Exception as e:
-            print(f"加载字体时出错: {e}")
-            return ImageFont.load_default()
-
-    def apply_watermark(self, image):
-        """应用文本水印到图片 - 修复：确保使用正确的字号"""
-        # 检查图片是否有效
-        if image is None:
-            print("错误: 图片对象为None")
-            return None
-            
-        if not global_watermark_settings.text_settings['text'].strip():
-            return image
-            
-        try:
-            # 创建水印层
-            watermark = Image.new("RGBA", image.size, (255, 255, 255, 0))
-            draw = ImageDraw.Draw(watermark)
-            
-            # 修复3: 直接使用全局设置中的字号，不进行额外缩放
-            font_size = global_watermark_settings.text_settings['font_size']
-            print(f"应用水印使用字号: {font_size}")  # 调试信息
-            
-            # 确保字号不会太小
-            if font_size < 12:
-                font_size = 12
-                
-            # 重新创建字体对象
-            font_family = global_watermark_settings.text_settings['font_family']
-            is_bold = global_watermark_settings.text_settings['bold'] == 1
-            is_italic = global_watermark_settings.text_settings['italic'] == 1
-            
-            if is_bold and is_italic:
-                font_name = f"{font_family} Bold Italic"
-            elif is_bold:
-                font_name = f"{font_family} Bold"
-            elif is_italic:
-                font_name = f"{font_family} Italic"
-            else:
-                font_name = font_family
-            
-            try:
-                font = ImageFont.truetype(font_name, font_size)
-            except:
-                try:
-                    base_font = ImageFont.truetype(font_family, font_size)
-                    if is_bold and is_italic:
-                        font = base_font.font_variant(bold=True, italic=True)
-                    elif is_bold:
-                        font = base_font.font_variant(bold=True)
-                    elif is_italic:
-                        font = base_font.font_variant(italic=True)
-                    else:
-                        font = base_font
-                except:
-                    font = ImageFont.load_default()
-            
-            # 获取文本
-            text = global_watermark_settings.text_settings['text']
-            
-            # 计算文本尺寸
-            try:
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-            except:
-                # 如果计算失败，使用估计值
-                text_width = len(text) * font_size // 2
-                text_height = font_size
-            
-            # 计算位置
-            position = self.get_text_position(image.size, (text_width, text_height))
-            
-            # 设置透明度
-            opacity = int(255 * global_watermark_settings.text_settings['opacity'] / 100)
-            color = global_watermark_settings.text_settings['color']
-            fill_color = self.hex_to_rgba(color, opacity)
-            
-            # 应用样式效果
-            if global_watermark_settings.text_settings['stroke']:
-                self.add_stroke(draw, text, position, font, fill_color)
-            elif global_watermark_settings.text_settings['shadow']:
-                self.add_shadow(draw, text, position, font, fill_color)
-            else:
-                draw.text(position, text, font=font, fill=fill_color)
-            
-            # 合并水印和原图
-            return Image.alpha_composite(image.convert("RGBA"), watermark)
-            
-        except Exception as e:
-            print(f"应用文本水印时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            return image
-    
-    def get_text_position(self, image_size, text_size):
-        """根据位置设置计算文本坐标"""
-        img_width, img_height = image_size
-        text_width, text_height = text_size
-        
-        position = global_watermark_settings.text_settings['position']
-        margin = 20  # 边距
-        
-        if position == "center":
-            return ((img_width - text_width) // 2, (img_height - text_height) // 2)
-        elif position == "top-left":
-            return (margin, margin)
-        elif position == "top":
-            return ((img_width - text_width) // 2, margin)
-        elif position == "top-right":
-            return (img_width - text_width - margin, margin)
-        elif position == "left":
-            return (margin, (img_height - text_height) // 2)
-        elif position == "right":
-            return (img_width - text_width - margin, (img_height - text_height) // 2)
-        elif position == "bottom-left":
-            return (margin, img_height - text_height - margin)
-        elif position == "bottom":
-            return ((img_width - text_width) // 2, img_height - text_height - margin)
-        elif position == "bottom-right":
-            return (img_width - text_width - margin, img_height - text_height - margin)
-        else:
-            return (margin, margin)  # 默认位置
-    
-    def add_stroke(self, draw, text, position, font, fill_color):
-        """添加描边效果"""
-        stroke_width = global_watermark_settings.text_settings['stroke_width']
-        x, y = position
-        
-        # 在多个方向绘制文本来创建描边效果
-        for dx in [-stroke_width, 0, stroke_width]:
-            for dy in [-stroke_width, 0, stroke_width]:
-                if dx != 0 or dy != 0:
-                    draw.text((x + dx, y + dy), text, font=font, fill=(0, 0, 0, fill_color[3]))
-        
-        # 绘制主文本
-        draw.text(position, text, font=font, fill=fill_color)
-    
-    def add_shadow(self, draw, text, position, font, fill_color):
-        """添加阴影效果"""
-        x, y = position
-        shadow_color = (0, 0, 0, fill_color[3] // 2)  # 半透明黑色阴影
-        draw.text((x + 2, y + 2), text, font=font, fill=shadow_color)
-        draw.text(position, text, font=font, fill=fill_color)
-    
-    def hex_to_rgba(self, hex_color, alpha):
-        """将十六进制颜色转换为RGBA"""
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        return (r, g, b, alpha)
-
     def get_settings(self):
         """获取当前文本水印设置"""
         return global_watermark_settings.text_settings.copy()
@@ -468,6 +293,8 @@ class TextWatermarkOptions(Frame):
         # 暂时禁用回调
         old_callback = self.update_callback
         self.update_callback = None
+        settings = load_text_settings(settings)
+        settings.setdefault('font_index', 0)
         
         self.text_entry.delete(0, END)
         self.text_entry.insert(0, settings.get('text', 'Watermark'))
@@ -482,6 +309,7 @@ class TextWatermarkOptions(Frame):
         self.shadow.set(settings.get('shadow', 0))
         self.stroke.set(settings.get('stroke', 0))
         self.stroke_width.set(settings.get('stroke_width', 2))
+        self.stroke_style.set(settings['stroke_style'])
         self.position.set(settings.get('position', 'center'))
         
         # 更新全局设置
@@ -0,0 +1,163 @@
+"""虚拟化的图片列表 - 只绘制可见的行，列表中有几万张图片时滚动和选择依然流畅
+
+列表本身只保存路径，每行的小缩略图通过 thumbnail_provider(序号) 按需获取；
+还没有缩略图时绘制占位框，缩略图生成后调用 redraw_row() 刷新。
+每次重绘后调用 on_redraw(可见行范围)，调用方可以据此预取可见区域附近的缩略图。
+"""
+import os
+from tkinter import Frame, Canvas, Scrollbar, NW, W
+
+ROW_HEIGHT = 56
+THUMB_SIZE = (48, 48)
+ROW_PADDING = 4
+PLACEHOLDER_COLOR = "#e0e0e0"
+SELECTED_COLOR = "#cce4ff"
+
+
+class ThumbnailList(Frame):
+    """items 为与调用方共享的路径列表，修改后调用 refresh()"""
+    def __init__(self, master, items, thumbnail_provider=None, on_select=None, on_redraw=None,
+                 width=220, height=400):
+        super().__init__(master)
+        self.items = items
+        self.thumbnail_provider = thumbnail_provider
+        self.on_select = on_select
+        self.on_redraw = on_redraw
+        self.selected_index = None
+        self.top = 0  # 可见区域顶部在整个列表中的像素位置
+
+        self.canvas = Canvas(self, width=width, height=height, bg="white", highlightthickness=0)
+        self.scrollbar = Scrollbar(self, command=self.yview)
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<ButtonPress-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind("<Button-4>", self._on_mousewheel)
+        self.canvas.bind("<Button-5>", self._on_mousewheel)
+        self.canvas.bind("<Up>", lambda event: self._move_selection(-1))
+        self.canvas.bind("<Down>", lambda event: self._move_selection(1))
+        self.canvas.bind("<Prior>", lambda event: self._move_selection(-self._rows_per_page()))
+        self.canvas.bind("<Next>", lambda event: self._move_selection(self._rows_per_page()))
+
+    def _view_height(self):
+        return max(1, self.canvas.winfo_height())
+
+    def _content_height(self):
+        return len(self.items) * ROW_HEIGHT
+
+    def _rows_per_page(self):
+        return max(1, self._view_height() // ROW_HEIGHT)
+
+    def _set_top(self, top):
+        self.top = max(0, min(top, self._content_height() - self._view_height()))
+        self.redraw()
+
+    def yview(self, *args):
+        """滚动条回调：('moveto', 比例) 或 ('scroll', 数量, 'units'/'pages')"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self._set_top(int(float(args[1]) * self._content_height()))
+        elif args[0] == 'scroll':
+            step = ROW_HEIGHT if args[2] == 'units' else self._view_height()
+            self._set_top(self.top + int(args[1]) * step)
+
+    def visible_range(self):
+        """当前可见的行序号"""
+        first = self.top // ROW_HEIGHT
+        last = min(len(self.items), (self.top + self._view_height()) // ROW_HEIGHT + 1)
+        return range(first, max(first, last))
+
+    def redraw(self):
+        """重新绘制可见的行（只有一屏的行，开销与列表长度无关）"""
+        self.canvas.delete("all")
+        width = self.canvas.winfo_width()
+        thumb_width, thumb_height = THUMB_SIZE
+        visible = self.visible_range()
+        for index in visible:
+            y = index * ROW_HEIGHT - self.top
+            if index == self.selected_index:
+                self.canvas.create_rectangle(0, y, width, y + ROW_HEIGHT, fill=SELECTED_COLOR, outline="")
+
+            thumb = self.thumbnail_provider(index) if self.thumbnail_provider else None
+            thumb_x = ROW_PADDING
+            thumb_y = y + (ROW_HEIGHT - thumb_height) // 2
+            if thumb is not None:
+                # 缩略图保持宽高比，在缩略图区域中居中
+                self.canvas.create_image(thumb_x + (thumb_width - thumb.width()) // 2,
+                                         thumb_y + (thumb_height - thumb.height()) // 2,
+                                         anchor=NW, image=thumb)
+            else:
+                self.canvas.create_rectangle(thumb_x, thumb_y, thumb_x + thumb_width, thumb_y + thumb_height,
+                                             fill=PLACEHOLDER_COLOR, outline="")
+            self.canvas.create_text(thumb_x + thumb_width + 2 * ROW_PADDING, y + ROW_HEIGHT // 2, anchor=W,
+                                    text=os.path.basename(self.items[index]))
+
+        content_height = self._content_height()
+        if content_height <= self._view_height():
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / content_height, (self.top + self._view_height()) / content_height)
+        if self.on_redraw:
+            self.on_redraw(visible)
+
+    def redraw_row(self, index):
+        """某一行的缩略图已生成，可见时刷新"""
+        if index in self.visible_range():
+            self.redraw()
+
+    def refresh(self):
+        """items 改变后调用：修正选中行和滚动位置并重新绘制"""
+        if self.selected_index is not None and self.selected_index >= len(self.items):
+            self.selected_index = None
+        self._set_top(self.top)
+
+    def see(self, index):
+        """滚动到让第 index 行可见"""
+        row_top = index * ROW_HEIGHT
+        if row_top < self.top:
+            self._set_top(row_top)
+        elif row_top + ROW_HEIGHT > self.top + self._view_height():
+            self._set_top(row_top + ROW_HEIGHT - self._view_height())
+
+    def selection(self):
+        """选中行的序号，没有选中时返回None"""
+        return self.selected_index
+
+    def select(self, index):
+        """选中第 index 行并通知 on_select"""
+        if not 0 <= index < len(self.items):
+            return
+        self.selected_index = index
+        self.see(index)
+        self.redraw()
+        if self.on_select:
+            self.on_select(index)
+
+    def clear_selection(self):
+        self.selected_index = None
+        self.redraw()
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        index = (self.top + event.y) // ROW_HEIGHT
+        if index < len(self.items):
+            self.select(index)
+
+    def _move_selection(self, offset):
+        if not self.items:
+            return
+        if self.selected_index is None:
+            self.select(0)
+        else:
+            self.select(max(0, min(len(self.items) - 1, self.selected_index + offset)))
+
+    def _on_mousewheel(self, event):
+        if event.delta:
+            self.yview('scroll', int(-1 * (event.delta / 120)), 'units')
+        elif event.num == 4:
+            self.yview('scroll', -1, 'units')
+        elif event.num == 5:
+            self.yview('scroll', 1, 'units')
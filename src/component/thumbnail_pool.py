@@ -0,0 +1,151 @@
+"""缩略图工作线程池 - 在后台线程解码图片、生成缩略图和预览，界面通过轮询获取结果（不使用Tk）
+
+任务按优先级执行：选中的图片 -> 可见的行 -> 后台预取。
+每个任务属于一个频道（默认为键的第一项，如 'thumbnail'、'preview'）：
+    cancel(频道)           选中的图片或设置改变时调用，排队中的任务不再执行，正在执行的任务结果被丢弃
+    retain(频道, 键集合)   列表滚动后调用，只保留仍然需要的排队任务，正在执行的任务结果照常返回
+PhotoImage 只能在主线程创建，所以任务只返回PIL图片，界面应使用 after() 定期调用 poll()。
+"""
+import os
+import heapq
+import queue
+import itertools
+import threading
+
+PRIORITY_SELECTED = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_PREFETCH = 2
+
+
+def default_workers():
+    """默认线程数：留一个核心给界面，最多4个"""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+class _Job:
+    def __init__(self, key, channel, generation, priority, func, args):
+        self.key = key
+        self.channel = channel
+        self.generation = generation
+        self.priority = priority
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+
+class ThumbnailPool:
+    """带优先级和取消的线程池，线程在第一次提交任务时启动"""
+    def __init__(self, workers=None):
+        self.workers = workers or default_workers()
+        self._condition = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._pending = {}   # {键: 排队中的任务}
+        self._running = {}   # {键: 正在执行的任务的 generation}
+        self._generations = {}
+        self._results = queue.Queue()
+        self._threads = []
+        self._closed = False
+
+    def _start_threads(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"thumbnail-worker-{len(self._threads)}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def generation(self, channel):
+        """频道当前的代数，cancel() 后加一"""
+        return self._generations.get(channel, 0)
+
+    def submit(self, key, func, *args, priority=PRIORITY_PREFETCH, channel=None):
+        """提交任务 func(*args)，相同的键已在排队时只提高优先级，已在执行时不重复提交"""
+        channel = key[0] if channel is None else channel
+        with self._condition:
+            if self._closed:
+                return
+            generation = self.generation(channel)
+            if self._running.get(key) == generation:
+                return
+            job = self._pending.get(key)
+            if job is not None:
+                if job.priority <= priority and job.generation == generation:
+                    return
+                job.cancelled = True
+            job = _Job(key, channel, generation, priority, func, args)
+            self._pending[key] = job
+            heapq.heappush(self._heap, (priority, next(self._counter), job))
+            self._start_threads()
+            self._condition.notify()
+
+    def cancel(self, channel):
+        """取消频道中所有排队的任务，正在执行的任务完成后结果被丢弃"""
+        with self._condition:
+            self._generations[channel] = self.generation(channel) + 1
+            for key, job in list(self._pending.items()):
+                if job.channel == channel:
+                    job.cancelled = True
+                    del self._pending[key]
+
+    def retain(self, channel, keys):
+        """取消频道中键不在 keys 中的排队任务"""
+        with self._condition:
+            for key, job in list(self._pending.items()):
+                if job.channel == channel and key not in keys:
+                    job.cancelled = True
+                    del self._pending[key]
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                while not self._heap and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return None
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                del self._pending[job.key]
+                self._running[job.key] = job.generation
+                return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                result, error = job.func(*job.args), None
+            except Exception as e:
+                result, error = None, e
+            with self._condition:
+                if self._running.get(job.key) == job.generation:
+                    del self._running[job.key]
+            self._results.put((job, result, error))
+
+    @property
+    def busy(self):
+        """是否还有排队、执行中或未取走的结果"""
+        with self._condition:
+            return bool(self._pending or self._running) or not self._results.empty()
+
+    def poll(self):
+        """取出已完成的任务，返回 [(键, 结果, 错误)]；已取消频道的结果不返回"""
+        results = []
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                return results
+            if job.generation == self.generation(job.channel):
+                results.append((job.key, result, error))
+
+    def close(self):
+        """停止工作线程（正在执行的任务完成后退出）"""
+        with self._condition:
+            self._closed = True
+            for job in self._pending.values():
+                job.cancelled = True
+            self._pending.clear()
+            self._heap.clear()
+            self._condition.notify_all()
@@ -4,12 +4,19 @@ from tkinter import messagebox, filedialog
 import tkinter.simpledialog
 import tkinter as tk  # 添加这行
 import tkinter.simpledialog  # 确保这行存在
-from PIL import Image, ImageDraw, ImageFont
+from tkinter import ttk
 from .watermark_settings import global_watermark_settings
+from .export_engine import ExportOptions, default_workers, NAMING_RULES, NAMING_SUFFIX
+from .export_job import ExportJob, format_duration
+from .export_journal import has_journal
 from .template_manager import TemplateManager
+from .template_bundle import BUNDLE_EXTENSION
 from .text_watermark_options import TextWatermarkOptions
 from .image_watermark_options import ImageWatermarkOptions
 
+# 导出进度的轮询间隔（毫秒）
+EXPORT_POLL_MS = 100
+
 class WatermarkOptions(Frame):
     def __init__(self, master, images_ref, output_format_ref, update_callback=None):
         super().__init__(master)
@@ -21,10 +28,6 @@ class WatermarkOptions(Frame):
         # 初始化模板管理器
         self.template_manager = TemplateManager()
         
-        # 缓存处理过的图片
-        self.processed_images_cache = {}
-        self.last_settings_version = global_watermark_settings._version  # 记录最后设置版本
-        
         # 水印类型选择 - 紧凑布局
         type_frame = Frame(self)
         type_frame.grid(row=0, column=0, columnspan=3, sticky='w', padx=5, pady=5)
@@ -62,8 +65,8 @@ class WatermarkOptions(Frame):
         Button(export_row1, text="选择", command=self.select_export_folder, width=6).pack(side='left', padx=(0, 15))
         
         Label(export_row1, text="命名规则:").pack(side='left', padx=(0, 5))
-        self.naming_rule = StringVar(value="添加后缀")
-        naming_menu = OptionMenu(export_row1, self.naming_rule, "原文件名", "添加前缀", "添加后缀")
+        self.naming_rule = StringVar(value=NAMING_SUFFIX)
+        naming_menu = OptionMenu(export_row1, self.naming_rule, *NAMING_RULES)
         naming_menu.config(width=10)
         naming_menu.pack(side='left', padx=(0, 5))
         
@@ -85,7 +88,17 @@ class WatermarkOptions(Frame):
         Label(export_row2, text="缩放比例(%):").pack(side='left', padx=(0, 5))
         self.scale_percent = Scale(export_row2, from_=10, to=200, orient='horizontal', length=120)
         self.scale_percent.set(100)
-        self.scale_percent.pack(side='left', padx=(0, 5))
+        self.scale_percent.pack(side='left', padx=(0, 15))
+        
+        # 并行导出进程数
+        Label(export_row2, text="并行进程:").pack(side='left', padx=(0, 5))
+        self.workers = Scale(export_row2, from_=1, to=default_workers(), orient='horizontal', length=80)
+        self.workers.set(default_workers())
+        self.workers.pack(side='left', padx=(0, 5))
+        
+        # 增量导出：跳过源文件和设置都没有变化的图片，变化的图片覆盖上次的输出
+        self.incremental = tk.BooleanVar(value=True)
+        tk.Checkbutton(export_row2, text="跳过未变化", variable=self.incremental).pack(side='left', padx=(5, 0))
         
         # 第三行：导出按钮和模板管理
         export_row3 = Frame(export_frame)
@@ -96,6 +109,11 @@ class WatermarkOptions(Frame):
                                 bg="#4CAF50", fg="black", font=("Arial", 10, "bold"), width=10, padx=10)
         self.export_btn.pack(side='left', padx=(0, 10))
         
+        # 继续未完成的导出
+        self.resume_btn = Button(export_row3, text="继续导出", command=self.resume_export_job,
+                                font=("Arial", 10), width=8)
+        self.resume_btn.pack(side='left', padx=(0, 10))
+        
         # 模板管理按钮
         self.template_btn = Button(export_row3, text="模板管理", command=self.manage_templates,
                                   bg="#2196F3", fg="black", font=("Arial", 10), width=8)
@@ -106,25 +124,32 @@ class WatermarkOptions(Frame):
                                        bg="#FF9800", fg="black", font=("Arial", 10), width=8)
         self.save_template_btn.pack(side='left', padx=(0, 5))
         
+        # 第四行：导出进度、速度、剩余时间和取消按钮
+        export_row4 = Frame(export_frame)
+        export_row4.pack(fill='x', pady=(5, 0))
+        
+        self.progress_bar = ttk.Progressbar(export_row4, orient='horizontal', length=200, mode='determinate')
+        self.progress_bar.pack(side='left', padx=(0, 10))
+        
+        self.progress_label = Label(export_row4, text="", anchor='w')
+        self.progress_label.pack(side='left', fill='x', expand=True)
+        
+        self.cancel_export_btn = Button(export_row4, text="取消导出", command=self.cancel_export,
+                                        state='disabled', width=8)
+        self.cancel_export_btn.pack(side='right')
+        
+        self.export_job = None
+        
         # 加载默认模板
         self.load_default_template()
 
     def update_preview_callback(self, immediate=False):
         """包装更新回调，支持延迟更新"""
-        if self.update_callback:
-            # 检查设置版本是否变化
-            if global_watermark_settings._version != self.last_settings_version:
-                # 设置已变化，清空缓存
-                self.processed_images_cache.clear()
-                self.last_settings_version = global_watermark_settings._version
-            
-            if immediate:
-                # 立即更新当前预览
-                self.update_callback()
-            else:
-                # 对于非立即更新，我们也清空缓存确保下次显示最新设置
-                self.processed_images_cache.clear()
-                self.last_settings_version = global_watermark_settings._version
+        # 缓存键包含设置内容的哈希，设置变化后旧结果不会被命中，因此不需要清空缓存；
+        # 改回之前的设置时还能直接复用
+        if self.update_callback and immediate:
+            # 立即更新当前预览
+            self.update_callback()
 
     def switch_watermark_type(self):
         """切换水印类型显示"""
@@ -137,10 +162,6 @@ class WatermarkOptions(Frame):
             self.text_options.grid_remove()
             self.image_options.grid()
         
-        # 清空缓存，因为水印类型改变了
-        self.processed_images_cache.clear()
-        self.last_settings_version = global_watermark_settings._version
-        
         if self.update_callback:
             self.update_callback()
 
@@ -150,10 +171,8 @@ class WatermarkOptions(Frame):
         if folder:
             # 检查是否选择了原文件夹
             original_folders = set()
-            for image_data in self.images_ref:
-                if image_data and len(image_data) > 0:
-                    original_folder = os.path.dirname(image_data[0])
-                    original_folders.add(original_folder)
+            for image_path in self.images_ref:
+                original_folders.add(os.path.dirname(image_path))
             
             if folder in original_folders:
                 self.show_message("警告", "为了安全起见，请不要导出到原文件夹！\n请选择其他文件夹。")
@@ -162,42 +181,6 @@ class WatermarkOptions(Frame):
             self.export_folder.delete(0, END)
             self.export_folder.insert(0, folder)
 
-    def apply_watermark_preview(self, image, image_path):
-        """应用水印用于预览 - 支持缓存，根据位置模式选择应用方式"""
-        if image is None:
-            return None
-        
-        # 生成缓存键，包含设置版本号和位置模式
-        cache_key = f"{image_path}_{global_watermark_settings.watermark_type}_{global_watermark_settings._version}"
-        
-        # 检查缓存
-        if cache_key in self.processed_images_cache:
-            return self.processed_images_cache[cache_key]
-        
-        try:
-            # 根据位置模式选择不同的水印应用方式
-            if global_watermark_settings.use_custom_position and global_watermark_settings.custom_position:
-                # 使用自定义位置
-                rel_x, rel_y = global_watermark_settings.custom_position
-                result = self.apply_watermark_with_custom_position(image, rel_x, rel_y)
-            else:
-                # 使用预设位置
-                if global_watermark_settings.watermark_type == "text":
-                    result = self.text_options.apply_watermark(image)
-                else:
-                    result = self.image_options.apply_watermark(image)
-            
-            if result is None:
-                return image
-            
-            # 缓存结果
-            self.processed_images_cache[cache_key] = result
-            return result
-            
-        except Exception as e:
-            print(f"应用水印预览时出错: {e}")
-            return image
-
     def get_current_settings(self):
         """获取当前所有设置，包括位置模式"""
         return {
@@ -208,168 +191,6 @@ class WatermarkOptions(Frame):
             'custom_position': global_watermark_settings.custom_position
         }
 
-    def apply_watermark_with_custom_position(self, image, rel_x, rel_y):
-        """使用自定义位置应用水印到原图 - 确保统一大小"""
-        if global_watermark_settings.watermark_type == "text":
-            return self.apply_text_watermark_custom(image, rel_x, rel_y)
-        else:
-            return self.apply_image_watermark_custom(image, rel_x, rel_y)
-
-    def apply_text_watermark_custom(self, image, rel_x, rel_y):
-        """应用文本水印到自定义位置 - 使用全局设置中的字号"""
-        if not global_watermark_settings.text_settings['text'].strip():
-            return image
-            
-        # 创建水印层
-        watermark = Image.new("RGBA", image.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(watermark)
-        
-        # 修复：直接从全局设置中获取字号，不使用固定比例
-        # 确保字号有效
-        font_size = global_watermark_settings.text_settings['font_size']
-        if font_size < 12:  # 设置最小字号限制
-            font_size = 12
-        print(f"应用文本水印 - 使用全局字号: {font_size}")  # 调试信息
-        
-        # 重新创建字体对象
-        font_family = global_watermark_settings.text_settings['font_family']
-        is_bold = global_watermark_settings.text_settings['bold'] == 1
-        is_italic = global_watermark_settings.text_settings['italic'] == 1
-        
-        if is_bold and is_italic:
-            font_name = f"{font_family} Bold Italic"
-        elif is_bold:
-            font_name = f"{font_family} Bold"
-        elif is_italic:
-            font_name = f"{font_family} Italic"
-        else:
-            font_name = font_family
-        
-        try:
-            font = ImageFont.truetype(font_name, font_size)
-        except:
-            try:
-                base_font = ImageFont.truetype(font_family, font_size)
-                if is_bold and is_italic:
-                    font = base_font.font_variant(bold=True, italic=True)
-                elif is_bold:
-                    font = base_font.font_variant(bold=True)
-                elif is_italic:
-                    font = base_font.font_variant(italic=True)
-                else:
-                    font = base_font
-            except:
-                font = ImageFont.load_default()
-        
-        # 获取文本
-        text = global_watermark_settings.text_settings['text']
-        
-        # 计算文本尺寸
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except:
-            text_width = len(text) * font_size // 2
-            text_height = font_size
-        
-        # 计算自定义位置（将相对坐标转换为绝对坐标）
-        img_width, img_height = image.size
-        position_x = int(rel_x * (img_width - text_width))
-        position_y = int(rel_y * (img_height - text_height))
-        
-        # 设置透明度
-        opacity = int(255 * global_watermark_settings.text_settings['opacity'] / 100)
-        color = global_watermark_settings.text_settings['color']
-        fill_color = self.text_options.hex_to_rgba(color, opacity)
-        
-        # 应用样式效果
-        if global_watermark_settings.text_settings['stroke']:
-            self.text_options.add_stroke(draw, text, (position_x, position_y), font, fill_color)
-        elif global_watermark_settings.text_settings['shadow']:
-            self.text_options.add_shadow(draw, text, (position_x, position_y), font, fill_color)
-        else:
-            draw.text((position_x, position_y), text, font=font, fill=fill_color)
-        
-        # 合并水印和原图
-        return Image.alpha_composite(image.convert("RGBA"), watermark)
-
-    def apply_image_watermark_custom(self, image, rel_x, rel_y):
-        """应用图片水印到自定义位置"""
-        if not global_watermark_settings.image_settings['image_path']:
-            return image
-            
-        try:
-            # 打开水印图片
-            watermark = Image.open(global_watermark_settings.image_settings['image_path']).convert("RGBA")
-            
-            # 缩放水印 - 使用基于图片尺寸的固定比例，确保视觉大小一致
-            base_size = min(image.width, image.height)
-            scale_factor = global_watermark_settings.image_settings['scale_percent'] / 100.0
-            
-            # 使用固定比例而不是绝对值
-            target_size = int(base_size * scale_factor * 0.15)  # 15% 的图片高度
-            
-            # 保持水印图片的宽高比
-            wm_ratio = watermark.width / watermark.height
-            if wm_ratio > 1:
-                new_width = target_size
-                new_height = int(target_size / wm_ratio)
-            else:
-                new_height = target_size
-                new_width = int(target_size * wm_ratio)
-            
-            # 确保水印不会太小或太大
-            min_size = base_size * 0.05  # 最小5%
-            max_size = base_size * 0.3   # 最大30%
-            
-            if new_width < min_size or new_height < min_size:
-                if new_width < new_height:
-                    new_width = int(min_size)
-                    new_height = int(min_size / wm_ratio)
-                else:
-                    new_height = int(min_size)
-                    new_width = int(min_size * wm_ratio)
-            elif new_width > max_size or new_height > max_size:
-                if new_width > new_height:
-                    new_width = int(max_size)
-                    new_height = int(max_size / wm_ratio)
-                else:
-                    new_height = int(max_size)
-                    new_width = int(max_size * wm_ratio)
-            
-            watermark = watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 设置透明度
-            opacity = global_watermark_settings.image_settings['opacity'] / 100.0
-            watermark = self.apply_opacity_to_image(watermark, opacity)
-            
-            # 计算自定义位置（将相对坐标转换为绝对坐标）
-            img_width, img_height = image.size
-            position_x = int(rel_x * (img_width - new_width))
-            position_y = int(rel_y * (img_height - new_height))
-            
-            # 创建结果图片
-            result = image.convert("RGBA")
-            result.paste(watermark, (position_x, position_y), watermark)
-            
-            return result
-            
-        except Exception as e:
-            print(f"应用自定义位置图片水印时出错: {e}")
-            return image
-
-    def apply_opacity_to_image(self, image, opacity):
-        """调整图片透明度"""
-        if opacity >= 1.0:
-            return image
-            
-        # 创建一个新的alpha通道
-        alpha = image.split()[3]
-        alpha = alpha.point(lambda p: p * opacity)
-        image.putalpha(alpha)
-        return image
-
     def add_watermark_and_export(self):
         """批量添加水印并导出 - 修复版本"""
         images = self.images_ref
@@ -386,106 +207,118 @@ class WatermarkOptions(Frame):
         
         # 检查是否导出到原文件夹
         original_folders = set()
-        for image_data in images:
-            if image_data and len(image_data) > 0:
-                original_folder = os.path.dirname(image_data[0])
-                original_folders.add(original_folder)
+        for image_path in images:
+            original_folders.add(os.path.dirname(image_path))
         
         if export_dir in original_folders:
             self.show_message("错误", "为了安全起见，禁止导出到原文件夹！\n请选择其他文件夹。")
             return
 
-        success_count = 0
-        total_count = len(images)
-        
-        for i, image_data in enumerate(images):
-            try:
-                # 正确获取文件路径（第一个元素）
-                img_path = image_data[0]
-                
-                print(f"正在处理第 {i+1}/{total_count} 张图片: {os.path.basename(img_path)}")
-                
-                # 检查文件是否存在
-                if not os.path.exists(img_path):
-                    print(f"错误: 图片文件不存在: {img_path}")
-                    continue
-                
-                # 每次都重新从文件加载原图
-                with Image.open(img_path) as original_img:
-                    # 转换为RGBA模式
-                    if original_img.mode != 'RGBA':
-                        original_img = original_img.convert("RGBA")
-                    
-                    # 应用水印
-                    watermarked_img = self.apply_watermark_preview(original_img, img_path)
-                    
-                    if watermarked_img is None:
-                        print(f"警告: 图片 {img_path} 水印应用失败，跳过")
-                        continue
-                    
-                    # 应用图片缩放
-                    scale_factor = self.scale_percent.get() / 100.0
-                    if scale_factor != 1.0:
-                        new_width = int(watermarked_img.width * scale_factor)
-                        new_height = int(watermarked_img.height * scale_factor)
-                        watermarked_img = watermarked_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    # 生成输出文件名
-                    basename = os.path.splitext(os.path.basename(img_path))[0]
-                    ext = ".png" if output_format == "PNG" else ".jpg"
-                    
-                    # 根据命名规则生成文件名
-                    naming_rule = self.naming_rule.get()
-                    custom_text = self.custom_text.get().strip()
-                    
-                    if naming_rule == "原文件名":
-                        outname = f"{basename}{ext}"
-                    elif naming_rule == "添加前缀" and custom_text:
-                        outname = f"{custom_text}{basename}{ext}"
-                    elif naming_rule == "添加后缀" and custom_text:
-                        outname = f"{basename}{custom_text}{ext}"
-                    else:
-                        outname = f"{basename}_watermarked{ext}"
-                    
-                    outpath = os.path.join(export_dir, outname)
-                    
-                    # 如果文件已存在，添加数字后缀
-                    counter = 1
-                    while os.path.exists(outpath):
-                        if naming_rule == "原文件名":
-                            outname = f"{basename}_{counter}{ext}"
-                        elif naming_rule == "添加前缀" and custom_text:
-                            outname = f"{custom_text}{basename}_{counter}{ext}"
-                        elif naming_rule == "添加后缀" and custom_text:
-                            outname = f"{basename}{custom_text}_{counter}{ext}"
-                        else:
-                            outname = f"{basename}_watermarked_{counter}{ext}"
-                        outpath = os.path.join(export_dir, outname)
-                        counter += 1
-                    
-                    # 保存图片
-                    save_kwargs = {}
-                    if output_format == "JPEG":
-                        watermarked_img = watermarked_img.convert("RGB")
-                        save_kwargs['quality'] = self.quality.get()
-                        save_kwargs['optimize'] = True
-                    
-                    watermarked_img.save(outpath, output_format, **save_kwargs)
-                    print(f"成功导出: {outname}")
-                    success_count += 1
-                    
-            except Exception as e:
-                print(f"处理图片 {image_data[0]} 时出错: {e}")
-                import traceback
-                traceback.print_exc()
+        # 导出文件夹中有未完成的任务时，询问是否继续上次的导出
+        if has_journal(export_dir) and messagebox.askyesno(
+                "继续导出", "该文件夹中有未完成的导出任务，是否继续上次的导出？\n选择“否”将开始新的导出。"):
+            self.resume_export_job()
+            return
+
+        options = ExportOptions(
+            output_dir=export_dir,
+            output_format=output_format,
+            quality=self.quality.get(),
+            scale_percent=self.scale_percent.get(),
+            naming_rule=self.naming_rule.get(),
+            custom_text=self.custom_text.get()
+        )
+        source_paths = list(images)
+        
+        # 在后台运行导出，工作进程使用设置快照，不读取全局设置
+        self.start_export_job(ExportJob(source_paths, global_watermark_settings.snapshot(), options,
+                                        workers=self.workers.get(), incremental=self.incremental.get()))
+
+    def resume_export_job(self):
+        """继续导出文件夹中未完成的导出任务（使用任务日志中保存的设置和选项）"""
+        export_dir = self.export_folder.get()
+        if not export_dir or not os.path.exists(export_dir):
+            self.show_message("错误", "请选择有效的导出文件夹")
+            return
+        job = ExportJob.resume_from(export_dir, workers=self.workers.get())
+        if job is None:
+            self.show_message("提示", "该文件夹中没有未完成的导出任务")
+            return
+        self.start_export_job(job)
+
+    def start_export_job(self, job):
+        """启动后台导出任务并开始轮询进度"""
+        self.export_job = job
+        job.start()
+        
+        self.export_btn.config(state='disabled')
+        self.resume_btn.config(state='disabled')
+        self.cancel_export_btn.config(state='normal')
+        self.progress_bar.config(maximum=job.total, value=0)
+        self.progress_label.config(text=f"0/{job.total} 准备中...")
+        self.after(EXPORT_POLL_MS, self.poll_export_job)
+
+    def poll_export_job(self):
+        """定期读取后台导出任务的进度并更新界面"""
+        job = self.export_job
+        if job is None:
+            return
         
-        # 显示结果
-        if success_count == total_count:
+        for task, error in job.poll():
+            if error is None:
+                print(f"成功导出: {os.path.basename(task.output_path)}")
+            else:
+                print(f"处理图片 {task.source_path} 时出错: {error}")
+        
+        self.progress_bar.config(maximum=max(job.total, 1), value=job.done)
+        status = f"{job.done}/{job.total}  {job.throughput():.1f} 张/秒"
+        eta = job.eta()
+        if eta is not None and job.done < job.total:
+            status += f"  剩余约 {format_duration(eta)}"
+        if job.cancel_requested and not job.finished:
+            status += "  正在取消..."
+        self.progress_label.config(text=status)
+        
+        if job.finished:
+            self.export_job = None
+            self.export_btn.config(state='normal')
+            self.resume_btn.config(state='normal')
+            self.cancel_export_btn.config(state='disabled')
+            self.show_export_result(job.result, len(job.source_paths), job.options.output_dir, job.elapsed())
+        else:
+            self.after(EXPORT_POLL_MS, self.poll_export_job)
+
+    def cancel_export(self):
+        """取消正在进行的导出（当前正在处理的图片完成后停止）"""
+        if self.export_job is not None:
+            self.export_job.cancel()
+            self.cancel_export_btn.config(state='disabled')
+
+    def show_export_result(self, result, total_count, export_dir, elapsed):
+        """显示导出结果"""
+        success_count = len(result.succeeded)
+        failed_count = len(result.failed)
+        skipped_count = len(result.skipped)
+        self.progress_label.config(text=f"{success_count}/{total_count - skipped_count} 用时 {format_duration(elapsed)}")
+        
+        if skipped_count == total_count:
+            self.show_message("完成", f"所有 {skipped_count} 张图片都没有变化，无需重新导出:\n{export_dir}")
+        elif skipped_count:
+            self.show_message("完成" if success_count + skipped_count == total_count else "部分完成",
+                            f"成功导出 {success_count} 张图片，跳过未变化的 {skipped_count} 张\n"
+                            f"失败: {failed_count} 张{'（已取消）' if result.cancelled else ''}\n"
+                            f"导出到: {export_dir}")
+        elif result.cancelled:
+            self.show_message("已取消",
+                            f"导出已取消\n"
+                            f"成功导出 {success_count}/{total_count} 张图片，失败 {failed_count} 张\n"
+                            f"导出到: {export_dir}")
+        elif success_count == total_count:
             self.show_message("完成", f"成功导出所有 {success_count} 张图片到:\n{export_dir}")
         elif success_count > 0:
             self.show_message("部分完成", 
                             f"成功导出 {success_count}/{total_count} 张图片\n"
-                            f"失败: {total_count - success_count} 张\n"
+                            f"失败: {failed_count} 张\n"
                             f"导出到: {export_dir}")
         else:
             self.show_message("失败", "所有图片导出失败，请查看控制台错误信息")
@@ -508,7 +341,7 @@ class WatermarkOptions(Frame):
         if not template_name:
             return
         
-        if template_name in self.template_manager.get_template_names():
+        if self.template_manager.has_template(template_name):
             if not messagebox.askyesno("确认", f"模板 '{template_name}' 已存在，是否覆盖？"):
                 return
         
@@ -529,7 +362,7 @@ class WatermarkOptions(Frame):
         """管理模板对话框"""
         dialog = Toplevel(self)
         dialog.title("水印模板管理")
-        dialog.geometry("500x400")
+        dialog.geometry("640x400")
         dialog.transient(self)
         dialog.grab_set()
         
@@ -589,6 +422,43 @@ class WatermarkOptions(Frame):
         
         Button(btn_frame, text="删除模板", command=delete_selected_template, width=10).pack(side='left', padx=5)
         
+        # 导出模板包按钮
+        def export_selected_bundle():
+            selection = template_list.curselection()
+            if not selection:
+                messagebox.showwarning("警告", "请先选择一个模板！")
+                return
+            
+            template_name = template_list.get(selection[0])
+            path = filedialog.asksaveasfilename(parent=dialog, title="导出模板包", initialfile=template_name + BUNDLE_EXTENSION,
+                                                defaultextension=BUNDLE_EXTENSION,
+                                                filetypes=[("模板包", "*" + BUNDLE_EXTENSION)])
+            if not path:
+                return
+            try:
+                self.template_manager.export_bundle(template_name, path,
+                                                    messagebox.askyesno("导出模板包", "是否同时包含字体文件？", parent=dialog))
+                messagebox.showinfo("成功", f"模板 '{template_name}' 已导出到 {path}")
+            except Exception as e:
+                messagebox.showerror("错误", f"导出模板包失败: {e}")
+        
+        Button(btn_frame, text="导出模板包", command=export_selected_bundle, width=10).pack(side='left', padx=5)
+        
+        # 导入模板包按钮
+        def import_bundle():
+            path = filedialog.askopenfilename(parent=dialog, title="导入模板包",
+                                              filetypes=[("模板包", "*" + BUNDLE_EXTENSION)])
+            if not path:
+                return
+            try:
+                template_name = self.template_manager.import_bundle(path)
+                refresh_list()
+                messagebox.showinfo("成功", f"模板 '{template_name}' 导入成功！")
+            except Exception as e:
+                messagebox.showerror("错误", f"导入模板包失败: {e}")
+        
+        Button(btn_frame, text="导入模板包", command=import_bundle, width=10).pack(side='left', padx=5)
+        
         # 关闭按钮
         Button(btn_frame, text="关闭", command=dialog.destroy, width=10).pack(side='right', padx=5)
         
@@ -616,16 +486,7 @@ class WatermarkOptions(Frame):
             use_custom_position = template.get('use_custom_position', False)
             custom_position = template.get('custom_position', None)
             
-            if use_custom_position and custom_position:
-                global_watermark_settings.use_custom_position = True
-                global_watermark_settings.custom_position = custom_position
-            else:
-                global_watermark_settings.use_custom_position = False
-                global_watermark_settings.custom_position = None
-            
-            # 清空缓存
-            self.processed_images_cache.clear()
-            self.last_settings_version = global_watermark_settings._version
+            global_watermark_settings.set_position_mode(use_custom_position, custom_position)
             
         finally:
             # 恢复回调
@@ -1,33 +1,177 @@
 import os
 import platform
 import json
+import hashlib
+from functools import lru_cache
+from collections import namedtuple
+from collections.abc import Mapping
+
+# 默认文本水印设置
+DEFAULT_TEXT_SETTINGS = {
+    'text': "Watermark",
+    'font_family': "Times New Roman",
+    'font_index': 0,  # 嵌入的字体文件为 .ttc 字体集时使用其中的第几个字体
+    'font_size': 36,
+    'bold': 0,
+    'italic': 0,
+    'color': "#FF0000",
+    'opacity': 50,
+    'shadow': 0,
+    'stroke': 0,
+    'stroke_width': 2,
+    'stroke_style': "native",  # native: FreeType描边; offset: 多方向偏移绘制
+    'position': "center"
+}
+
+# 加入 stroke_style 之前保存的设置和模板都是多方向偏移描边，读取时缺少该字段按 offset 处理，保持原来的渲染结果
+LEGACY_STROKE_STYLE = "offset"
+
+# 默认图片水印设置
+DEFAULT_IMAGE_SETTINGS = {
+    'image_path': '',
+    'scale_percent': 30,
+    'opacity': 50,
+    'position': "center"
+}
+
+
+class FrozenSettings(Mapping):
+    """只读的设置字典，可哈希、可序列化，用于在线程/进程之间传递设置"""
+    __slots__ = ('_data', '_hash')
+
+    def __init__(self, data=None):
+        self._data = dict(data or {})
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._data.items()))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenSettings):
+            return self._data == other._data
+        return NotImplemented
+
+    def __reduce__(self):
+        return (FrozenSettings, (self._data,))
+
+    def __repr__(self):
+        return f"FrozenSettings({self._data!r})"
+
+    def to_dict(self):
+        """返回可修改的普通字典副本"""
+        return dict(self._data)
+
+
+_SnapshotFields = namedtuple('_SnapshotFields', [
+    'watermark_type', 'text_settings', 'image_settings',
+    'use_custom_position', 'custom_position'
+])
+
+
+class WatermarkSnapshot(_SnapshotFields):
+    """水印设置的不可变快照 - 渲染引擎只依赖快照，不读取全局设置"""
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """从模板格式的字典创建快照，缺失的字段使用默认值（已保存的文本设置缺少 stroke_style 时为 offset）"""
+        text_settings = dict(DEFAULT_TEXT_SETTINGS)
+        if data.get('text_settings'):
+            text_settings.update(load_text_settings(data['text_settings']))
+        image_settings = dict(DEFAULT_IMAGE_SETTINGS)
+        image_settings.update(data.get('image_settings') or {})
+        custom_position = data.get('custom_position')
+        if custom_position is not None:
+            custom_position = tuple(custom_position)
+        return cls(
+            watermark_type=data.get('watermark_type', 'text'),
+            text_settings=FrozenSettings(text_settings),
+            image_settings=FrozenSettings(image_settings),
+            use_custom_position=bool(data.get('use_custom_position', False)),
+            custom_position=custom_position
+        )
+
+    def to_dict(self):
+        """转换为模板格式的字典"""
+        return {
+            'watermark_type': self.watermark_type,
+            'text_settings': self.text_settings.to_dict(),
+            'image_settings': self.image_settings.to_dict(),
+            'use_custom_position': self.use_custom_position,
+            'custom_position': list(self.custom_position) if self.custom_position is not None else None
+        }
+
+    @property
+    def active_custom_position(self):
+        """当前生效的自定义位置 (rel_x, rel_y)，未启用时为None"""
+        if self.use_custom_position and self.custom_position:
+            return self.custom_position
+        return None
+
+    @property
+    def digest(self):
+        """全部设置内容的稳定哈希（十六进制SHA-1），与进程和会话无关，可以写入磁盘或传给其他进程"""
+        return _snapshot_digest(self)
+
+    @property
+    def render_digest(self):
+        """只包含影响渲染结果的部分（当前水印类型的设置和生效的自定义位置）的哈希
+
+        切换到另一种水印类型时修改的设置不会改变它，适合作为渲染结果的缓存键。
+        """
+        return _render_digest(self)
+
+
+def load_text_settings(settings):
+    """读取已保存的文本设置（模板、请求中的设置等）：缺少 stroke_style 的旧设置使用 offset 描边"""
+    settings = dict(settings)
+    settings.setdefault('stroke_style', LEGACY_STROKE_STYLE)
+    return settings
+
+
+def content_digest(value):
+    """JSON可序列化数据的稳定哈希（键排序后的紧凑JSON的SHA-1）"""
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _snapshot_digest(snapshot):
+    return content_digest(snapshot.to_dict())
+
+
+@lru_cache(maxsize=256)
+def _render_digest(snapshot):
+    if snapshot.watermark_type == "text":
+        settings = snapshot.text_settings.to_dict()
+    else:
+        settings = snapshot.image_settings.to_dict()
+    custom_position = snapshot.active_custom_position
+    return content_digest([snapshot.watermark_type, settings,
+                           list(custom_position) if custom_position else None])
+
 
 class WatermarkSettings:
     """全局水印设置类"""
     def __init__(self):
         self.watermark_type = "text"
-        self.text_settings = {
-            'text': "Watermark",
-            'font_family': "Times New Roman",
-            'font_size': 36,
-            'bold': 0,
-            'italic': 0,
-            'color': "#FF0000",
-            'opacity': 50,
-            'shadow': 0,
-            'stroke': 0,
-            'stroke_width': 2,
-            'position': "center"
-        }
-        self.image_settings = {
-            'image_path': '',
-            'scale_percent': 30,
-            'opacity': 50,
-            'position': "center"
-        }
+        self.text_settings = dict(DEFAULT_TEXT_SETTINGS)
+        self.image_settings = dict(DEFAULT_IMAGE_SETTINGS)
         self.custom_position = None  # 自定义位置 (rel_x, rel_y)
         self.use_custom_position = False  # 是否使用自定义位置
         self._version = 0  # 添加版本号用于检测设置变化
+        self._snapshot = None  # (版本号, 快照)，设置没变时复用同一个快照
     
     def update_text_setting(self, key, value):
         """更新文本水印设置"""
@@ -54,6 +198,15 @@ class WatermarkSettings:
             self.use_custom_position = True
             self._version += 1
     
+    def set_position_mode(self, use_custom_position, custom_position=None):
+        """直接设置位置模式（应用模板时使用）"""
+        custom_position = tuple(custom_position) if use_custom_position and custom_position else None
+        use_custom_position = custom_position is not None
+        if (self.use_custom_position, self.custom_position) != (use_custom_position, custom_position):
+            self.use_custom_position = use_custom_position
+            self.custom_position = custom_position
+            self._version += 1
+    
     def set_preset_position(self, position):
         """设置预设位置并禁用自定义位置模式"""
         if self.watermark_type == "text":
@@ -67,5 +220,20 @@ class WatermarkSettings:
                 self.use_custom_position = False
                 self._version += 1
 
+    def snapshot(self):
+        """返回当前设置的不可变快照
+
+        修改设置只增加版本号，快照在第一次需要时才生成，版本号不变时直接复用。
+        """
+        if self._snapshot is None or self._snapshot[0] != self._version:
+            self._snapshot = (self._version, WatermarkSnapshot.from_dict({
+                'watermark_type': self.watermark_type,
+                'text_settings': self.text_settings,
+                'image_settings': self.image_settings,
+                'use_custom_position': self.use_custom_position,
+                'custom_position': self.custom_position
+            }))
+        return self._snapshot[1]
+
 # 创建全局水印设置实例
 global_watermark_settings = WatermarkSettings()
\ No newline at end of file
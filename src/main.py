@@ -1,8 +1,14 @@
-from tkinterdnd2 import TkinterDnD
-from tkinter import Label
-from component.image_uploader import ImageUploader
+import sys
+import multiprocessing
 
-def main():
+def run_gui():
+    # Tk 只在图形界面模式下导入，命令行模式可以在没有显示器的环境中运行
+    from tkinterdnd2 import TkinterDnD
+    from component.image_uploader import ImageUploader
+    from component.template_manager import configure_storage
+
+    # 渲染计划和从模板包导入的资源保存在模板库旁边
+    configure_storage()
     root = TkinterDnD.Tk()
     root.title("Watermark App")
     # root.attributes('-fullscreen', True)
@@ -12,5 +18,16 @@ def main():
     uploader.pack(fill='both', expand=True)
     root.mainloop()
 
+def main(argv=None):
+    """不带参数时打开图形界面，否则按命令行模式运行（如 watermark-app batch ...）"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        from component.cli import main as cli_main
+        return cli_main(argv)
+    run_gui()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 打包后的程序需要它来正确启动并行导出的工作进程
+    multiprocessing.freeze_support()
+    sys.exit(main())
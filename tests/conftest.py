@@ -0,0 +1,31 @@
+"""测试使用 src 下的 component 包（与 src/main.py 相同的导入方式），以及导出测试共用的输入图片和导出选项"""
+import os
+import sys
+import pytest
+from PIL import Image
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """三张不同颜色的输入图片"""
+    source_dir = tmp_path / "in"
+    source_dir.mkdir()
+    paths = []
+    for i in range(3):
+        path = source_dir / f"photo{i}.png"
+        Image.new("RGB", (120, 90), (40 * i, 80, 160)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def options(tmp_path):
+    """导出到空的输出文件夹，其他选项为默认值"""
+    from component.export_engine import ExportOptions
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    return ExportOptions(str(output_dir))
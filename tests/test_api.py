@@ -0,0 +1,60 @@
+"""流式接口：线程池和进程池（spawn 启动的工作进程）对使用资源引用的模板得到相同的结果"""
+import io
+import multiprocessing
+import pytest
+from PIL import Image
+from component.api import watermark_stream
+from component.asset_store import global_asset_store
+from component.render_plan import global_plan_cache
+from component.template_bundle import build_bundle, TemplateBundle
+
+
+@pytest.fixture
+def logo_data():
+    buffer = io.BytesIO()
+    Image.new("RGBA", (60, 30), (255, 200, 0, 180)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def memory_only_storage(monkeypatch):
+    """没有渲染计划和资源目录：资源只在当前进程的内存中"""
+    monkeypatch.setattr(global_asset_store, 'directory', None)
+    monkeypatch.setattr(global_plan_cache, 'directory', None)
+
+
+def image_template(image_path):
+    return {'watermark_type': "image",
+            'image_settings': {'image_path': image_path, 'scale_percent': 100, 'opacity': 80, 'position': "center"}}
+
+
+def stream_images(template, **kwargs):
+    sources = [Image.new("RGB", (200, 150), (20 * i, 40, 90)) for i in range(4)]
+    return list(watermark_stream(sources, template=template, workers=2, **kwargs))
+
+
+def assert_same_results(results, expected):
+    assert [result.error for result in results] == [None] * len(expected)
+    assert [result.image.tobytes() for result in results] == [result.image.tobytes() for result in expected]
+
+
+def test_process_mode_with_in_memory_bundle_assets(tmp_path, logo_data, memory_only_storage):
+    logo_path = tmp_path / "logo.png"
+    logo_path.write_bytes(logo_data)
+    bundle = build_bundle("logo", image_template(str(logo_path)))
+    logo_path.unlink()
+    assert isinstance(bundle, TemplateBundle)
+
+    expected = stream_images(bundle)
+    results = stream_images(bundle, use_processes=True, mp_context=multiprocessing.get_context("spawn"))
+    assert_same_results(results, expected)
+
+
+def test_process_mode_with_assets_in_the_asset_directory(tmp_path, logo_data, monkeypatch):
+    monkeypatch.setattr(global_plan_cache, 'directory', None)
+    monkeypatch.setattr(global_asset_store, 'directory', str(tmp_path / "assets"))
+    template = image_template(global_asset_store.add(logo_data))
+
+    expected = stream_images(template)
+    results = stream_images(template, use_processes=True, mp_context=multiprocessing.get_context("spawn"))
+    assert_same_results(results, expected)
@@ -0,0 +1,97 @@
+"""任务日志：崩溃或中断后从日志继续导出，已完成的图片不再处理，失败的图片可以重试"""
+import os
+import json
+import pytest
+from component.watermark_settings import WatermarkSnapshot
+from component.export_engine import export_batch, resume_export, plan_output_paths, export_image, ExportTask
+from component.export_journal import ExportJournal, has_journal, journal_path
+from component.export_pipeline import temp_output_path
+
+
+def snapshot_with_text(text):
+    return WatermarkSnapshot.from_dict({'watermark_type': "text", 'text_settings': {'text': text}})
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+def test_resume_after_crash_in_the_middle_of_a_batch(sources, options, tmp_path, monkeypatch):
+    snapshot = snapshot_with_text("A")
+
+    def crash_after_first(done, total, task, error):
+        raise SimulatedCrash()
+
+    with pytest.raises(SimulatedCrash):
+        export_batch(sources, snapshot, options, workers=1, progress_callback=crash_after_first)
+    assert has_journal(options.output_dir)
+
+    # 从其他工作目录继续
+    monkeypatch.chdir(tmp_path)
+    result = resume_export(options.output_dir, workers=1)
+    assert len(result.skipped) == 1
+    assert len(result.succeeded) == 2 and not result.failed
+    assert not has_journal(options.output_dir)
+    assert len([name for name in os.listdir(options.output_dir) if name.endswith(".png")]) == 3
+
+
+def test_resume_ignores_torn_journal_line_and_leftover_temp_file(sources, options):
+    snapshot = snapshot_with_text("A")
+    output_paths = plan_output_paths(sources, options)
+    tasks = [ExportTask(i, source, output) for i, (source, output) in enumerate(zip(sources, output_paths))]
+
+    # 模拟进程在第二张图片编码时被杀死：第一张已完成，日志最后一行只写了一半，留下临时文件
+    journal = ExportJournal.create(snapshot, options, tasks)
+    export_image(tasks[0].source_path, tasks[0].output_path, snapshot, options)
+    journal.record(tasks[0], None)
+    journal._file.write('{"type": "done", "ind')
+    journal.close(finished=False)
+    temp_path = temp_output_path(tasks[1].output_path)
+    with open(temp_path, 'wb') as f:
+        f.write(b"partial")
+
+    result = resume_export(options.output_dir, workers=1)
+    assert result.skipped == [(tasks[0].source_path, tasks[0].output_path)]
+    assert sorted(result.succeeded) == [(task.source_path, task.output_path) for task in tasks[1:]]
+    assert not os.path.exists(temp_path)
+    assert not has_journal(options.output_dir)
+
+
+def test_failed_images_keep_the_journal_and_are_retried(sources, options):
+    snapshot = snapshot_with_text("A")
+    missing = sources[0] + ".moved"
+    os.rename(sources[0], missing)
+    result = export_batch(sources, snapshot, options, workers=1)
+    assert [source for source, _ in result.failed] == [sources[0]]
+    assert has_journal(options.output_dir)
+
+    # 不重试失败的图片时日志保留
+    skipped = resume_export(options.output_dir, workers=1, retry_failed=False)
+    assert skipped.succeeded == [] and skipped.failed == []
+    assert has_journal(options.output_dir)
+
+    os.rename(missing, sources[0])
+    retried = resume_export(options.output_dir, workers=1)
+    assert [source for source, _ in retried.succeeded] == [sources[0]]
+    assert not has_journal(options.output_dir)
+
+
+def test_journal_stores_absolute_paths(sources, options, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    relative_options = options._replace(output_dir="out")
+    relative_sources = [os.path.relpath(path) for path in sources]
+    os.rename(relative_sources[0], relative_sources[0] + ".moved")
+    export_batch(relative_sources, snapshot_with_text("A"), relative_options, workers=1)
+
+    with open(journal_path(options.output_dir), 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+    assert os.path.isabs(header['options']['output_dir'])
+    assert all(os.path.isabs(source) and os.path.isabs(output) for source, output in header['tasks'])
+
+
+def test_render_failure_counts_as_failed_export(sources, options, tmp_path):
+    snapshot = WatermarkSnapshot.from_dict({'watermark_type': "image", 'image_settings': {
+        'image_path': str(tmp_path / "missing_logo.png")}})
+    result = export_batch(sources, snapshot, options, workers=1)
+    assert result.succeeded == [] and len(result.failed) == 3
+    assert not [name for name in os.listdir(options.output_dir) if name.endswith(".png")]
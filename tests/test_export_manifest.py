@@ -0,0 +1,50 @@
+"""增量导出：导出清单让没有变化的图片被跳过，源文件、输出文件、设置或选项变化后重新导出"""
+import os
+from PIL import Image
+from component.watermark_settings import WatermarkSnapshot
+from component.export_engine import export_batch
+
+
+def snapshot_with_text(text):
+    return WatermarkSnapshot.from_dict({'watermark_type': "text", 'text_settings': {'text': text}})
+
+
+def test_incremental_export_skips_unchanged_images(sources, options):
+    snapshot = snapshot_with_text("A")
+    first = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    assert len(first.succeeded) == 3 and not first.failed
+
+    second = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    assert second.succeeded == []
+    assert sorted(source for source, _ in second.skipped) == sorted(sources)
+
+
+def test_incremental_export_redoes_images_after_changes(sources, options):
+    snapshot = snapshot_with_text("A")
+    first = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    outputs = dict(first.succeeded)
+
+    # 源文件内容变化：只有这一张重新导出，并覆盖上次的输出文件
+    Image.new("RGB", (120, 90), (255, 0, 0)).save(sources[1])
+    changed = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    assert changed.succeeded == [(sources[1], outputs[sources[1]])]
+    assert len(changed.skipped) == 2
+
+    # 只修改了时间、内容没变：按哈希判断为没有变化
+    os.utime(sources[0], (1, 1))
+    touched = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    assert touched.succeeded == [] and len(touched.skipped) == 3
+
+    # 输出文件被删除
+    os.remove(outputs[sources[2]])
+    deleted = export_batch(sources, snapshot, options, workers=1, incremental=True)
+    assert deleted.succeeded == [(sources[2], outputs[sources[2]])]
+
+    # 水印设置或导出选项变化：全部重新导出
+    resettled = export_batch(sources, snapshot_with_text("B"), options, workers=1, incremental=True)
+    assert len(resettled.succeeded) == 3
+    rescaled = export_batch(sources, snapshot_with_text("B"), options._replace(scale_percent=50),
+                            workers=1, incremental=True)
+    assert len(rescaled.succeeded) == 3
+    assert sorted(os.listdir(options.output_dir)) == sorted(
+        [os.path.basename(path) for path in outputs.values()] + [".watermark_manifest.json"])
@@ -0,0 +1,78 @@
+"""HTTP服务只能读取 --allow-path 目录中的文件（path 参数和内联设置中的路径）"""
+import io
+import json
+import pytest
+from PIL import Image
+
+pytest.importorskip("flask")
+from component.http_service import create_app, WatermarkService
+
+
+@pytest.fixture
+def allowed_dir(tmp_path):
+    directory = tmp_path / "allowed"
+    directory.mkdir()
+    Image.new("RGB", (80, 60), (0, 0, 255)).save(directory / "photo.png")
+    Image.new("RGBA", (40, 20), (255, 255, 0, 255)).save(directory / "logo.png")
+    return directory
+
+
+@pytest.fixture
+def secret_dir(tmp_path):
+    directory = tmp_path / "secret"
+    directory.mkdir()
+    Image.new("RGB", (80, 60)).save(directory / "private.png")
+    return directory
+
+
+@pytest.fixture
+def client(tmp_path, allowed_dir):
+    service = WatermarkService(templates_file=str(tmp_path / "templates.json"), workers=1,
+                               allowed_roots=[str(allowed_dir)])
+    try:
+        yield create_app(service).test_client()
+    finally:
+        service.shutdown()
+
+
+def _png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (50, 50), (10, 200, 10)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def image_settings(path):
+    return json.dumps({'watermark_type': "image", 'image_settings': {'image_path': str(path)}})
+
+
+def test_path_inside_allowed_directory_is_served(client, allowed_dir):
+    response = client.post('/watermark', data={'path': str(allowed_dir / "photo.png")})
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.data)).size == (80, 60)
+
+
+def test_path_outside_allowed_directories_is_forbidden(client, allowed_dir, secret_dir):
+    response = client.post('/watermark', data={'path': str(secret_dir / "private.png")})
+    assert response.status_code == 403
+    traversal = str(allowed_dir / ".." / "secret" / "private.png")
+    assert client.post('/watermark', data={'path': traversal}).status_code == 403
+
+
+def test_inline_settings_cannot_read_files_outside_allowed_directories(client, allowed_dir, secret_dir):
+    upload = {'image': (io.BytesIO(_png_bytes()), "upload.png")}
+    response = client.post('/watermark', data=dict(upload, settings=image_settings(secret_dir / "private.png")))
+    assert response.status_code == 403
+
+    font_settings = json.dumps({'text_settings': {'font_family': str(secret_dir / "font.ttf")}})
+    upload = {'image': (io.BytesIO(_png_bytes()), "upload.png")}
+    assert client.post('/watermark', data=dict(upload, settings=font_settings)).status_code == 403
+
+    upload = {'image': (io.BytesIO(_png_bytes()), "upload.png")}
+    response = client.post('/watermark', data=dict(upload, settings=image_settings(allowed_dir / "logo.png")))
+    assert response.status_code == 200
+
+
+def test_malformed_asset_reference_is_rejected(client):
+    upload = {'image': (io.BytesIO(_png_bytes()), "upload.png")}
+    response = client.post('/watermark', data=dict(upload, settings=image_settings("asset:../../etc/passwd")))
+    assert response.status_code == 400
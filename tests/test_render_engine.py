@@ -0,0 +1,202 @@
+"""渲染引擎与原来界面中的水印绘制（整幅图层）逐像素一致"""
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+from component.watermark_settings import WatermarkSnapshot
+from component.render_plan import RenderPlan
+from component.render_engine import (render_watermark, font_from_settings, font_size_from_settings,
+                                     measure_text, hex_to_rgba, get_preset_position, get_custom_position,
+                                     fit_logo_size, get_text_sprite, text_overlay, PRESET_POSITIONS, MARGIN)
+
+
+def legacy_text_render(image, snapshot):
+    """旧的文本水印：在与原图同样大的透明图层上绘制，再整幅 alpha 混合"""
+    text_settings = snapshot.text_settings
+    text = text_settings['text']
+    if not text.strip():
+        return image
+    watermark = Image.new("RGBA", image.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(watermark)
+    font_size = font_size_from_settings(text_settings)
+    font = font_from_settings(text_settings)
+    text_size = measure_text(draw, text, font, font_size)
+    if snapshot.active_custom_position:
+        x, y = get_custom_position(snapshot.active_custom_position, image.size, text_size)
+    else:
+        x, y = get_preset_position(text_settings['position'], image.size, text_size, MARGIN)
+    fill_color = hex_to_rgba(text_settings['color'], int(255 * text_settings['opacity'] / 100))
+
+    if text_settings['stroke']:
+        stroke_width = text_settings['stroke_width']
+        for dx in [-stroke_width, 0, stroke_width]:
+            for dy in [-stroke_width, 0, stroke_width]:
+                if dx != 0 or dy != 0:
+                    draw.text((x + dx, y + dy), text, font=font, fill=(0, 0, 0, fill_color[3]))
+        draw.text((x, y), text, font=font, fill=fill_color)
+    elif text_settings['shadow']:
+        draw.text((x + 2, y + 2), text, font=font, fill=(0, 0, 0, fill_color[3] // 2))
+        draw.text((x, y), text, font=font, fill=fill_color)
+    else:
+        draw.text((x, y), text, font=font, fill=fill_color)
+    return Image.alpha_composite(image.convert("RGBA"), watermark)
+
+
+def legacy_image_render(image, snapshot):
+    """旧的图片水印：每次重新读取、缩放水印图片并逐像素调整透明度"""
+    image_settings = snapshot.image_settings
+    watermark = Image.open(image_settings['image_path']).convert("RGBA")
+    new_size = fit_logo_size(watermark.size, image.size, image_settings['scale_percent'])
+    watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
+    opacity = image_settings['opacity'] / 100.0
+    if opacity < 1.0:
+        watermark.putalpha(watermark.split()[3].point(lambda p: p * opacity))
+    if snapshot.active_custom_position:
+        position = get_custom_position(snapshot.active_custom_position, image.size, new_size)
+    else:
+        position = get_preset_position(image_settings['position'], image.size, new_size, MARGIN)
+    result = image.convert("RGBA")
+    result.paste(watermark, position, watermark)
+    return result
+
+
+def assert_same_pixels(a, b):
+    assert a.mode == b.mode
+    assert a.size == b.size
+    # RGBA 图片的 getbbox 只看 alpha 通道，直接比较像素数据
+    assert a.tobytes() == b.tobytes()
+
+
+def text_snapshot(custom_position=None, **text_settings):
+    # 没有安装 DejaVu 字体的机器上两边都使用默认字体，比较同样有效
+    settings = {'text': "Watermark 水印", 'font_family': "DejaVu Sans", 'font_size': 40, 'stroke_style': "offset"}
+    settings.update(text_settings)
+    return WatermarkSnapshot.from_dict({'watermark_type': "text", 'text_settings': settings,
+                                        'use_custom_position': custom_position is not None,
+                                        'custom_position': custom_position})
+
+
+@pytest.fixture
+def logo_path(tmp_path):
+    logo = Image.new("RGBA", (300, 120), (0, 128, 255, 200))
+    ImageDraw.Draw(logo).ellipse((20, 10, 280, 110), fill=(255, 255, 0, 255))
+    path = tmp_path / "logo.png"
+    logo.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("position", PRESET_POSITIONS)
+@pytest.mark.parametrize("style", [{}, {'shadow': 1}, {'stroke': 1, 'stroke_width': 3}])
+def test_text_watermark_matches_legacy(position, style):
+    image = Image.new("RGB", (640, 480), (30, 120, 60))
+    snapshot = text_snapshot(position=position, opacity=70, **style)
+    assert_same_pixels(render_watermark(image.copy(), snapshot), legacy_text_render(image, snapshot))
+
+
+@pytest.mark.parametrize("custom_position", [(0.5, 0.5), (0.0, 0.0), (0.99, 0.98)])
+def test_text_watermark_matches_legacy_at_custom_and_clipped_positions(custom_position):
+    # 靠近边缘时图层有一部分超出图片，需要裁剪
+    image = Image.new("RGB", (300, 200), (200, 200, 200))
+    snapshot = text_snapshot(custom_position, font_size=90, stroke=1, stroke_width=6, color="#4126f3")
+    assert_same_pixels(render_watermark(image.copy(), snapshot), legacy_text_render(image, snapshot))
+
+
+def test_empty_text_leaves_image_unchanged():
+    image = Image.new("RGB", (100, 80), (1, 2, 3))
+    assert render_watermark(image, text_snapshot(text="   ")) is image
+
+
+@pytest.mark.parametrize("size", [(640, 480), (300, 900), (50, 40)])
+@pytest.mark.parametrize("opacity", [20, 100])
+def test_image_watermark_matches_legacy(logo_path, size, opacity):
+    image = Image.new("RGB", size, (90, 10, 10))
+    snapshot = WatermarkSnapshot.from_dict({'watermark_type': "image", 'image_settings': {
+        'image_path': logo_path, 'scale_percent': 137, 'opacity': opacity, 'position': "bottom-right"}})
+    assert_same_pixels(render_watermark(image.copy(), snapshot), legacy_image_render(image, snapshot))
+
+
+def test_text_sprite_is_tight_and_cached():
+    # 文本只栅格化一次，图层大小与文本相当而不是整幅图片
+    snapshot = text_snapshot(stroke=1, stroke_width=4)
+    sprite = get_text_sprite(snapshot.text_settings)
+    assert get_text_sprite(snapshot.text_settings) is sprite
+    image_size = (4000, 3000)
+    layer, (x, y) = text_overlay(snapshot.text_settings, image_size)
+    assert layer is sprite.image
+    assert layer.width < 1000 and layer.height < 200
+    assert 0 <= x and x + layer.width <= image_size[0]
+
+
+def test_only_the_sprite_region_is_blended():
+    image = Image.new("RGB", (800, 600), (12, 34, 56))
+    snapshot = text_snapshot(position="top-left")
+    layer, (x, y) = text_overlay(snapshot.text_settings, image.size)
+    result = render_watermark(image.copy(), snapshot)
+    diff_box = ImageChops.difference(result.convert("RGB"), image).getbbox()
+    assert diff_box is not None
+    left, top, right, bottom = diff_box
+    assert x <= left and y <= top and right <= x + layer.width and bottom <= y + layer.height
+
+
+
+def legacy_native_stroke_render(image, snapshot):
+    """FreeType 描边在整幅图层上一次绘制的结果"""
+    text_settings = snapshot.text_settings
+    watermark = Image.new("RGBA", image.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(watermark)
+    font = font_from_settings(text_settings)
+    text = text_settings['text']
+    text_size = measure_text(draw, text, font, font_size_from_settings(text_settings))
+    position = get_preset_position(text_settings['position'], image.size, text_size, MARGIN)
+    fill_color = hex_to_rgba(text_settings['color'], int(255 * text_settings['opacity'] / 100))
+    draw.text(position, text, font=font, fill=fill_color,
+              stroke_width=text_settings['stroke_width'], stroke_fill=(0, 0, 0, fill_color[3]))
+    return Image.alpha_composite(image.convert("RGBA"), watermark)
+
+
+@pytest.mark.parametrize("stroke_width", [1, 3, 8])
+def test_native_stroke_matches_single_pass_drawing(stroke_width):
+    image = Image.new("RGB", (640, 480), (250, 250, 250))
+    snapshot = text_snapshot(stroke=1, stroke_width=stroke_width, stroke_style="native", position="bottom")
+    assert_same_pixels(render_watermark(image.copy(), snapshot), legacy_native_stroke_render(image, snapshot))
+
+
+def test_saved_settings_without_stroke_style_keep_offset_stroke():
+    # 加入 stroke_style 之前保存的模板仍然按原来的方式渲染；新设置默认使用 FreeType 描边
+    saved = {'watermark_type': "text", 'text_settings': {
+        'text': "Watermark", 'font_family': "DejaVu Sans", 'font_size': 40, 'stroke': 1, 'stroke_width': 3}}
+    snapshot = WatermarkSnapshot.from_dict(saved)
+    assert snapshot.text_settings['stroke_style'] == "offset"
+    image = Image.new("RGB", (400, 300), (0, 90, 0))
+    assert_same_pixels(render_watermark(image.copy(), snapshot), legacy_text_render(image, snapshot))
+    assert WatermarkSnapshot.from_dict({}).text_settings['stroke_style'] == "native"
+
+
+def test_in_place_render_matches_copy():
+    image = Image.new("RGBA", (400, 300), (10, 20, 30, 255))
+    snapshot = text_snapshot(shadow=1)
+    expected = render_watermark(image.copy(), snapshot)
+    target = image.copy()
+    result = render_watermark(target, snapshot, in_place=True)
+    assert result is target
+    assert_same_pixels(result, expected)
+
+
+def test_strict_render_raises_for_missing_logo(tmp_path):
+    # 界面预览出错时显示原图，导出（strict）时计为失败
+    snapshot = WatermarkSnapshot.from_dict({'watermark_type': "image", 'image_settings': {
+        'image_path': str(tmp_path / "missing.png")}})
+    image = Image.new("RGB", (100, 100))
+    assert render_watermark(image, snapshot) is image
+    with pytest.raises(Exception):
+        render_watermark(image, snapshot, strict=True)
+
+
+def test_installed_render_plan_matches_fresh_render():
+    # 从渲染计划（磁盘格式）恢复的文本图层与直接栅格化的结果一致
+    image = Image.new("RGB", (500, 400), (240, 240, 240))
+    snapshot = text_snapshot(stroke=1, stroke_width=2, position="top-left")
+    expected = render_watermark(image.copy(), snapshot)
+
+    plan = RenderPlan.compile(snapshot)
+    restored = RenderPlan.from_dict(plan.to_dict(), snapshot.text_settings, plan.pixels().tobytes())
+    restored.install()
+    assert_same_pixels(render_watermark(image.copy(), snapshot), expected)
@@ -0,0 +1,90 @@
+"""分片任务的租约：同一时刻只有一个持有者，过期后可以被接手，原持有者不会再改动新租约"""
+import os
+import time
+import pytest
+from PIL import Image
+from component.watermark_settings import WatermarkSnapshot
+from component.export_engine import ExportOptions
+from component.shard_jobs import create_job, ShardJob, LeaseLost, run_worker, process_shard
+
+LEASE_TIMEOUT = 60
+
+
+@pytest.fixture
+def job(tmp_path):
+    source_dir = tmp_path / "in"
+    source_dir.mkdir()
+    sources = []
+    for i in range(5):
+        path = source_dir / f"photo{i}.png"
+        Image.new("RGB", (64, 48), (i * 50, 0, 0)).save(path)
+        sources.append(str(path))
+    snapshot = WatermarkSnapshot.from_dict({'text_settings': {'text': "shard"}})
+    create_job(str(tmp_path / "job"), sources, snapshot, ExportOptions(str(tmp_path / "out")), shard_size=2)
+    return ShardJob(str(tmp_path / "job"))
+
+
+def expire_lease(job, index):
+    """把租约的修改时间改到超时之前，模拟持有者已经停止续约"""
+    old = time.time() - 2 * LEASE_TIMEOUT
+    os.utime(job.lease_path(index), (old, old))
+
+
+def test_only_one_worker_can_claim_a_shard(job):
+    token = job.try_claim(0, "worker-a", LEASE_TIMEOUT)
+    assert token is not None
+    assert job.try_claim(0, "worker-b", LEASE_TIMEOUT) is None
+    assert job.read_lease(0)['worker'] == "worker-a"
+
+    job.renew(0, token)
+    assert job.release(0, token)
+    assert not os.path.exists(job.lease_path(0))
+
+
+def test_expired_lease_is_taken_over(job):
+    old_token = job.try_claim(0, "worker-a", LEASE_TIMEOUT)
+    assert job.status(LEASE_TIMEOUT)['leased'] == 1
+    expire_lease(job, 0)
+    assert job.status(LEASE_TIMEOUT)['expired'] == 1
+
+    new_token = job.try_claim(0, "worker-b", LEASE_TIMEOUT)
+    assert new_token is not None and new_token != old_token
+    assert job.read_lease(0)['worker'] == "worker-b"
+    assert job.try_claim(0, "worker-c", LEASE_TIMEOUT) is None
+
+
+def test_previous_owner_cannot_renew_or_release_a_taken_over_lease(job):
+    old_token = job.try_claim(0, "worker-a", LEASE_TIMEOUT)
+    expire_lease(job, 0)
+    new_token = job.try_claim(0, "worker-b", LEASE_TIMEOUT)
+
+    with pytest.raises(LeaseLost):
+        job.renew(0, old_token)
+    assert not job.release(0, old_token)
+    assert job.owns_lease(0, new_token)
+
+
+def test_process_shard_drops_results_when_lease_was_taken_over(job):
+    old_token = job.try_claim(0, "worker-a", LEASE_TIMEOUT)
+    expire_lease(job, 0)
+    new_token = job.try_claim(0, "worker-b", LEASE_TIMEOUT)
+
+    assert not process_shard(job, 0, "worker-a", old_token, workers=1, lease_timeout=LEASE_TIMEOUT)
+    assert not job.is_done(0)
+    assert job.owns_lease(0, new_token)
+
+
+def test_done_shard_cannot_be_claimed(job):
+    token = job.try_claim(0, "worker-a", LEASE_TIMEOUT)
+    assert process_shard(job, 0, "worker-a", token, workers=1, lease_timeout=LEASE_TIMEOUT)
+    assert job.is_done(0)
+    assert not os.path.exists(job.lease_path(0))
+    assert job.try_claim(0, "worker-b", LEASE_TIMEOUT) is None
+
+
+def test_worker_processes_all_shards(job):
+    assert run_worker(job.job_dir, "worker-a", workers=1, lease_timeout=LEASE_TIMEOUT) == job.shard_count
+    status = job.status(LEASE_TIMEOUT)
+    assert status['done'] == job.shard_count
+    assert status['succeeded'] == 5 and status['failed'] == 0
+    assert len(job.collect_results().succeeded) == 5